@@ -6,13 +6,19 @@ import webrtcvad
 import numpy as np
 import logging
 from common_logging import setup_logging
+from audio_recorder import AudioRecorder
+from vad_utils import contains_speech, update_speech_count
+import metrics
 import os
+import json
+import time
 import asyncio
+from collections import deque
 from pydub import AudioSegment
 import io
 
 class AudioCapture:
-    def __init__(self, config, debug_to_console=False):
+    def __init__(self, config, debug_to_console=False, device_name=None, remember_device=True, record=True):
         self.chunk = config.chunk
         self.format = pyaudio.paInt16
         self.channels = config.channels
@@ -22,14 +28,43 @@ class AudioCapture:
         self.chunk = int(self.rate * self.frame_duration_ms / 1000)  # Frames per buffer
         self.p = pyaudio.PyAudio()
         self.stream = None
-        self.vad = webrtcvad.Vad(1)  # Aggressiveness level from 0 to 3
+        self.vad = webrtcvad.Vad(config.vad_aggressiveness)  # Aggressiveness level from 0 to 3
         self.device_index = config.speaker_device_index  # Use speaker device index from config
+        self.input_device_name = device_name or config.input_device_name
+        # Only the primary capture remembers its device; extra sources are always picked by name
+        self.remember_device = remember_device
+        self.use_saved_device = config.use_saved_device and remember_device
+        self.device_settings_path = config.device_settings_path
+        self._devices = None  # Cached PortAudio device enumeration
         self.logger = logging.getLogger('audio_capture')
 
         # Speech detection parameters
         frames_per_second = 1000 / self.frame_duration_ms
         self.speech_frames_threshold = int(0.1 * frames_per_second)  # Reduced from 0.5 to 0.3 seconds
         self.speech_frames_count = 0
+        self.last_frame_is_speech = False  # Raw VAD decision for the latest chunk, before smoothing
+        # Pausing closes this gate instead of the stream, so resuming never reopens the device
+        self.gate_open = True
+
+        # The PortAudio callback thread fills a bounded queue of chunk-sized frames for read_audio
+        self.frames = deque()
+        self.frames_per_buffer = self.chunk
+        self.max_queue_depth = config.capture_queue_depth
+        self.queue_depth_limit = config.capture_queue_max_depth
+        self.max_frames_per_buffer = self.chunk * config.capture_max_buffer_chunks
+        self.adapt_window_seconds = config.capture_adapt_window_seconds
+        self.adapt_loss_events = config.capture_adapt_loss_events
+        self._loop = None
+        self._frame_ready = None
+        self._next_adc_time = None
+        self._unreported_losses = deque(maxlen=256)  # Filled on the callback thread, logged from the loop
+        self._recent_losses = deque()
+        self._reopen_task = None
+        # Optional tap that hands every frame read to a background writer thread
+        self.recorder = (AudioRecorder(config, self.rate, self.bytes_per_sample)
+                         if config.recording_enabled and record else None)
+        self.capture_stats = {'frames_read': 0, 'overruns': 0, 'gaps': 0, 'gap_ms': 0.0,
+                              'dropped_frames': 0, 'adaptations': 0}
 
         # self.setup_logging(debug_to_console)
         self.logger = setup_logging('audio_capture')
@@ -37,15 +72,66 @@ class AudioCapture:
         self.logger.info(f"Speech frames threshold set to {self.speech_frames_threshold} frames")
 
 
-    def select_audio_device(self, is_speaker=False):
+    def list_devices(self, refresh=False):
+        if self._devices is None or refresh:
+            self._devices = [self.p.get_device_info_by_index(i) for i in range(self.p.get_device_count())]
+        return self._devices
+
+    def find_input_device(self, name, index_hint=None):
+        # Indices shift when devices come and go, so the name is authoritative and the index only a hint
+        if index_hint is not None:
+            try:
+                dev = self.p.get_device_info_by_index(index_hint)
+                if dev.get('name') == name and dev.get('maxInputChannels') > 0:
+                    return index_hint
+            except (IOError, OSError, ValueError):
+                pass
+        for dev in self.list_devices():
+            if dev.get('maxInputChannels') > 0 and (dev.get('name') == name or name.lower() in dev.get('name').lower()):
+                return dev.get('index')
+        return None
+
+    def load_saved_device(self):
+        try:
+            with open(self.device_settings_path) as f:
+                saved = json.load(f).get('input_device')
+        except (OSError, ValueError):
+            return None
+        if not saved:
+            return None
+        device_index = self.find_input_device(saved['name'], saved.get('index'))
+        if device_index is None:
+            self.logger.warning(f"Saved audio device '{saved['name']}' not found")
+        return device_index
+
+    def save_device(self, device_index, name):
+        try:
+            with open(self.device_settings_path, 'w') as f:
+                json.dump({'input_device': {'name': name, 'index': device_index}}, f, indent=2)
+            self.logger.info(f"Saved audio device '{name}' to {self.device_settings_path}")
+        except OSError as e:
+            self.logger.error(f"Could not save audio device selection: {e}")
+
+    def select_audio_device(self, is_speaker=False, prompt=False):
         self.logger.info("Selecting audio device")
+        if not is_speaker and not prompt:
+            if self.input_device_name:
+                device_index = self.find_input_device(self.input_device_name)
+            elif self.use_saved_device:
+                device_index = self.load_saved_device()
+            else:
+                device_index = None
+            if device_index is not None:
+                self.device_index = device_index
+                self.logger.info(f"Audio device selected without prompting: {device_index}")
+                return self.device_index
+
         print("Available audio devices:")
         devices = []
-        for i in range(self.p.get_device_count()):
-            dev = self.p.get_device_info_by_index(i)
+        for dev in self.list_devices():
             if (is_speaker and dev.get('maxOutputChannels') > 0) or (not is_speaker and dev.get('maxInputChannels') > 0):
-                devices.append((i, dev.get('name')))
-                print(f"Device {i}: {dev.get('name')}")
+                devices.append((dev.get('index'), dev.get('name')))
+                print(f"Device {dev.get('index')}: {dev.get('name')}")
         
         while True:
             try:
@@ -55,6 +141,8 @@ class AudioCapture:
                 if (is_speaker and dev_info.get('maxOutputChannels') > 0) or (not is_speaker and dev_info.get('maxInputChannels') > 0):
                     print(f"Selected device: {dev_info.get('name')}")
                     self.logger.info(f"Audio device selected: {dev_info.get('name')}")
+                    if not is_speaker and self.remember_device:
+                        self.save_device(self.device_index, dev_info.get('name'))
                     return self.device_index
                 else:
                     print("Selected device is not a valid device. Please try again.")
@@ -67,13 +155,10 @@ class AudioCapture:
             self.select_audio_device()
         try:
             if self.stream is None:
-                self.stream = self.p.open(format=self.format,
-                                          channels=self.channels,
-                                          rate=self.rate,
-                                          input=True,
-                                          input_device_index=self.device_index,
-                                          frames_per_buffer=self.chunk)
-                self.logger.info(f"Audio stream started for device {self.device_index} with rate {self.rate} and chunk size {self.chunk}")
+                self.stream = self._open_stream()
+                self._next_adc_time = None
+                self.logger.info(f"Audio stream started for device {self.device_index} with rate {self.rate}, "
+                                 f"chunk size {self.chunk} and {self.frames_per_buffer} frames per buffer")
             else:
                 self.logger.info("Audio stream already started")
         except OSError as e:
@@ -82,17 +167,156 @@ class AudioCapture:
             print("Please ensure the selected device is not in use by another application.")
             raise
 
+    def _open_stream(self):
+        return self.p.open(format=self.format,
+                           channels=self.channels,
+                           rate=self.rate,
+                           input=True,
+                           input_device_index=self.device_index,
+                           frames_per_buffer=self.frames_per_buffer,
+                           stream_callback=self._on_audio)
+
+    def _on_audio(self, in_data, frame_count, time_info, status_flags):
+        # Runs on the PortAudio thread: bookkeeping and a queue append only, no logging or I/O
+        if status_flags & pyaudio.paInputOverflow:
+            self._record_loss('overrun', frame_count)
+        adc_time = time_info.get('input_buffer_adc_time', 0) if time_info else 0
+        if adc_time:  # Some host APIs do not report stream time
+            if self._next_adc_time is not None:
+                gap = adc_time - self._next_adc_time
+                if gap > frame_count / self.rate / 2:
+                    self._record_loss('gap', int(gap * self.rate))
+            self._next_adc_time = adc_time + frame_count / self.rate
+
+        if self.gate_open:
+            frame_bytes = self.bytes_per_sample * self.channels
+            chunk_bytes = self.chunk * frame_bytes
+            for offset in range(0, len(in_data), chunk_bytes):
+                if len(self.frames) >= self.max_queue_depth:
+                    self.frames.popleft()
+                    if self._loop is not None:
+                        # Before the first read_frame nobody is consuming yet, so nothing is lost
+                        self._record_loss('queue_full', self.chunk)
+                # Each chunk keeps the ADC time of its first sample, used to align several sources
+                chunk_time = adc_time + offset / frame_bytes / self.rate if adc_time else None
+                self.frames.append((chunk_time, in_data[offset:offset + chunk_bytes]))
+            self._wake_reader()
+        return (None, pyaudio.paContinue)
+
+    def _record_loss(self, reason, frames):
+        if reason == 'overrun':
+            self.capture_stats['overruns'] += 1
+        elif reason == 'gap':
+            self.capture_stats['gaps'] += 1
+            self.capture_stats['gap_ms'] += frames * 1000 / self.rate
+        else:
+            self.capture_stats['dropped_frames'] += 1
+        self._unreported_losses.append((time.monotonic(), reason, frames, len(self.frames)))
+
+    def _wake_reader(self):
+        loop, frame_ready = self._loop, self._frame_ready
+        if loop is not None and frame_ready is not None:
+            try:
+                loop.call_soon_threadsafe(frame_ready.set)
+            except RuntimeError:
+                pass  # Loop already closed
+
+    def _report_losses(self):
+        while self._unreported_losses:
+            lost_at, reason, frames, depth = self._unreported_losses.popleft()
+            cause = {
+                'overrun': "PortAudio input overflow, the callback was not serviced in time",
+                'gap': "gap in the ADC timestamps of consecutive buffers",
+                'queue_full': "frame queue full, the assistant loop is not keeping up",
+            }[reason]
+            self.logger.warning(f"Audio lost: {frames * 1000 / self.rate:.0f} ms ({cause}); "
+                                f"queue depth {depth}/{self.max_queue_depth}")
+            self._recent_losses.append((lost_at, reason))
+        self._adapt_buffering()
+
+    def _adapt_buffering(self):
+        horizon = time.monotonic() - self.adapt_window_seconds
+        while self._recent_losses and self._recent_losses[0][0] < horizon:
+            self._recent_losses.popleft()
+        device_losses = sum(1 for _, reason in self._recent_losses if reason != 'queue_full')
+        queue_losses = len(self._recent_losses) - device_losses
+
+        # A single loss is not sustained lag; adapt only after adapt_loss_events within the window
+        if queue_losses >= self.adapt_loss_events and self.max_queue_depth < self.queue_depth_limit:
+            self.max_queue_depth = min(self.max_queue_depth * 2, self.queue_depth_limit)
+            self.capture_stats['adaptations'] += 1
+            self._recent_losses.clear()
+            self.logger.warning(f"Sustained capture lag, frame queue depth raised to {self.max_queue_depth}")
+        elif (device_losses >= self.adapt_loss_events and self.frames_per_buffer < self.max_frames_per_buffer
+              and (self._reopen_task is None or self._reopen_task.done())):
+            self.frames_per_buffer = min(self.frames_per_buffer * 2, self.max_frames_per_buffer)
+            self.capture_stats['adaptations'] += 1
+            self._recent_losses.clear()
+            self.logger.warning(f"Repeated overruns, reopening stream with {self.frames_per_buffer} frames per buffer")
+            self._reopen_task = asyncio.get_running_loop().create_task(self._reopen_stream())
+
+    async def _reopen_stream(self):
+        # Closing and opening the device can take hundreds of ms, so it runs off the event loop.
+        # self.stream keeps the old object meanwhile, and read_frame simply waits for frames.
+        old_stream = self.stream
+        loop = asyncio.get_running_loop()
+
+        def reopen():
+            old_stream.stop_stream()
+            old_stream.close()
+            return self._open_stream()
+
+        try:
+            new_stream = await loop.run_in_executor(None, reopen)
+        except OSError as e:
+            self.stream = None
+            self.logger.error(f"Error reopening audio stream: {str(e)}")
+            self._wake_reader()
+            return
+        if self.stream is not old_stream:
+            # Stopped while reopening
+            new_stream.stop_stream()
+            new_stream.close()
+            return
+        self.stream = new_stream
+        self._next_adc_time = None
+        self.logger.info(f"Audio stream reopened with {self.frames_per_buffer} frames per buffer")
+
+    def stats(self):
+        return {**self.capture_stats,
+                'queue_depth': len(self.frames),
+                'max_queue_depth': self.max_queue_depth,
+                'frames_per_buffer': self.frames_per_buffer}
+
     async def read_audio(self):
+        _, audio_data = await self.read_frame()
+        if self.recorder is not None and audio_data:
+            self.recorder.write(audio_data)
+        return audio_data
+
+    async def read_frame(self):
+        # Returns (ADC time of the first sample or None, mono pcm16 chunk); b'' while gated or stopped
         if self.stream is None:
             self.logger.error("Audio stream is not initialized")
             raise RuntimeError("Audio stream is not initialized")
 
-        try:
-            audio_data = self.stream.read(self.chunk, exception_on_overflow=False)
-            # Process audio data immediately after reading
-        except Exception as e:
-            self.logger.error(f"Error reading audio data: {e}")
-            return b''  # Return empty bytes to avoid crashing
+        if not self.gate_open:
+            return None, b''
+
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._frame_ready = asyncio.Event()
+        while not self.frames:
+            self._frame_ready.clear()
+            await self._frame_ready.wait()
+            if self.stream is None or not self.gate_open:
+                return None, b''
+        frame_time, audio_data = self.frames.popleft()
+        self.capture_stats['frames_read'] += 1
+        metrics.FRAMES_READ.inc()
+        if self._unreported_losses:
+            self._report_losses()
 
         # Convert bytes to AudioSegment
         audio_segment = AudioSegment(
@@ -113,7 +337,7 @@ class AudioCapture:
         rms = audio_segment.rms
         self.logger.debug(f"Audio RMS: {rms}")
 
-        return audio_data
+        return frame_time, audio_data
 
     async def is_speech(self, audio_segment):
         try:
@@ -124,22 +348,11 @@ class AudioCapture:
             samples_per_frame = int(self.rate * frame_duration_ms / 1000)
             expected_frame_length = samples_per_frame * self.bytes_per_sample
 
-            # Split the audio segment into frames of the correct size
-            frames = [audio_segment[i:i+expected_frame_length] for i in range(0, len(audio_segment), expected_frame_length)]
-
-            is_speech_frame = False
-            for frame in frames:
-                self.logger.debug(f"Processing frame of length: {len(frame)} bytes (expected: {expected_frame_length} bytes)")
-                if len(frame) == expected_frame_length:
-                    is_speech_frame = self.vad.is_speech(frame, self.rate)
-                    self.logger.debug(f"VAD result for frame: {is_speech_frame}")
-                    if is_speech_frame:
-                        break  # If any frame is speech, consider the whole segment as speech
+            # If any frame is speech, consider the whole segment as speech
+            is_speech_frame = contains_speech(self.vad, audio_segment, self.rate, expected_frame_length)
 
-            if is_speech_frame:
-                self.speech_frames_count += 1
-            else:
-                self.speech_frames_count = max(0, self.speech_frames_count - 1)
+            self.last_frame_is_speech = is_speech_frame
+            self.speech_frames_count = update_speech_count(self.speech_frames_count, is_speech_frame)
 
             self.logger.debug(f"VAD speech: {is_speech_frame}, Speech frames: {self.speech_frames_count}, Threshold: {self.speech_frames_threshold}")
             return self.speech_frames_count >= self.speech_frames_threshold
@@ -149,21 +362,49 @@ class AudioCapture:
             self.logger.debug(f"Audio segment details: length={len(audio_segment)}, first few bytes: {audio_segment[:20]}")
             return False
         
+    def close_gate(self):
+        self.gate_open = False
+        self.logger.info("Audio gate closed, stream kept open")
+
+    def open_gate(self):
+        # Discard anything still queued from before the gate closed so the next read is live audio
+        if self.frames:
+            self.logger.debug(f"Discarded {len(self.frames)} stale frames on resume")
+            self.frames.clear()
+        # Losses from before the gate opened say nothing about the loop keeping up now
+        self._unreported_losses.clear()
+        self._recent_losses.clear()
+        self.gate_open = True
+        self.logger.info("Audio gate opened")
+
     def stop_stream(self):
-        if self.stream is not None:
+        if self._reopen_task is not None and not self._reopen_task.done():
+            # The executor closes the old stream and _reopen_stream discards the new one
+            self.stream = None
+            self.frames.clear()
+            self._wake_reader()
+            self.logger.info("Audio stream stopped during reopen")
+        elif self.stream is not None:
             self.logger.info("Stopping audio stream")
             self.stream.stop_stream()
             self.stream.close()
             self.stream = None
+            self.frames.clear()
+            self._wake_reader()
             self.logger.info("Audio stream stopped")
         else:
             self.logger.info("Audio stream is not running")
 
     def reset_vad(self):
+        # Only the smoothing counters are reset; the Vad instance and the stream stay warm
         self.speech_frames_count = 0
-        self.stop_stream()
-        # self.p.terminate()
-        self.logger.info("AudioCapture instance destroyed")
+        self.last_frame_is_speech = False
+        self.logger.info("VAD state reset")
+
+    def set_vad_aggressiveness(self, mode):
+        # Takes effect on the next frame; the smoothing counters carry over
+        self.vad.set_mode(mode)
+        self.logger.info(f"VAD aggressiveness set to {mode}")
 
 if __name__ == "__main__":
     # This allows you to test the AudioCapture class independently
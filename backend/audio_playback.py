@@ -0,0 +1,180 @@
+import base64
+import json
+import queue
+import threading
+import time
+from collections import deque
+import pyaudio
+from common_logging import setup_logging
+
+OUTPUT_RATE = 24000  # The session asks for pcm16 output, which the API sends as 24 kHz mono
+SAMPLE_WIDTH = 2
+
+
+class AudioPlayback:
+    def __init__(self, config):
+        self.frames_per_buffer = config.playback_frames_per_buffer
+        self.target_bytes = self._ms_to_bytes(config.playback_target_delay_ms)
+        self.max_bytes = self._ms_to_bytes(config.playback_max_buffer_ms)
+        self.device_name = config.playback_device_name
+        self.logger = setup_logging('audio_playback')
+        self.p = pyaudio.PyAudio()
+        self.stream = None
+
+        # Jitter buffer shared with the PortAudio callback thread
+        self._lock = threading.Lock()
+        self._buffer = bytearray()
+        self._priming = True  # Hold output until target_bytes are buffered
+        self._response_streaming = False  # An empty buffer is only an underrun while deltas are still due
+        self._first_delta_at = None
+        self.stats_counters = {'underruns': 0, 'played_ms': 0.0, 'dropped_ms': 0.0, 'dropped_deltas': 0,
+                               'flushes': 0, 'max_buffered_ms': 0.0, 'first_audio_ms': None}
+
+        # Delta frames are parsed and base64-decoded on a worker thread, off the event loop
+        self._deltas = queue.Queue(maxsize=256)
+        self._muted_responses = deque(maxlen=8)  # Cancelled responses whose late deltas are dropped
+        self._current_response_id = None  # Of the latest decoded delta
+        self._latest_response_id = None  # From response.created, known before any of its deltas is decoded
+        self._worker = threading.Thread(target=self._decode_deltas, name='playback-decoder', daemon=True)
+        self._worker.start()
+
+    def _ms_to_bytes(self, ms):
+        return int(OUTPUT_RATE * ms / 1000) * SAMPLE_WIDTH
+
+    def _bytes_to_ms(self, size):
+        return size / SAMPLE_WIDTH / OUTPUT_RATE * 1000
+
+    def find_output_device(self):
+        if not self.device_name:
+            return None
+        for i in range(self.p.get_device_count()):
+            dev = self.p.get_device_info_by_index(i)
+            if dev.get('maxOutputChannels') > 0 and self.device_name.lower() in dev.get('name').lower():
+                return i
+        self.logger.warning(f"Output device '{self.device_name}' not found, using the default")
+        return None
+
+    def start(self):
+        # Opened once and kept running, emitting silence when idle, so the first delta plays without a device open
+        if self.stream is not None:
+            return
+        self.stream = self.p.open(format=pyaudio.paInt16,
+                                  channels=1,
+                                  rate=OUTPUT_RATE,
+                                  output=True,
+                                  output_device_index=self.find_output_device(),
+                                  frames_per_buffer=self.frames_per_buffer,
+                                  stream_callback=self._on_output)
+        self.logger.info(f"Playback stream started ({self.frames_per_buffer} frames per buffer, "
+                         f"target delay {self._bytes_to_ms(self.target_bytes):.0f} ms)")
+
+    def start_response(self, response_id):
+        # Called on response.created, so a flush also mutes a response none of whose deltas was decoded yet
+        self._latest_response_id = response_id
+
+    def feed(self, raw_event):
+        # raw_event is the unparsed response.audio.delta frame; never blocks the event loop
+        if self._first_delta_at is None:
+            self._first_delta_at = time.perf_counter()
+        self._response_streaming = True
+        try:
+            self._deltas.put_nowait(raw_event)
+        except queue.Full:
+            self.stats_counters['dropped_deltas'] += 1
+            self.logger.warning("Playback decoder is behind, dropped an audio delta")
+
+    def _decode_deltas(self):
+        while True:
+            raw_event = self._deltas.get()
+            if raw_event is None:
+                return
+            try:
+                event = json.loads(raw_event)
+                response_id = event.get('response_id')
+                if response_id in self._muted_responses:
+                    continue
+                self._current_response_id = response_id
+                pcm = base64.b64decode(event.get('delta', ''))
+            except (ValueError, TypeError) as e:
+                self.logger.error(f"Could not decode audio delta: {e}")
+                continue
+            with self._lock:
+                self._buffer += pcm
+                overflow = len(self._buffer) - self.max_bytes
+                if overflow > 0:
+                    overflow += overflow % SAMPLE_WIDTH
+                    del self._buffer[:overflow]
+                    self.stats_counters['dropped_ms'] += self._bytes_to_ms(overflow)
+                buffered_ms = self._bytes_to_ms(len(self._buffer))
+                if buffered_ms > self.stats_counters['max_buffered_ms']:
+                    self.stats_counters['max_buffered_ms'] = buffered_ms
+
+    def _on_output(self, in_data, frame_count, time_info, status_flags):
+        # Runs on the PortAudio thread: copy out of the jitter buffer, pad with silence, no logging
+        needed = frame_count * SAMPLE_WIDTH
+        with self._lock:
+            if self._priming:
+                if len(self._buffer) >= self.target_bytes or (self._buffer and not self._response_streaming):
+                    self._priming = False
+                    if self._first_delta_at is not None and self.stats_counters['first_audio_ms'] is None:
+                        # From the first delta of the response to its first audible buffer
+                        self.stats_counters['first_audio_ms'] = (time.perf_counter() - self._first_delta_at) * 1000
+                else:
+                    return (bytes(needed), pyaudio.paContinue)
+            chunk = bytes(self._buffer[:needed])
+            del self._buffer[:needed]
+            self.stats_counters['played_ms'] += self._bytes_to_ms(len(chunk))
+            if len(chunk) < needed:
+                if self._response_streaming:
+                    # Ran dry mid-answer: count it and rebuild the target delay before resuming
+                    self.stats_counters['underruns'] += 1
+                self._priming = True
+                chunk += bytes(needed - len(chunk))
+        return (chunk, pyaudio.paContinue)
+
+    def end_response(self):
+        # No more deltas are coming; let the buffer drain without counting underruns
+        self._response_streaming = False
+        self._first_delta_at = None
+        self.logger.info(f"Response playback finished: {self.stats()}")
+        self.stats_counters['first_audio_ms'] = None
+
+    def flush(self, reason):
+        # Drops everything queued or buffered at once, and mutes late deltas of the interrupted response
+        for response_id in {self._current_response_id, self._latest_response_id}:
+            if response_id is not None and response_id not in self._muted_responses:
+                self._muted_responses.append(response_id)
+        while True:
+            try:
+                self._deltas.get_nowait()
+            except queue.Empty:
+                break
+        with self._lock:
+            flushed_ms = self._bytes_to_ms(len(self._buffer))
+            self._buffer.clear()
+            self._priming = True
+        self._response_streaming = False
+        self._first_delta_at = None
+        self.stats_counters['flushes'] += 1
+        self.logger.info(f"Playback flushed ({reason}), {flushed_ms:.0f} ms discarded")
+
+    def is_playing(self):
+        return bool(self._buffer) or self._response_streaming
+
+    def is_receiving(self):
+        # Deltas are still due, i.e. the server is still generating the response being played
+        return self._response_streaming
+
+    def stats(self):
+        return {**{key: round(value, 1) if isinstance(value, float) else value
+                   for key, value in self.stats_counters.items()},
+                'buffered_ms': round(self._bytes_to_ms(len(self._buffer)), 1)}
+
+    def close(self):
+        self._deltas.put(None)
+        if self.stream is not None:
+            self.stream.stop_stream()
+            self.stream.close()
+            self.stream = None
+        self.p.terminate()
+        self.logger.info("Playback stream closed")
@@ -0,0 +1,125 @@
+import json
+import os
+import queue
+import threading
+import time
+import wave
+from common_logging import setup_logging
+
+
+class AudioRecorder:
+    def __init__(self, config, rate, sample_width, channels=1):
+        self.rate = rate
+        self.sample_width = sample_width
+        self.channels = channels
+        self.directory = config.recording_dir
+        self.file_format = config.recording_format  # 'wav' or 'raw'
+        self.segment_frames = int(config.recording_segment_seconds * rate)
+        self.max_bytes = config.recording_max_bytes
+        self.logger = setup_logging('audio_recorder')
+
+        # Updated on the caller's side only, so offsets are known without waiting for the writer
+        self.position = 0
+        self.dropped = 0
+        self.session = time.strftime('%Y%m%d-%H%M%S')
+        self._queue = queue.Queue(maxsize=config.recording_queue_size)
+        self._segment = None
+        self._segment_number = None
+        self._thread = threading.Thread(target=self._run, name='audio-recorder', daemon=True)
+        os.makedirs(self.directory, exist_ok=True)
+        self._thread.start()
+        self.logger.info(f"Recording captured audio to {self.directory}")
+
+    def write(self, frame):
+        # Hands the frame object itself to the writer thread; never blocks and never copies
+        try:
+            self._queue.put_nowait(('audio', self.position, frame))
+        except queue.Full:
+            self.dropped += 1
+        self.position += len(frame) // (self.sample_width * self.channels)
+
+    def index_utterance(self, event_id, start, end):
+        entry = {
+            'event_id': event_id,
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'start_frame': start,
+            'end_frame': end,
+            'start_seconds': round(start / self.rate, 3),
+            'duration_seconds': round((end - start) / self.rate, 3),
+            'segment': self.segment_name(start // self.segment_frames),
+            'segment_offset_frame': start % self.segment_frames,
+        }
+        try:
+            self._queue.put_nowait(('index', entry, None))
+        except queue.Full:
+            self.dropped += 1
+
+    def segment_name(self, number):
+        return f"capture-{self.session}-{number:05d}.{self.file_format}"
+
+    def close(self):
+        self._queue.put(('close', None, None))
+        self._thread.join(timeout=5)
+
+    def _run(self):
+        index_path = os.path.join(self.directory, f"capture-{self.session}-index.jsonl")
+        while True:
+            kind, first, second = self._queue.get()
+            try:
+                if kind == 'audio':
+                    self._write_audio(first, second)
+                elif kind == 'index':
+                    with open(index_path, 'a') as index_file:
+                        index_file.write(json.dumps(first) + "\n")
+                else:
+                    self._close_segment()
+                    return
+            except OSError as e:
+                self.logger.error(f"Error writing recording: {e}")
+
+    def _write_audio(self, position, frame):
+        frame_size = self.sample_width * self.channels
+        while frame:
+            number = position // self.segment_frames
+            if number != self._segment_number:
+                self._close_segment()
+                self._open_segment(number)
+            room = (number + 1) * self.segment_frames - position
+            part = frame[:room * frame_size]
+            if self.file_format == 'wav':
+                self._segment.writeframesraw(part)
+            else:
+                self._segment.write(part)
+            position += len(part) // frame_size
+            frame = frame[len(part):]
+
+    def _open_segment(self, number):
+        path = os.path.join(self.directory, self.segment_name(number))
+        if self.file_format == 'wav':
+            self._segment = wave.open(path, 'wb')
+            self._segment.setnchannels(self.channels)
+            self._segment.setsampwidth(self.sample_width)
+            self._segment.setframerate(self.rate)
+        else:
+            self._segment = open(path, 'wb')
+        self._segment_number = number
+
+    def _close_segment(self):
+        if self._segment is None:
+            return
+        self._segment.close()  # For WAV this also fixes up the header sizes
+        self._segment = None
+        self._segment_number = None
+        self._enforce_retention()
+
+    def _enforce_retention(self):
+        segments = sorted(
+            (os.path.join(self.directory, name) for name in os.listdir(self.directory)
+             if name.startswith('capture-') and name.endswith(('.wav', '.raw'))),
+            key=os.path.getmtime)
+        total = sum(os.path.getsize(path) for path in segments)
+        while segments and total > self.max_bytes:
+            oldest = segments.pop(0)
+            total -= os.path.getsize(oldest)
+            os.remove(oldest)
+            self.logger.info(f"Removed old recording segment {oldest}")
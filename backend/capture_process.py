@@ -0,0 +1,375 @@
+import asyncio
+import math
+import multiprocessing
+import os
+import struct
+import threading
+import time
+from multiprocessing import shared_memory
+import pyaudio
+from audio_capture import AudioCapture
+from audio_recorder import AudioRecorder
+from common_logging import setup_logging
+from g711 import INPUT_FORMATS
+import metrics
+
+try:
+    import audioop
+except ImportError:  # Removed from the standard library in Python 3.13; pydub ships a replacement
+    import pyaudioop as audioop
+
+FRAME_DURATION_MS = 30  # Same chunking as AudioCapture
+
+
+class FrameRing:
+    """Fixed-size slots of captured frames in shared memory, written by one process and read by another.
+
+    The header holds the number of frames written so far. Each slot starts with its frame's sequence
+    number, written last, so a reader can tell a complete frame from one being overwritten.
+    """
+
+    HEADER = struct.Struct('<Q')  # Frames written
+    SLOT_HEADER = struct.Struct('<QdIBB2x')  # Sequence, ADC time (NaN if unknown), bytes, raw VAD, speaking
+
+    def __init__(self, buf, slots, frame_bytes):
+        self.buf = buf
+        self.slots = slots
+        self.frame_bytes = frame_bytes
+        self.slot_size = self.SLOT_HEADER.size + frame_bytes
+
+    @classmethod
+    def size(cls, slots, frame_bytes):
+        return cls.HEADER.size + slots * (cls.SLOT_HEADER.size + frame_bytes)
+
+    def _offset(self, seq):
+        return self.HEADER.size + (seq - 1) % self.slots * self.slot_size
+
+    def written(self):
+        return self.HEADER.unpack_from(self.buf, 0)[0]
+
+    def write(self, seq, frame_time, raw_speech, speaking, data):
+        offset = self._offset(seq)
+        self.SLOT_HEADER.pack_into(self.buf, offset, 0, math.nan, 0, 0, 0)  # Marks the slot as being rewritten
+        start = offset + self.SLOT_HEADER.size
+        self.buf[start:start + len(data)] = data
+        self.SLOT_HEADER.pack_into(self.buf, offset, seq, math.nan if frame_time is None else frame_time,
+                                   len(data), raw_speech, speaking)
+        self.HEADER.pack_into(self.buf, 0, seq)
+
+    def read(self, seq):
+        # Returns (ADC time, raw VAD, speaking, view of the samples), or None if the slot was already reused.
+        # The view is not a copy: it stays valid until the writer wraps around to this slot again.
+        offset = self._offset(seq)
+        slot_seq, frame_time, size, raw_speech, speaking = self.SLOT_HEADER.unpack_from(self.buf, offset)
+        if slot_seq != seq:
+            return None
+        start = offset + self.SLOT_HEADER.size
+        return (None if math.isnan(frame_time) else frame_time), bool(raw_speech), bool(speaking), \
+            self.buf[start:start + size]
+
+
+def capture_worker(config, device_index, device_name, shm_name, slots, frame_bytes, start_seq, control, notify):
+    # Child process entry point: owns PortAudio, VAD and resampling, and publishes frames into the ring
+    logger = setup_logging('capture_process')
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        asyncio.run(publish_frames(config, device_index, device_name, FrameRing(shm.buf, slots, frame_bytes),
+                                   start_seq, control, notify, logger))
+    except (EOFError, BrokenPipeError):
+        pass  # The assistant went away
+    except Exception as e:
+        logger.exception(f"Capture process failed: {e}")
+        try:
+            control.send(('error', str(e)))
+        except OSError:
+            pass
+    finally:
+        shm.close()
+
+
+async def publish_frames(config, device_index, device_name, ring, seq, control, notify, logger):
+    capture = AudioCapture(config, device_name=device_name, remember_device=False, record=False)
+    if device_name:
+        # Indices shift when devices are replugged, which is also when a restart is likely
+        device_index = capture.find_input_device(device_name, device_index)
+    capture.device_index = device_index
+    capture.start_stream()
+    control.send(('started', os.getpid()))
+    logger.info(f"Capture process {os.getpid()} publishing frames from device {device_index}")
+
+    os.set_blocking(notify.fileno(), False)
+    output_rate = INPUT_FORMATS[config.input_audio_format][0]
+    resample_state = None
+    stats_due = time.monotonic() + 1
+    while True:
+        while control.poll():
+            command, argument = control.recv()
+            if command == 'stop':
+                capture.stop_stream()
+                return
+            elif command == 'reset_vad':
+                capture.reset_vad()
+            elif command == 'set_vad_aggressiveness':
+                capture.set_vad_aggressiveness(argument)
+
+        frame_time, data = await capture.read_frame()
+        if not data:
+            continue
+        speaking = await capture.is_speech(data)
+        resampled, resample_state = audioop.ratecv(data, capture.bytes_per_sample, 1, capture.rate,
+                                                   output_rate, resample_state)
+        seq += 1
+        ring.write(seq, frame_time, capture.last_frame_is_speech, speaking, resampled[:ring.frame_bytes])
+        try:
+            os.write(notify.fileno(), b'\x01')
+        except BlockingIOError:
+            pass  # The reader is behind on notifications, but it checks the ring header anyway
+
+        if time.monotonic() >= stats_due:
+            control.send(('stats', capture.stats()))
+            stats_due += 1
+
+
+class ProcessCapture:
+    """Runs AudioCapture in a child process and presents it to the assistant with the same interface.
+
+    The child owns the PyAudio stream, VAD and resampling to the API's input rate, so none of it competes with
+    the assistant loop for the GIL. Frames and VAD decisions come back through a shared-memory ring,
+    with one byte on a pipe per frame to wake the loop. A supervisor thread restarts the child when it
+    dies or stops publishing, which is how a wedged audio device shows up.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.format = pyaudio.paInt16
+        self.channels = 1
+        self.rate = INPUT_FORMATS[config.input_audio_format][0]  # The API's input rate, nothing left to resample
+        self.bytes_per_sample = pyaudio.get_sample_size(self.format)
+        self.frame_duration_ms = FRAME_DURATION_MS
+        self.chunk = int(self.rate * self.frame_duration_ms / 1000)
+        self.stall_seconds = config.capture_process_stall_seconds
+        self.logger = setup_logging('capture_process')
+
+        # Room for one resampled chunk plus the sample ratecv may carry over between chunks
+        input_chunk = int(config.rate * self.frame_duration_ms / 1000)
+        frame_bytes = (math.ceil(input_chunk * self.rate / config.rate) + 1) * self.bytes_per_sample
+        slots = config.capture_process_slots
+        self.shm = shared_memory.SharedMemory(create=True, size=FrameRing.size(slots, frame_bytes))
+        self.shm.buf[:FrameRing.HEADER.size] = bytes(FrameRing.HEADER.size)
+        self.ring = FrameRing(self.shm.buf, slots, frame_bytes)
+        self.read_seq = 0
+
+        self._context = multiprocessing.get_context('spawn')
+        self.control, self._child_control = self._context.Pipe()
+        self._notify_reader, self._notify_writer = self._context.Pipe(duplex=False)
+        os.set_blocking(self._notify_reader.fileno(), False)
+        self.process = None
+        self.device_index = config.speaker_device_index
+        self.device_name = config.input_device_name
+        self._lock = threading.Lock()  # Held while the child is started, stopped or replaced
+        self._should_run = False
+        self._supervisor = None
+        self._loop = None
+        self._frame_ready = None
+
+        self.gate_open = True
+        self.last_frame_is_speech = False
+        self.speaking = False
+        self.child_stats = {}
+        self.process_stats = {'frames_read': 0, 'ring_overruns': 0, 'restarts': 0}
+        self.recorder = (AudioRecorder(config, self.rate, self.bytes_per_sample)
+                         if config.recording_enabled else None)
+        self.logger.info(f"ProcessCapture initialized ({slots} slots of {frame_bytes} bytes)")
+
+    def select_audio_device(self, is_speaker=False, prompt=False):
+        # Selection may prompt, so it happens here; PortAudio is released again before the child opens it
+        selector = AudioCapture(self.config, record=False)
+        try:
+            self.device_index = selector.select_audio_device(is_speaker=is_speaker, prompt=prompt)
+            self.device_name = selector.p.get_device_info_by_index(self.device_index).get('name')
+        finally:
+            selector.p.terminate()
+        return self.device_index
+
+    def start_stream(self):
+        with self._lock:
+            self._should_run = True
+            if self.process is None or not self.process.is_alive():
+                self._spawn()
+        if self._supervisor is None:
+            self._supervisor = threading.Thread(target=self._supervise, name='capture-supervisor', daemon=True)
+            self._supervisor.start()
+
+    def _spawn(self):
+        if self.device_index is None:
+            self.select_audio_device()
+        self.process = self._context.Process(
+            target=capture_worker, name='audio-capture', daemon=True,
+            args=(self.config, self.device_index, self.device_name, self.shm.name, self.ring.slots,
+                  self.ring.frame_bytes, self.ring.written(), self._child_control, self._notify_writer))
+        self.process.start()
+        self.logger.info(f"Started capture process {self.process.pid}")
+
+    def _terminate(self, timeout=1.0):
+        process, self.process = self.process, None
+        if process is None:
+            return
+        process.join(timeout)
+        if process.is_alive():
+            process.terminate()  # A wedged PortAudio call can ignore the stop command
+            process.join(timeout)
+        if process.is_alive():
+            process.kill()
+            process.join()
+        self.logger.info(f"Capture process {process.pid} exited with code {process.exitcode}")
+
+    def _supervise(self):
+        last_written, last_progress = self.ring.written(), time.monotonic()
+        backoff = 1
+        while True:
+            time.sleep(0.25)
+            self._receive_child_messages()
+            with self._lock:
+                if not self._should_run:
+                    last_progress = time.monotonic()
+                    continue
+                written = self.ring.written()
+                if written != last_written:
+                    last_written, last_progress = written, time.monotonic()
+                    backoff = 1
+                    continue
+                stalled = time.monotonic() - last_progress
+                if self.process is not None and self.process.is_alive() and stalled < self.stall_seconds:
+                    continue
+                if stalled < backoff:
+                    continue  # Don't spin on a device that fails right away
+                reason = "exited" if self.process is None or not self.process.is_alive() \
+                    else f"published nothing for {stalled:.1f} s"
+                self.logger.warning(f"Capture process {reason}, restarting it")
+                self._terminate(timeout=0.2)
+                self.process_stats['restarts'] += 1
+                self._spawn()
+                last_progress = time.monotonic()
+                backoff = min(backoff * 2, 30)
+
+    def _receive_child_messages(self):
+        try:
+            while self.control.poll():
+                kind, payload = self.control.recv()
+                if kind == 'stats':
+                    self.child_stats = payload
+                elif kind == 'error':
+                    self.logger.error(f"Capture process error: {payload}")
+        except (EOFError, OSError):
+            pass
+
+    def _send(self, command, argument=None):
+        try:
+            self.control.send((command, argument))
+        except OSError as e:
+            self.logger.error(f"Could not reach the capture process: {e}")
+
+    def _on_notify(self):
+        try:
+            os.read(self._notify_reader.fileno(), 4096)
+        except BlockingIOError:
+            pass
+        self._frame_ready.set()
+
+    def _attach_loop(self, loop):
+        # Frame notifications wake the loop through its selector, without a thread of our own
+        if self._loop is not None:
+            self._loop.remove_reader(self._notify_reader.fileno())
+        self._loop = loop
+        self._frame_ready = asyncio.Event()
+        loop.add_reader(self._notify_reader.fileno(), self._on_notify)
+
+    async def read_audio(self):
+        _, audio_data = await self.read_frame()
+        if self.recorder is not None and audio_data:
+            self.recorder.write(bytes(audio_data))  # The recorder keeps frames longer than the ring does
+        return audio_data
+
+    async def read_frame(self):
+        # Returns (ADC time or None, view of the API-rate mono frame in shared memory); b'' while gated or stopped
+        if not self._should_run:
+            raise RuntimeError("Capture process is not running")
+        if not self.gate_open:
+            return None, b''
+
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._attach_loop(loop)
+        while True:
+            written = self.ring.written()
+            if written > self.read_seq:
+                if written - self.read_seq > self.ring.slots:
+                    # The loop fell a whole ring behind; the oldest frames are gone
+                    self.process_stats['ring_overruns'] += written - self.ring.slots - self.read_seq
+                    self.read_seq = written - self.ring.slots
+                frame = self.ring.read(self.read_seq + 1)
+                self.read_seq += 1
+                if frame is None:
+                    self.process_stats['ring_overruns'] += 1
+                    continue
+                break
+            self._frame_ready.clear()
+            await self._frame_ready.wait()
+            if not self._should_run or not self.gate_open:
+                return None, b''
+
+        frame_time, self.last_frame_is_speech, self.speaking, audio_data = frame
+        self.process_stats['frames_read'] += 1
+        metrics.FRAMES_READ.inc()
+        return frame_time, audio_data
+
+    async def is_speech(self, audio_segment):
+        # VAD already ran in the capture process on the full-rate frame
+        return self.speaking
+
+    def stats(self):
+        return {**self.child_stats,
+                **self.process_stats,
+                'ring_depth': self.ring.written() - self.read_seq,
+                'pid': self.process.pid if self.process is not None else None}
+
+    def close_gate(self):
+        self.gate_open = False
+        self.logger.info("Audio gate closed, capture process keeps running")
+
+    def open_gate(self):
+        # Skip whatever was published while the gate was closed
+        self.read_seq = self.ring.written()
+        self.gate_open = True
+        self.logger.info("Audio gate opened")
+
+    def reset_vad(self):
+        self.speaking = False
+        self.last_frame_is_speech = False
+        self._send('reset_vad')
+
+    def set_vad_aggressiveness(self, mode):
+        self._send('set_vad_aggressiveness', mode)
+
+    def stop_stream(self):
+        with self._lock:
+            self._should_run = False
+            if self.process is not None:
+                self._send('stop')
+                self._terminate()
+        if self._frame_ready is not None:
+            try:
+                self._loop.call_soon_threadsafe(self._frame_ready.set)
+            except RuntimeError:
+                pass  # Loop already closed
+
+    def close(self):
+        self.stop_stream()
+        if self._loop is not None:
+            self._loop.remove_reader(self._notify_reader.fileno())
+        self.ring = None
+        try:
+            self.shm.close()
+        except BufferError:
+            self.logger.warning("Frame views are still referenced, leaving the ring mapped until exit")
+        self.shm.unlink()
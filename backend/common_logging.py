@@ -27,7 +27,7 @@ def setup_logging(name, debug_to_console=False, filter_response_done=False):
     os.makedirs(log_dir, exist_ok=True)
     
     # File handler
-    file_handler = RotatingFileHandler(f'logs/{name}.log', maxBytes=10000000, backupCount=5)
+    file_handler = RotatingFileHandler(os.path.join(log_dir, f'{name}.log'), maxBytes=10000000, backupCount=5)
     file_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
     file_handler.setFormatter(file_formatter)
     logger.addHandler(file_handler)
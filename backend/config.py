@@ -14,9 +14,33 @@ class Config:
         self.format = pyaudio.paInt16  
         self.sample_width = pyaudio.get_sample_size(self.format)
         self.chunk = int(self.rate * self.frame_duration_ms / 1000)
+        self.input_audio_format = 'pcm16'  # 'pcm16' (24 kHz), or 'g711_ulaw'/'g711_alaw' (8 kHz, 1/6 of the bytes)
+        self.vad_aggressiveness = 1  # webrtcvad mode, 0 (least) to 3 (most aggressive filtering of non-speech)
 
         # Removed websocket_host and websocket_port as they are hardcoded in websocket_manager.py
         self.speaker_device_index = None  
+        self.capture_queue_depth = 16  # Captured frames queued for the assistant loop (~0.5 s at 30 ms)
+        self.capture_queue_max_depth = 128  # Upper bound when the queue grows under sustained lag
+        self.capture_max_buffer_chunks = 4  # Upper bound for frames_per_buffer, in VAD chunks
+        self.capture_adapt_window_seconds = 5
+        self.capture_adapt_loss_events = 3  # Losses of one kind within the window before the queue or buffers grow
+        # Extra input sources captured alongside the microphone, e.g. a PulseAudio monitor of the meeting app:
+        # [{'name': 'mic'}, {'name': 'remote', 'device': 'Monitor of Built-in Audio', 'gain': 1.0}]
+        self.capture_sources = None
+        self.capture_mix_mode = 'mix'  # 'mix' records the mono mix, 'separate' records one channel per source
+        self.source_vad_energy_floor = 150  # RMS below which a source is treated as silent without running VAD
+        self.capture_process = False  # Capture, VAD and resampling in a child process, frames shared through memory
+        self.capture_process_slots = 64  # Frames in the shared ring (~2 s at 30 ms)
+        self.capture_process_stall_seconds = 2.0  # Restart the capture process after this long without a frame
+        self.recording_enabled = False  # Keep a copy of captured audio on disk for replaying sessions
+        self.recording_dir = os.path.join(os.path.dirname(__file__), 'recordings')
+        self.recording_format = 'wav'  # 'wav' or 'raw'
+        self.recording_segment_seconds = 300
+        self.recording_max_bytes = 500 * 1024 * 1024  # Oldest segments are deleted beyond this
+        self.recording_queue_size = 1024  # Frames waiting for the writer before new ones are dropped
+        self.input_device_name = os.getenv("INPUT_DEVICE_NAME")  # Select the input device by name, skipping the prompt
+        self.use_saved_device = True  # Reuse the device chosen last time instead of prompting
+        self.device_settings_path = os.path.join(os.path.dirname(__file__), 'device_settings.json')
         self.api_key = os.getenv("OPENAI_API_KEY")
         self.api_url = "wss://api.openai.com/v1/realtime?model=gpt-4o-realtime-preview-2024-10-01"
         self.instructions = """You are a helpful assistant. You are helping me answer interview questions.
@@ -24,4 +48,79 @@ class Config:
                                No markdown. Avoid unnecessary elaboration unless specifically requested."""
         self.voice = "alloy"
         self.temperature = 0.6
+        self.turn_detection_threshold = 0.5  # Server VAD settings sent in session.update
+        self.turn_detection_prefix_padding_ms = 300
+        self.turn_detection_silence_duration_ms = 200
+        self.forward_unparsed_events = True  # Pass events without a backend consumer through to the UI unparsed
+        self.outbound_queue_max_depth = 512  # Queued outbound events before audio senders wait
+        self.outbound_queue_max_bytes = 8 * 1024 * 1024
+        self.audio_append_chunk_bytes = 48000  # 1 s of 24 kHz pcm16 per input_audio_buffer.append
+        self.control_wait_warning_ms = 50
+        self.budget_window_seconds = 60
+        self.token_budget_per_window = None  # Local token budget per window, None to rely on server limits only
+        self.request_budget_per_window = None
+        self.default_response_tokens = 1000  # Token estimate per utterance until usage has been observed
+        self.max_queued_utterances = 3
+        self.context_token_budget = 6000  # Prune the conversation above this many tokens, None to disable
+        self.context_prune_mode = 'summarize'  # 'summarize' pruned items into one system item, or just 'delete'
+        self.context_keep_recent_items = 4
+        self.context_summary_max_chars = 1500
+        self.audio_tokens_per_second = 10  # Rough input token cost of user audio
+        self.speculative_mode = False  # Request a response on a short pause, cancel it if speech resumes
+        self.speculative_pause_ms = 240
+        self.speculative_hangover_ms = 700
+        self.speculative_resume_frames = 2  # Consecutive speech frames that count as the speaker continuing
+        self.connection_pool_size = 4  # Realtime connections kept open by ConnectionPool
+        self.connection_max_age_seconds = 540  # Recycled before OpenAIClient's own 10-minute reset and the 15-minute limit
+        self.connection_health_interval = 30  # Seconds between health checks of idle connections
+        self.connection_health_timeout = 5
+        self.metrics_enabled = True  # Serve Prometheus metrics next to the WebSocket server
+        self.metrics_host = 'localhost'
+        self.metrics_port = 8001
+        self.replay_buffer_max_events = 1000  # Recent frontend messages kept for clients that reconnect
+        self.replay_buffer_max_bytes = 2 * 1024 * 1024
+        self.playback_enabled = False  # Play response audio on an output device
+        self.playback_device_name = None  # Output device name (or part of it), None for the default
+        self.playback_target_delay_ms = 60  # Audio buffered before playback starts or resumes after an underrun
+        self.playback_max_buffer_ms = 3000  # Oldest audio is dropped beyond this
+        self.playback_frames_per_buffer = 480  # 20 ms at 24 kHz
+        self.playback_barge_in = True  # Stop playback as soon as speech is detected
         self.question_starters = ['what', 'when', 'where', 'who', 'why', 'how', 'can', 'could', 'would', 'will', 'do', 'does', 'is', 'are']
+
+
+VOICES = ('alloy', 'ash', 'ballad', 'coral', 'echo', 'sage', 'shimmer', 'verse')
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+# Settings the frontend may change while running. 'session' settings are sent to the live
+# connection in session.update; 'local' ones are applied in place on the backend.
+LIVE_SETTINGS = {
+    'instructions': ('session', lambda v: isinstance(v, str) and v.strip() != ''),
+    'voice': ('session', lambda v: v in VOICES),
+    'temperature': ('session', lambda v: _is_number(v) and 0.6 <= v <= 1.2),
+    'turn_detection_threshold': ('session', lambda v: _is_number(v) and 0.0 <= v <= 1.0),
+    'turn_detection_prefix_padding_ms': ('session', lambda v: _is_int(v) and 0 <= v <= 2000),
+    'turn_detection_silence_duration_ms': ('session', lambda v: _is_int(v) and 0 <= v <= 5000),
+    'vad_aggressiveness': ('local', lambda v: _is_int(v) and 0 <= v <= 3),
+    'min_buffer_size': ('local', lambda v: _is_int(v) and v > 0 and v % 2 == 0),
+    'cooldown_duration': ('local', lambda v: _is_number(v) and v >= 0),
+}
+
+
+def validate_live_settings(changes):
+    valid, errors = {}, {}
+    for name, value in changes.items():
+        if name not in LIVE_SETTINGS:
+            errors[name] = "not a live setting"
+        elif not LIVE_SETTINGS[name][1](value):
+            errors[name] = f"invalid value {value!r}"
+        else:
+            valid[name] = value
+    return valid, errors
@@ -0,0 +1,160 @@
+import asyncio
+import contextlib
+import time
+from common_logging import setup_logging
+import metrics
+from openai_client import OpenAIClient
+
+
+class ConnectionPool:
+    def __init__(self, config, size=None, client_factory=OpenAIClient):
+        self.config = config
+        self.size = size or config.connection_pool_size
+        self.max_age = config.connection_max_age_seconds
+        self.health_interval = config.connection_health_interval
+        metrics.registry.register_collector('connection_pool', "ConnectionPool.stats()", self.stats)
+        self.health_timeout = config.connection_health_timeout
+        self.logger = setup_logging('connection_pool')
+        self.clients = [client_factory(config) for _ in range(self.size)]
+        self._idle = None
+        self._health_task = None
+
+        self.started_at = None
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.leases = 0
+        self.lease_wait_total_ms = 0.0
+        self.lease_wait_max_ms = 0.0
+        self.recycled = 0
+        self.failed_checks = 0
+        self._busy_seconds = 0.0
+        self._busy_since = None
+
+    def register_event_consumer(self, *event_types):
+        for client in self.clients:
+            client.register_event_consumer(*event_types)
+
+    async def start(self):
+        # Each connect() sends session.update, so leased connections are ready for audio straight away
+        started = time.perf_counter()
+        self._idle = asyncio.Queue()
+        results = await asyncio.gather(*(client.connect() for client in self.clients), return_exceptions=True)
+        for client, result in zip(self.clients, results):
+            if isinstance(result, Exception):
+                self.logger.error(f"Pool connection failed to open, it will be retried on lease: {result}")
+            self._idle.put_nowait(client)
+        self.started_at = time.monotonic()
+        self._health_task = asyncio.create_task(self.check_idle_connections())
+        self.logger.info(f"Opened {self.size} connections in {time.perf_counter() - started:.2f} s")
+
+    async def acquire(self):
+        started = time.monotonic()
+        client = await self._idle.get()
+        wait_ms = (time.monotonic() - started) * 1000
+        try:
+            if not await self.is_healthy(client):
+                await self.recycle(client)
+        except Exception:
+            self._idle.put_nowait(client)
+            raise
+
+        self.leases += 1
+        self.lease_wait_total_ms += wait_ms
+        self.lease_wait_max_ms = max(self.lease_wait_max_ms, wait_ms)
+        self._set_in_use(self.in_use + 1)
+        if wait_ms > 100:
+            self.logger.debug(f"Waited {wait_ms:.0f} ms for a pool connection")
+        return client
+
+    def release(self, client):
+        self._set_in_use(self.in_use - 1)
+        self._idle.put_nowait(client)
+
+    @contextlib.asynccontextmanager
+    async def lease(self):
+        client = await self.acquire()
+        try:
+            yield client
+        except Exception:
+            # The lease failed mid-request, so late events of its response (deltas, response.done)
+            # may still arrive. Reconnect rather than hand them to the next lease.
+            await self.discard(client)
+            raise
+        finally:
+            self.release(client)
+
+    async def discard(self, client):
+        try:
+            await self.recycle(client)
+        except Exception as e:
+            # Left disconnected; the health check on the next acquire reconnects it
+            self.logger.error(f"Error recycling pool connection after a failed lease: {e}")
+
+    async def is_healthy(self, client):
+        if not client.is_connected():
+            return False
+        if time.time() - client.last_reset_time > self.max_age:
+            return False
+        try:
+            pong = await client.websocket.ping()
+            await asyncio.wait_for(pong, self.health_timeout)
+            return True
+        except Exception as e:
+            self.failed_checks += 1
+            self.logger.warning(f"Pool connection failed its health check: {e}")
+            return False
+
+    async def recycle(self, client):
+        await client.close_connection()
+        await client.connect()
+        self.recycled += 1
+        self.logger.info("Recycled pool connection")
+
+    async def check_idle_connections(self):
+        # Idle connections are checked (and recycled) here so leases rarely pay for a reconnect
+        try:
+            while True:
+                await asyncio.sleep(self.health_interval)
+                for _ in range(self._idle.qsize()):
+                    client = self._idle.get_nowait()
+                    try:
+                        if not await self.is_healthy(client):
+                            await self.recycle(client)
+                    except Exception as e:
+                        self.logger.error(f"Error recycling pool connection: {e}")
+                    finally:
+                        self._idle.put_nowait(client)
+        except asyncio.CancelledError:
+            self.logger.info("Pool health checks stopped")
+
+    def _set_in_use(self, in_use):
+        now = time.monotonic()
+        if self._busy_since is not None:
+            self._busy_seconds += (now - self._busy_since) * self.in_use
+        self._busy_since = now
+        self.in_use = in_use
+        self.peak_in_use = max(self.peak_in_use, in_use)
+
+    def stats(self):
+        elapsed = time.monotonic() - self.started_at if self.started_at else 0
+        busy = self._busy_seconds
+        if self._busy_since is not None:
+            busy += (time.monotonic() - self._busy_since) * self.in_use
+        return {
+            'size': self.size,
+            'in_use': self.in_use,
+            'peak_in_use': self.peak_in_use,
+            'utilization': round(busy / (elapsed * self.size), 3) if elapsed else 0.0,
+            'leases': self.leases,
+            'lease_wait_avg_ms': round(self.lease_wait_total_ms / self.leases, 1) if self.leases else 0.0,
+            'lease_wait_max_ms': round(self.lease_wait_max_ms, 1),
+            'recycled': self.recycled,
+            'failed_checks': self.failed_checks,
+        }
+
+    async def close(self):
+        if self._health_task:
+            self._health_task.cancel()
+            self._health_task = None
+        await asyncio.gather(*(client.close_connection() for client in self.clients), return_exceptions=True)
+        self.logger.info(f"Closed connection pool: {self.stats()}")
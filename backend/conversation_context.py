@@ -0,0 +1,151 @@
+import os
+from collections import OrderedDict, deque
+from common_logging import setup_logging
+
+SUMMARY_PREFIX = "Summary of the earlier conversation:"
+CHARS_PER_TOKEN = 4
+SUMMARY_LINE_CHARS = 200
+
+
+class ConversationContext:
+    def __init__(self, config, send_event):
+        self.send_event = send_event
+        self.token_budget = config.context_token_budget  # None disables pruning
+        self.prune_mode = config.context_prune_mode  # 'summarize' or 'delete'
+        self.keep_recent_items = config.context_keep_recent_items
+        self.summary_max_chars = config.context_summary_max_chars
+        self.audio_tokens_per_second = config.audio_tokens_per_second
+        self.logger = setup_logging('conversation_context')
+
+        # item_id -> {'role', 'text', 'tokens'} in conversation order
+        self.items = OrderedDict()
+        self.context_tokens = 0
+        self.summary = ""
+        self.summary_item_id = None
+        self.pending_audio_seconds = deque()
+
+    def note_audio_sent(self, num_bytes, bytes_per_second=48000):
+        # The next user item created by the server holds this audio; remember its length
+        self.pending_audio_seconds.append(num_bytes / bytes_per_second)
+
+    async def observe(self, event):
+        event_type = event.get('type')
+        if event_type == 'conversation.item.created':
+            self._track_item(event.get('item', {}))
+        elif event_type == 'conversation.item.deleted':
+            self.items.pop(event.get('item_id'), None)
+        elif event_type == 'response.done':
+            response = event.get('response', {})
+            self._update_from_response(response)
+            if self.token_budget is not None and self.context_tokens > self.token_budget:
+                await self.prune()
+
+    def _track_item(self, item):
+        item_id = item.get('id')
+        if not item_id or item.get('type') != 'message':
+            return
+        text = self._item_text(item)
+        if item_id == self.summary_item_id:
+            tokens = len(text) // CHARS_PER_TOKEN
+        elif item.get('role') == 'user' and self.pending_audio_seconds:
+            tokens = int(self.pending_audio_seconds.popleft() * self.audio_tokens_per_second)
+        else:
+            tokens = len(text) // CHARS_PER_TOKEN
+        self.items[item_id] = {'role': item.get('role'), 'text': text, 'tokens': tokens}
+
+    def _update_from_response(self, response):
+        usage = response.get('usage') or {}
+        outputs = [item for item in response.get('output', []) if item.get('id') in self.items]
+        for item in outputs:
+            record = self.items[item['id']]
+            record['text'] = self._item_text(item) or record['text']
+            record['tokens'] = usage.get('output_tokens', 0) // len(outputs)
+        if usage:
+            # input_tokens covers the whole conversation the response was generated from
+            self.context_tokens = usage.get('input_tokens', 0) + usage.get('output_tokens', 0)
+
+    def _item_text(self, item):
+        parts = []
+        for content in item.get('content') or []:
+            text = content.get('transcript') or content.get('text')
+            if text:
+                parts.append(text)
+        return " ".join(parts).strip()
+
+    async def prune(self):
+        excess = self.context_tokens - self.token_budget
+        candidates = [item_id for item_id in list(self.items)[:-self.keep_recent_items or None]
+                      if item_id != self.summary_item_id]
+        pruned = []
+        for item_id in candidates:
+            if excess <= 0:
+                break
+            pruned.append((item_id, self.items.pop(item_id)))
+            excess -= pruned[-1][1]['tokens']
+        if not pruned:
+            return
+
+        for item_id, _ in pruned:
+            await self.send_event({
+                "event_id": self._event_id(),
+                "type": "conversation.item.delete",
+                "item_id": item_id
+            })
+        freed = sum(record['tokens'] for _, record in pruned)
+        self.context_tokens -= freed
+        self.logger.info(f"Pruned {len(pruned)} conversation items (~{freed} tokens), "
+                         f"context now ~{self.context_tokens} tokens")
+
+        if self.prune_mode == 'summarize':
+            self._merge_into_summary([record for _, record in pruned])
+            await self._replace_summary_item()
+
+    def _merge_into_summary(self, records):
+        lines = [self.summary] if self.summary else []
+        for record in records:
+            # User audio items carry no transcript unless input transcription is enabled
+            if record['text']:
+                speaker = 'User' if record['role'] == 'user' else 'Assistant'
+                lines.append(f"{speaker}: {record['text'][:SUMMARY_LINE_CHARS]}")
+        summary = "\n".join(lines)
+        # Keep the most recent part of the summary when it outgrows its budget
+        self.summary = summary[-self.summary_max_chars:]
+
+    async def _replace_summary_item(self):
+        if self.summary_item_id:
+            await self.send_event({
+                "event_id": self._event_id(),
+                "type": "conversation.item.delete",
+                "item_id": self.summary_item_id
+            })
+            self.items.pop(self.summary_item_id, None)
+        if not self.summary:
+            self.summary_item_id = None
+            return
+        self.summary_item_id = f"ctx_summary_{os.urandom(4).hex()}"
+        await self.send_event({
+            "event_id": self._event_id(),
+            "type": "conversation.item.create",
+            "previous_item_id": "root",
+            "item": {
+                "id": self.summary_item_id,
+                "type": "message",
+                "role": "system",
+                "content": [{"type": "input_text", "text": f"{SUMMARY_PREFIX}\n{self.summary}"}]
+            }
+        })
+
+    async def reseed(self):
+        # A new session starts with an empty conversation: carry over a compact summary instead
+        records = [record for item_id, record in self.items.items() if item_id != self.summary_item_id]
+        self._merge_into_summary(records)
+        self.items.clear()
+        self.context_tokens = 0
+        self.summary_item_id = None
+        self.pending_audio_seconds.clear()
+        if self.summary:
+            await self._replace_summary_item()
+            self.logger.info(f"Re-seeded new session with a {len(self.summary)} character summary")
+
+    def _event_id(self):
+        return f"event_{os.urandom(3).hex()}"
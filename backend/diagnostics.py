@@ -0,0 +1,148 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from common_logging import setup_logging
+
+LAG_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000)
+PROFILE_DIR = os.path.join(os.path.dirname(__file__), 'logs')
+
+
+class LoopLagMonitor:
+    def __init__(self, interval=0.05, threshold_ms=100):
+        self.interval = interval
+        self.threshold_ms = threshold_ms
+        self.logger = setup_logging('loop_monitor')
+        self.histogram = [0] * (len(LAG_BUCKETS_MS) + 1)
+        self.samples = 0
+        self.max_lag_ms = 0.0
+        self._heartbeat = time.monotonic()
+        self._loop_thread_id = None
+        self._probe_task = None
+        self._watchdog = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        if self._probe_task is not None:
+            return
+        # Must be called from the event loop thread; the watchdog samples this thread's stack
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stopped.clear()
+        self._probe_task = asyncio.create_task(self._probe())
+        self._watchdog = threading.Thread(target=self._watch, name='loop-lag-watchdog', daemon=True)
+        self._watchdog.start()
+        self.logger.info(f"Loop lag monitor started (interval {self.interval * 1000:.0f} ms, "
+                         f"threshold {self.threshold_ms} ms)")
+
+    def stop(self):
+        self._stopped.set()
+        if self._probe_task:
+            self._probe_task.cancel()
+            self._probe_task = None
+
+    def record(self, lag_ms):
+        self.samples += 1
+        self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+        for i, bound in enumerate(LAG_BUCKETS_MS):
+            if lag_ms <= bound:
+                self.histogram[i] += 1
+                return
+        self.histogram[-1] += 1
+
+    async def _probe(self):
+        try:
+            while True:
+                started = time.monotonic()
+                await asyncio.sleep(self.interval)
+                now = time.monotonic()
+                self._heartbeat = now
+                lag_ms = (now - started - self.interval) * 1000
+                self.record(lag_ms)
+                if lag_ms > self.threshold_ms:
+                    self.logger.warning(f"Event loop lagged {lag_ms:.0f} ms")
+        except asyncio.CancelledError:
+            self.logger.info("Loop lag monitor stopped")
+
+    def _watch(self):
+        # Runs in its own thread so it can catch the loop while it is still blocked
+        reported = False
+        while not self._stopped.wait(self.interval):
+            stalled_ms = (time.monotonic() - self._heartbeat - self.interval) * 1000
+            if stalled_ms <= self.threshold_ms:
+                reported = False
+                continue
+            if reported:
+                continue
+            reported = True
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame else "(stack unavailable)\n"
+            self.logger.warning(f"Event loop blocked for {stalled_ms:.0f} ms, loop thread stack:\n{stack}")
+
+    def stats(self):
+        labels = [f"<={bound}ms" for bound in LAG_BUCKETS_MS] + [f">{LAG_BUCKETS_MS[-1]}ms"]
+        return {
+            'samples': self.samples,
+            'max_ms': round(self.max_lag_ms, 1),
+            'histogram': dict(zip(labels, self.histogram)),
+        }
+
+
+class SamplingProfiler:
+    def __init__(self, interval=0.005, output_dir=PROFILE_DIR):
+        self.interval = interval
+        self.output_dir = output_dir
+        self.logger = setup_logging('profiler')
+        self.counts = Counter()
+        self.started_at = None
+        self._target_thread_id = None
+        self._thread = None
+        self._stopped = threading.Event()
+
+    @property
+    def is_running(self):
+        return self._thread is not None
+
+    def start(self, thread_id=None):
+        if self.is_running:
+            return False
+        self._target_thread_id = thread_id or threading.get_ident()
+        self.counts = Counter()
+        self.started_at = time.time()
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._sample, name='sampling-profiler', daemon=True)
+        self._thread.start()
+        self.logger.info(f"Sampling profiler started ({self.interval * 1000:.0f} ms interval)")
+        return True
+
+    def _sample(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self._target_thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.counts[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        # Writes collapsed stacks ("frame;frame;frame count"), the input format of flamegraph.pl and speedscope
+        if not self.is_running:
+            return None, 0
+        self._stopped.set()
+        self._thread.join()
+        self._thread = None
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir, time.strftime('profile-%Y%m%d-%H%M%S.folded',
+                                                           time.localtime(self.started_at)))
+        with open(path, 'w') as f:
+            for stack, count in self.counts.most_common():
+                f.write(f"{stack} {count}\n")
+        samples = sum(self.counts.values())
+        self.logger.info(f"Sampling profiler stopped, {samples} samples written to {path}")
+        return path, samples
@@ -0,0 +1,100 @@
+import time
+from collections import deque
+
+
+class DispatchScheduler:
+    def __init__(self, config, clock=time.monotonic):
+        self.clock = clock
+        self.window_seconds = config.budget_window_seconds
+        self.token_budget = config.token_budget_per_window  # None for no local limit
+        self.request_budget = config.request_budget_per_window  # None for no local limit
+        self.default_response_tokens = config.default_response_tokens
+
+        # Latest limits reported by the server in rate_limits.updated, keyed by limit name
+        self.server_limits = {}
+        self.request_times = deque()
+        self.token_usage = deque()  # (timestamp, total_tokens) per completed response
+        self.recent_response_tokens = deque(maxlen=10)
+
+    def update_rate_limits(self, rate_limits):
+        now = self.clock()
+        for limit in rate_limits:
+            self.server_limits[limit['name']] = {
+                'limit': limit.get('limit'),
+                'remaining': limit.get('remaining'),
+                'reset_at': now + limit.get('reset_seconds', 0),
+            }
+
+    def record_request(self):
+        self.request_times.append(self.clock())
+
+    def record_usage(self, usage):
+        tokens = usage.get('total_tokens', 0)
+        if not tokens:
+            return
+        self.token_usage.append((self.clock(), tokens))
+        self.recent_response_tokens.append(tokens)
+
+    def estimated_tokens(self):
+        if not self.recent_response_tokens:
+            return self.default_response_tokens
+        return sum(self.recent_response_tokens) / len(self.recent_response_tokens)
+
+    def _prune(self, now):
+        horizon = now - self.window_seconds
+        while self.request_times and self.request_times[0] <= horizon:
+            self.request_times.popleft()
+        while self.token_usage and self.token_usage[0][0] <= horizon:
+            self.token_usage.popleft()
+
+    def _server_delay(self, name, needed, now):
+        limit = self.server_limits.get(name)
+        if not limit or limit['remaining'] is None or now >= limit['reset_at']:
+            return 0.0
+        return limit['reset_at'] - now if limit['remaining'] < needed else 0.0
+
+    def delay_before_dispatch(self):
+        # Seconds to hold the next utterance so it stays within server and local budgets
+        now = self.clock()
+        self._prune(now)
+        estimate = self.estimated_tokens()
+        delays = [
+            0.0,
+            self._server_delay('requests', 1, now),
+            self._server_delay('tokens', estimate, now),
+        ]
+
+        if self.request_budget is not None and len(self.request_times) >= self.request_budget:
+            delays.append(self.request_times[0] + self.window_seconds - now)
+
+        if self.token_budget is not None:
+            used = sum(tokens for _, tokens in self.token_usage)
+            # Wait until enough of the window's usage has expired to fit the estimate
+            for timestamp, tokens in self.token_usage:
+                if used + estimate <= self.token_budget:
+                    break
+                used -= tokens
+                delays.append(timestamp + self.window_seconds - now)
+
+        return max(delays)
+
+    def state(self):
+        now = self.clock()
+        self._prune(now)
+        return {
+            'window_seconds': self.window_seconds,
+            'requests_in_window': len(self.request_times),
+            'request_budget': self.request_budget,
+            'tokens_in_window': sum(tokens for _, tokens in self.token_usage),
+            'token_budget': self.token_budget,
+            'estimated_tokens': round(self.estimated_tokens()),
+            'server_limits': {
+                name: {
+                    'limit': limit['limit'],
+                    'remaining': limit['remaining'],
+                    'reset_seconds': round(max(0.0, limit['reset_at'] - now), 1),
+                }
+                for name, limit in self.server_limits.items()
+            },
+            'dispatch_delay': round(self.delay_before_dispatch(), 1),
+        }
@@ -0,0 +1,65 @@
+import json
+import re
+
+# Realtime API events are serialized with "type" as the first key, so the event type
+# can be read from the head of the frame without decoding the (often large) payload.
+_TYPE_PREFIX = re.compile(r'\s*\{\s*"type"\s*:\s*"([\w.]+)"')
+_TYPE_PREFIX_BYTES = re.compile(rb'\s*\{\s*"type"\s*:\s*"([\w.]+)"')
+_TYPE_SCAN_LIMIT = 128
+
+
+# An inbound event kept as the undecoded frame; parsed only if someone asks for it
+class RawEvent:
+    __slots__ = ('type', 'raw', '_parsed')
+
+    def __init__(self, event_type, raw):
+        self.type = event_type
+        self.raw = raw
+        self._parsed = None
+
+    def parse(self):
+        if self._parsed is None:
+            self._parsed = json.loads(self.raw)
+        return self._parsed
+
+    def raw_text(self):
+        return self.raw.decode('utf-8') if isinstance(self.raw, bytes) else self.raw
+
+    def __len__(self):
+        return len(self.raw)
+
+    def __repr__(self):
+        return f"RawEvent(type={self.type!r}, size={len(self.raw)})"
+
+
+class EventDecoder:
+    def __init__(self, consumers=()):
+        self.consumers = set(consumers)
+        self.stats = {'parsed': 0, 'deferred': 0, 'fallback': 0}
+
+    def register(self, *event_types):
+        self.consumers.update(event_types)
+
+    def unregister(self, *event_types):
+        self.consumers.difference_update(event_types)
+
+    def peek_type(self, frame):
+        pattern = _TYPE_PREFIX_BYTES if isinstance(frame, bytes) else _TYPE_PREFIX
+        match = pattern.match(frame, 0, _TYPE_SCAN_LIMIT)
+        if match is None:
+            return None
+        event_type = match.group(1)
+        return event_type.decode('ascii') if isinstance(event_type, bytes) else event_type
+
+    def decode(self, frame):
+        # Returns a dict for event types with a registered consumer, a RawEvent otherwise
+        event_type = self.peek_type(frame)
+        if event_type is None:
+            # Unexpected layout: fall back to a full parse so nothing is misrouted
+            self.stats['fallback'] += 1
+            return json.loads(frame)
+        if event_type in self.consumers:
+            self.stats['parsed'] += 1
+            return json.loads(frame)
+        self.stats['deferred'] += 1
+        return RawEvent(event_type, frame)
@@ -0,0 +1,54 @@
+import json
+import struct
+
+# Negotiated per client as a WebSocket subprotocol; clients that offer neither get JSON
+JSON_SUBPROTOCOL = 'teleprompter.json.v1'
+BINARY_SUBPROTOCOL = 'teleprompter.binary.v1'
+
+# Binary frames are a type byte and a 4-byte big-endian sequence number (0 for messages that
+# are not kept for replay), followed by the payload. Message types without a binary form are
+# still sent to binary clients as JSON text frames.
+HEADER = struct.Struct('>BI')
+
+FRAME_TRANSCRIPT = 0x01  # UTF-8 transcript delta
+FRAME_RESPONSE = 0x02  # UTF-8 JSON of the API event, without the {"type": "response", "data": ...} wrapper
+FRAME_STATUS = 0x03  # Flags byte (bit 0 is_listening, bit 1 is_paused), then the UTF-8 status
+
+STATUS_LISTENING = 0x01
+STATUS_PAUSED = 0x02
+
+
+def encode_transcript(delta, seq=0):
+    return HEADER.pack(FRAME_TRANSCRIPT, seq) + delta.encode('utf-8')
+
+
+def encode_response(event_text, seq=0):
+    return HEADER.pack(FRAME_RESPONSE, seq) + event_text.encode('utf-8')
+
+
+def encode_status(status, is_listening, is_paused, seq=0):
+    flags = (STATUS_LISTENING if is_listening else 0) | (STATUS_PAUSED if is_paused else 0)
+    return HEADER.pack(FRAME_STATUS, seq) + bytes((flags,)) + status.encode('utf-8')
+
+
+def decode_frame(frame):
+    # Returns the same dict a JSON client would have received
+    kind, seq = HEADER.unpack_from(frame)
+    payload = frame[HEADER.size:]
+    if kind == FRAME_TRANSCRIPT:
+        message = {'type': 'transcript', 'delta': payload.decode('utf-8')}
+    elif kind == FRAME_RESPONSE:
+        message = {'type': 'response', 'data': json.loads(payload)}
+    elif kind == FRAME_STATUS:
+        flags = payload[0]
+        message = {
+            'type': 'status',
+            'status': payload[1:].decode('utf-8'),
+            'is_listening': bool(flags & STATUS_LISTENING),
+            'is_paused': bool(flags & STATUS_PAUSED),
+        }
+    else:
+        raise ValueError(f"Unknown frame type {kind:#04x}")
+    if seq:
+        message['seq'] = seq
+    return message
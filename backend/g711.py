@@ -0,0 +1,52 @@
+import numpy as np
+
+# G.711 companding of 16-bit PCM to 8-bit codes (ITU-T G.711, as in the reference g711.c). Every
+# possible sample is encoded once into a 65536-entry table, so encoding a buffer is one vectorized
+# lookup. The Realtime API takes G.711 input at 8 kHz.
+
+G711_RATE = 8000
+PCM16_RATE = 24000
+
+_ULAW_SEGMENT_ENDS = np.array([0x3F, 0x7F, 0xFF, 0x1FF, 0x3FF, 0x7FF, 0xFFF, 0x1FFF])
+_ALAW_SEGMENT_ENDS = np.array([0x1F, 0x3F, 0x7F, 0xFF, 0x1FF, 0x3FF, 0x7FF, 0xFFF])
+_ALL_SAMPLES = np.arange(65536, dtype=np.uint32).astype(np.uint16).view(np.int16).astype(np.int32)
+
+
+def _ulaw_table():
+    value = _ALL_SAMPLES >> 2  # 14-bit magnitude
+    mask = np.where(value < 0, 0x7F, 0xFF)
+    value = np.minimum(np.abs(value), 8159) + 33  # Clip, then add the bias
+    segment = np.searchsorted(_ULAW_SEGMENT_ENDS, value)
+    code = (segment << 4) | ((value >> (segment + 1)) & 0x0F)
+    return (np.where(segment >= 8, 0x7F, code) ^ mask).astype(np.uint8)
+
+
+def _alaw_table():
+    value = _ALL_SAMPLES >> 3  # 13-bit
+    mask = np.where(value >= 0, 0xD5, 0x55)
+    value = np.where(value >= 0, value, -value - 1)
+    segment = np.searchsorted(_ALAW_SEGMENT_ENDS, value)
+    quantized = np.where(segment < 2, value >> 1, value >> np.maximum(segment, 1)) & 0x0F
+    code = (segment << 4) | quantized
+    return (np.where(segment >= 8, 0x7F, code) ^ mask).astype(np.uint8)
+
+
+_ULAW = _ulaw_table()
+_ALAW = _alaw_table()
+
+
+def encode_ulaw(pcm):
+    # pcm is little-endian 16-bit mono; returns one byte per sample
+    return _ULAW[np.frombuffer(pcm, dtype='<u2')].tobytes()
+
+
+def encode_alaw(pcm):
+    return _ALAW[np.frombuffer(pcm, dtype='<u2')].tobytes()
+
+
+# Realtime API input_audio_format -> (sample rate the audio must be resampled to, encoder or None for pcm16)
+INPUT_FORMATS = {
+    'pcm16': (PCM16_RATE, None),
+    'g711_ulaw': (G711_RATE, encode_ulaw),
+    'g711_alaw': (G711_RATE, encode_alaw),
+}
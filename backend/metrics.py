@@ -0,0 +1,245 @@
+import asyncio
+import bisect
+import math
+from common_logging import setup_logging
+
+PREFIX = 'teleprompter_'
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'  # Prometheus text exposition format
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+class _CounterValue:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class _GaugeValue(_CounterValue):
+    __slots__ = ()
+
+    def set(self, value):
+        self.value = value
+
+
+class _HistogramValue:
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # Per bucket, made cumulative when rendered
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metric:
+    """A metric family; label values select a child, which is what gets updated.
+
+    Updates are plain attribute arithmetic with no locking, so they are meant to come from the
+    event loop thread. Metrics without labels can be updated on the family itself.
+    """
+
+    kind = None
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = PREFIX + name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._children = {}
+        if not self.label_names:
+            self._default = self.labels()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.label_names):
+                raise ValueError(f"{self.name} takes labels {self.label_names}, got {values}")
+            child = self._children[values] = self._new_child()
+        return child
+
+    def samples(self):
+        for values, child in sorted(self._children.items()):
+            yield self.name, _format_labels(self.label_names, values), child.value
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def _new_child(self):
+        return _CounterValue()
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def _new_child(self):
+        return _GaugeValue()
+
+    def set(self, value):
+        self._default.set(value)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.bounds = tuple(sorted(buckets))
+        super().__init__(name, help_text, labels)
+
+    def _new_child(self):
+        return _HistogramValue(self.bounds)
+
+    def observe(self, value):
+        self._default.observe(value)
+
+    def samples(self):
+        for values, child in sorted(self._children.items()):
+            cumulative = 0
+            for bound, count in zip(self.bounds + (math.inf,), child.counts):
+                cumulative += count
+                yield (self.name + '_bucket',
+                       _format_labels(self.label_names, values, [('le', _format_value(bound))]), cumulative)
+            yield self.name + '_sum', _format_labels(self.label_names, values), child.sum
+            yield self.name + '_count', _format_labels(self.label_names, values), child.count
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = {}
+        self.collectors = {}
+        self.logger = setup_logging('metrics')
+
+    def _add(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help_text, labels=()):
+        return self._add(Counter(name, help_text, labels))
+
+    def gauge(self, name, help_text, labels=()):
+        return self._add(Gauge(name, help_text, labels))
+
+    def histogram(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(name, help_text, labels, buckets))
+
+    def register_collector(self, name, help_text, collect):
+        # collect() returns a component's existing stats dict; it is only called on scrape, and every
+        # number in it (nested keys joined with '_') is exported as PREFIX + name + {stat="..."}.
+        # Registering a name again replaces the earlier collector.
+        self.collectors[PREFIX + name] = (help_text, collect)
+
+    def _flatten(self, stats, prefix=''):
+        for key, value in stats.items():
+            if isinstance(value, dict):
+                yield from self._flatten(value, f"{prefix}{key}_")
+            elif isinstance(value, (int, float)):  # Strings and None are skipped, booleans become 0/1
+                yield f"{prefix}{key}", float(value)
+
+    def render(self):
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(f"{name}{labels} {_format_value(value)}" for name, labels, value in metric.samples())
+        for name, (help_text, collect) in self.collectors.items():
+            try:
+                stats = collect()
+            except Exception as e:
+                self.logger.error(f"Metrics collector {name} failed: {e}")
+                continue
+            if not stats:
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.extend(f"{name}{_format_labels(('stat',), (key,))} {_format_value(value)}"
+                         for key, value in self._flatten(stats))
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsServer:
+    """Serves the registry at GET /metrics over plain HTTP/1.0, on the event loop."""
+
+    def __init__(self, registry, host='localhost', port=8001):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.server = None
+        self.logger = setup_logging('metrics')
+
+    async def start(self):
+        # Metrics are optional; a busy port must not stop the assistant from starting
+        try:
+            self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        except OSError as e:
+            self.logger.warning(f"Metrics not served, could not listen on {self.host}:{self.port}: {e}")
+            return
+        self.logger.info(f"Metrics served on http://{self.host}:{self.port}/metrics")
+
+    async def handle(self, reader, writer):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+            while (await asyncio.wait_for(reader.readline(), timeout=5)) not in (b'\r\n', b'\n', b''):
+                pass  # Headers are not needed
+            parts = request_line.decode('latin-1').split()
+            if len(parts) >= 2 and parts[0] == 'GET' and parts[1].split('?')[0] == '/metrics':
+                status, content_type, body = '200 OK', CONTENT_TYPE, self.registry.render().encode('utf-8')
+            else:
+                status, content_type, body = '404 Not Found', 'text/plain', b'Not found\n'
+            writer.write(f"HTTP/1.0 {status}\r\nContent-Type: {content_type}\r\n"
+                         f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode('latin-1') + body)
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError) as e:
+            self.logger.debug(f"Metrics request failed: {e}")
+        finally:
+            writer.close()
+
+    async def stop(self):
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+            self.logger.info("Metrics server stopped")
+
+
+# The process-wide registry and the pipeline metrics updated by the components
+registry = MetricsRegistry()
+
+FRAMES_READ = registry.counter('capture_frames_read_total', "Captured frames read by the assistant loop")
+VAD_FRAMES = registry.counter('vad_frames_total', "Frames by raw VAD decision", labels=['result'])
+UTTERANCES_SENT = registry.counter('api_utterances_sent_total', "Utterances sent to the Realtime API")
+AUDIO_BYTES_SENT = registry.counter('api_audio_bytes_sent_total',
+                                    "Audio bytes sent to the Realtime API, encoded but before base64")
+RECONNECTS = registry.counter('api_reconnects_total', "Realtime API connections replaced by a new one")
+INBOUND_EVENTS = registry.counter('api_inbound_events_total', "Realtime API events received", labels=['type'])
+STAGE_LATENCY = registry.histogram('stage_latency_seconds', "Time spent per pipeline stage", labels=['stage'])
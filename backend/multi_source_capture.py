@@ -0,0 +1,227 @@
+import numpy as np
+from audio_capture import AudioCapture
+from audio_recorder import AudioRecorder
+from common_logging import setup_logging
+from vad_utils import update_speech_count
+
+# ADC timestamps of consecutive chunks jitter by a sample or two; only larger jumps are gaps or overlaps
+ALIGNMENT_TOLERANCE_SAMPLES = 2
+# Streams opened one after another on a shared clock start well within this of each other. A larger
+# gap means the devices have separate time bases, so the source's clock is offset onto the timeline.
+MAX_SKEW_SECONDS = 0.5
+# Longer holes in a source's timestamps are clock jumps rather than lost audio, and are not padded
+MAX_GAP_SECONDS = 10
+
+
+class MultiSourceCapture:
+    """Captures several input devices at once and presents them to the assistant as one AudioCapture.
+
+    Every source is its own AudioCapture with its own PortAudio callback stream, queue and VAD.
+    Chunks are placed on a shared timeline by their ADC timestamps and mixed to mono for the API.
+    """
+
+    def __init__(self, config):
+        specs = config.capture_sources
+        self.names = [spec.get('name', f"source{i}") for i, spec in enumerate(specs)]
+        self.sources = [AudioCapture(config, device_name=spec.get('device'), remember_device=(i == 0), record=False)
+                        for i, spec in enumerate(specs)]
+        self.gains = np.array([spec.get('gain', 1.0) for spec in specs], dtype=np.float32)[:, None]
+        primary = self.sources[0]
+        self.format = primary.format
+        self.rate = primary.rate
+        self.channels = 1  # read_audio returns the mono mix
+        self.bytes_per_sample = primary.bytes_per_sample
+        self.frame_duration_ms = primary.frame_duration_ms
+        self.chunk = primary.chunk
+        self.mix_mode = config.capture_mix_mode
+        self.energy_floor = config.source_vad_energy_floor
+        self.max_skew = int(MAX_SKEW_SECONDS * self.rate)
+        self.max_gap = int(MAX_GAP_SECONDS * self.rate)
+        self.logger = setup_logging('multi_source_capture')
+
+        self.gate_open = True
+        self.last_frame_is_speech = False
+        self.speaking = [False] * len(self.sources)
+        self.last_frames = None  # Aligned (sources x chunk) int16 samples of the latest read
+        self.vad_stats = {'vad_runs': 0, 'vad_skipped': 0}
+        self._reset_alignment()
+
+        record_channels = len(self.sources) if self.mix_mode == 'separate' else 1
+        self.recorder = (AudioRecorder(config, self.rate, self.bytes_per_sample, channels=record_channels)
+                         if config.recording_enabled else None)
+        self.logger.info(f"Capturing {len(self.sources)} sources: {', '.join(self.names)} ({self.mix_mode})")
+
+    def _reset_alignment(self):
+        # Per source: samples read but not yet mixed, the timeline position of the first one, the offset
+        # from its ADC clock to the timeline, and whether its timestamps were given up on
+        self.position = None
+        self._pending = [np.zeros(0, dtype=np.int16) for _ in self.sources]
+        self._pending_pos = [None] * len(self.sources)
+        self._offsets = [0] * len(self.sources)
+        self._by_count = [False] * len(self.sources)
+
+    def _align_by_count(self, index, reason):
+        # From here on the source's chunks are taken as contiguous, whatever their timestamps say
+        if not self._by_count[index]:
+            self.logger.warning(f"Source '{self.names[index]}' {reason}, aligning it by sample count")
+            self._by_count[index] = True
+
+    def select_audio_device(self, is_speaker=False, prompt=False):
+        for name, source in zip(self.names, self.sources):
+            self.logger.info(f"Selecting device for source '{name}'")
+            source.select_audio_device(is_speaker=is_speaker, prompt=prompt and source is self.sources[0])
+        return self.sources[0].device_index
+
+    def start_stream(self):
+        for source in self.sources:
+            source.start_stream()
+
+    def stop_stream(self):
+        for source in self.sources:
+            source.stop_stream()
+        self._reset_alignment()
+
+    def close_gate(self):
+        self.gate_open = False
+        for source in self.sources:
+            source.close_gate()
+
+    def open_gate(self):
+        for source in self.sources:
+            source.open_gate()
+        self._reset_alignment()  # Queues were flushed, so the timeline starts over
+        self.gate_open = True
+
+    def reset_vad(self):
+        for source in self.sources:
+            source.reset_vad()
+        self.speaking = [False] * len(self.sources)
+        self.last_frame_is_speech = False
+
+    def set_vad_aggressiveness(self, mode):
+        for source in self.sources:
+            source.set_vad_aggressiveness(mode)
+
+    async def _read_samples(self, index):
+        # Appends the next chunk of one source to its pending samples, placed by its ADC timestamp
+        frame_time, data = await self.sources[index].read_frame()
+        if not data:
+            return False
+        samples = np.frombuffer(data, dtype=np.int16)
+        pending, pending_pos = self._pending[index], self._pending_pos[index]
+        if pending_pos is None:
+            self._pending[index] = samples
+            self._pending_pos[index] = round(frame_time * self.rate) if frame_time is not None else None
+            return True
+        expected = pending_pos + len(pending)
+        position = expected
+        if frame_time is not None and not self._by_count[index]:
+            position = round(frame_time * self.rate) - self._offsets[index]
+            if position - expected > self.max_gap:
+                self.logger.warning(f"Source '{self.names[index]}' clock jumped "
+                                    f"{(position - expected) / self.rate:.0f} s ahead, continuing from its last chunk")
+                self._offsets[index] += position - expected
+                position = expected
+            elif expected - position >= len(samples):
+                # A stream cannot deliver audio it already delivered, so its timestamps are not usable
+                self._align_by_count(index, f"clock went back {(expected - position) / self.rate:.2f} s")
+                position = expected
+        if position - expected > ALIGNMENT_TOLERANCE_SAMPLES:
+            # Audio was lost on this source; keep the others in sync by filling the hole with silence
+            pending = np.concatenate((pending, np.zeros(position - expected, dtype=np.int16)))
+        elif expected - position > ALIGNMENT_TOLERANCE_SAMPLES:
+            samples = samples[expected - position:]
+        self._pending[index] = np.concatenate((pending, samples))
+        return True
+
+    async def _start_timeline(self):
+        for index in range(len(self.sources)):
+            if not await self._read_samples(index):
+                return False
+        known = [pos for pos in self._pending_pos if pos is not None]
+        # Start where every source has audio; sources without timestamps are assumed to start there too
+        self.position = max(known) if known else 0
+        for index, pos in enumerate(self._pending_pos):
+            if pos is None:
+                self._pending_pos[index] = self.position
+            elif self.position - pos > self.max_skew:
+                # Far more than streams opened one after another are apart: the source has its own clock
+                self.logger.warning(f"Source '{self.names[index]}' starts {(self.position - pos) / self.rate:.2f} s "
+                                    f"behind the others, assuming a separate clock")
+                self._offsets[index] = pos - self.position
+                self._pending_pos[index] = self.position
+        return True
+
+    async def _aligned_chunk(self, index):
+        end = self.position + self.chunk
+        reads = 0
+        while self._pending_pos[index] + len(self._pending[index]) < end:
+            if reads > self.max_skew // self.chunk + 1:
+                # Still behind after catching up the largest allowed skew; pad the rest rather than read on
+                self._align_by_count(index, "fell behind the timeline")
+                self._pending_pos[index] = end - len(self._pending[index])
+                break
+            if not await self._read_samples(index):
+                return None
+            reads += 1
+        offset = self.position - self._pending_pos[index]
+        pending = self._pending[index]
+        if offset < 0:  # The source has no audio yet for the start of this chunk
+            pending = np.concatenate((np.zeros(-offset, dtype=np.int16), pending))
+            offset = 0
+        chunk = pending[offset:offset + self.chunk]
+        self._pending[index] = pending[offset + self.chunk:]
+        self._pending_pos[index] = end
+        return chunk
+
+    async def read_audio(self):
+        if not self.gate_open:
+            return b''
+        if self.position is None and not await self._start_timeline():
+            return b''
+
+        chunks = []
+        for index in range(len(self.sources)):
+            chunk = await self._aligned_chunk(index)
+            if chunk is None:
+                return b''
+            chunks.append(chunk)
+        self.position += self.chunk
+        frames = np.vstack(chunks)
+        self.last_frames = frames
+
+        mixed = np.clip((frames * self.gains).sum(axis=0), -32768, 32767).astype(np.int16).tobytes()
+        if self.recorder is not None:
+            self.recorder.write(frames.T.tobytes() if self.mix_mode == 'separate' else mixed)
+        return mixed
+
+    async def is_speech(self, audio_segment):
+        # VAD runs per source on its own aligned chunk (not on the mix), so the remote side is heard
+        # even under the local mic. Quiet sources skip webrtcvad and only decay their smoothing counter.
+        frames = self.last_frames
+        if frames is None:
+            return False
+        rms = np.sqrt(np.mean(np.square(frames, dtype=np.float32), axis=1))
+        any_raw_speech = False
+        for index, source in enumerate(self.sources):
+            if rms[index] < self.energy_floor:
+                source.last_frame_is_speech = False
+                source.speech_frames_count = update_speech_count(source.speech_frames_count, False)
+                speaking = source.speech_frames_count >= source.speech_frames_threshold
+                self.vad_stats['vad_skipped'] += 1
+            else:
+                speaking = await source.is_speech(frames[index].tobytes())
+                self.vad_stats['vad_runs'] += 1
+            if speaking and not self.speaking[index]:
+                self.logger.debug(f"Speech started on source '{self.names[index]}'")
+            self.speaking[index] = speaking
+            any_raw_speech = any_raw_speech or source.last_frame_is_speech
+        self.last_frame_is_speech = any_raw_speech
+        return any(self.speaking)
+
+    def stats(self):
+        return {
+            'sources': {name: source.stats() for name, source in zip(self.names, self.sources)},
+            'speaking': [name for name, speaking in zip(self.names, self.speaking) if speaking],
+            **self.vad_stats,
+        }
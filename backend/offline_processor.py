@@ -0,0 +1,306 @@
+import argparse
+import asyncio
+import functools
+import json
+import mmap
+import os
+import struct
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import webrtcvad
+import websockets
+from pydub import AudioSegment
+
+from common_logging import setup_logging
+from config import Config
+from connection_pool import ConnectionPool
+from g711 import INPUT_FORMATS
+from openai_client import OpenAIClient
+from vad_utils import contains_speech, update_speech_count
+
+VAD_RATES = (8000, 16000, 32000, 48000)
+
+# Same VAD settings as AudioCapture, so offline segments match what live capture would send
+FRAME_DURATION_MS = 30
+SPEECH_FRAMES_THRESHOLD = int(0.1 * 1000 / FRAME_DURATION_MS)
+
+
+def find_pcm_data(mm):
+    # Walks the RIFF chunks; returns (data_offset, data_size, channels, rate) of a 16-bit PCM WAV
+    if mm[0:4] != b'RIFF' or mm[8:12] != b'WAVE':
+        raise ValueError("Not a RIFF/WAVE file")
+    offset = 12
+    fmt = None
+    while offset + 8 <= len(mm):
+        chunk_id = mm[offset:offset + 4]
+        size = struct.unpack('<I', mm[offset + 4:offset + 8])[0]
+        body = offset + 8
+        if chunk_id == b'fmt ':
+            audio_format, channels, rate, _, _, bits = struct.unpack('<HHIIHH', mm[body:body + 16])
+            fmt = (audio_format, channels, rate, bits)
+        elif chunk_id == b'data':
+            if fmt is None:
+                raise ValueError("WAV data chunk comes before its fmt chunk")
+            audio_format, channels, rate, bits = fmt
+            if audio_format != 1 or bits != 16:
+                raise ValueError("Only 16-bit PCM WAV files are supported")
+            # Multi-hour recordings often carry a zero or truncated size; the file length wins
+            size = min(size, len(mm) - body) if size else len(mm) - body
+            return body, size, channels, rate
+        offset = body + size + (size & 1)
+    raise ValueError("WAV file has no data chunk")
+
+
+def mono_view(mm, data_offset, data_size, channels):
+    # Zero-copy int16 view of the first channel
+    frames = data_size // (2 * channels)
+    samples = np.frombuffer(mm, dtype='<i2', count=frames * channels, offset=data_offset)
+    return samples.reshape(-1, channels)[:, 0] if channels > 1 else samples
+
+
+def segment_block(path, start_frame, end_frame, padding_frames, aggressiveness):
+    # Runs in a worker process over one block of the memory-mapped file
+    f = open(path, 'rb')
+    mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        data_offset, data_size, channels, rate = find_pcm_data(mm)
+        samples = mono_view(mm, data_offset, data_size, channels)
+        vad = webrtcvad.Vad(aggressiveness)
+        chunk = int(rate * FRAME_DURATION_MS / 1000)
+        frame_length = chunk * 2
+
+        segments = []
+        count = 0
+        segment_start = None
+        for frame_start in range(start_frame, min(end_frame, len(samples)) - chunk + 1, chunk):
+            audio = samples[frame_start:frame_start + chunk].tobytes()
+            count = update_speech_count(count, contains_speech(vad, audio, rate, frame_length))
+            speaking = count >= SPEECH_FRAMES_THRESHOLD
+            if speaking and segment_start is None:
+                segment_start = max(start_frame, frame_start - padding_frames)
+            elif not speaking and segment_start is not None:
+                segments.append((segment_start, frame_start + chunk))
+                segment_start = None
+        if segment_start is not None:
+            segments.append((segment_start, min(end_frame, len(samples))))
+        del samples  # Release the buffer export before closing the map
+        return segments
+    finally:
+        mm.close()
+        f.close()
+
+
+def merge_segments(segments, merge_gap, min_frames, max_frames):
+    # Joins pieces split at block boundaries, drops blips, and caps the length sent per request
+    merged = []
+    for start, end in sorted(segments):
+        if merged and start - merged[-1][1] <= merge_gap:
+            merged[-1] = (merged[-1][0], max(end, merged[-1][1]))
+        else:
+            merged.append((start, end))
+    result = []
+    for start, end in merged:
+        if end - start < min_frames:
+            continue
+        for piece_start in range(start, end, max_frames):
+            result.append((piece_start, min(end, piece_start + max_frames)))
+    return result
+
+
+class OfflineProcessor:
+    def __init__(self, config, path, output_path, connections=4, processes=None,
+                 block_seconds=300, max_segment_seconds=30, response_timeout=120):
+        self.config = config
+        self.path = path
+        self.output_path = output_path
+        self.segments_path = output_path + '.segments.json'
+        self.connections = connections
+        self.processes = processes or os.cpu_count()
+        self.block_seconds = block_seconds
+        self.max_segment_seconds = max_segment_seconds
+        self.response_timeout = response_timeout
+        self.api_rate = INPUT_FORMATS[config.input_audio_format][0]
+        self.logger = setup_logging('offline_processor', debug_to_console=False)
+
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            _, data_size, self.channels, self.rate = find_pcm_data(mm)
+        if self.rate not in VAD_RATES:
+            raise ValueError(f"Sample rate {self.rate} Hz is not supported by webrtcvad, use one of {VAD_RATES}")
+        self.total_frames = data_size // (2 * self.channels)
+
+    def segment(self):
+        source = {'path': os.path.abspath(self.path), 'size': os.path.getsize(self.path),
+                  'mtime': os.path.getmtime(self.path)}
+        # Reuse the segmentation of an interrupted run so segment IDs stay stable
+        try:
+            with open(self.segments_path) as f:
+                cached = json.load(f)
+            if cached['source'] == source:
+                self.logger.info(f"Reusing {len(cached['segments'])} segments from {self.segments_path}")
+                return [tuple(segment) for segment in cached['segments']]
+        except (OSError, ValueError, KeyError):
+            pass
+
+        started = time.perf_counter()
+        block = int(self.block_seconds * self.rate)
+        padding = int(0.3 * self.rate)
+        blocks = [(start, min(start + block, self.total_frames)) for start in range(0, self.total_frames, block)]
+        with ProcessPoolExecutor(max_workers=self.processes) as pool:
+            futures = [pool.submit(segment_block, self.path, start, end, padding,
+                                   self.config.vad_aggressiveness) for start, end in blocks]
+            pieces = [segment for future in futures for segment in future.result()]
+
+        min_frames = int(self.config.min_buffer_size / 2 * self.rate / self.config.rate)
+        segments = merge_segments(pieces, merge_gap=padding, min_frames=min_frames,
+                                  max_frames=int(self.max_segment_seconds * self.rate))
+        with open(self.segments_path, 'w') as f:
+            json.dump({'source': source, 'segments': segments}, f)
+        self.logger.info(f"Segmented {self.total_frames / self.rate:.0f} s of audio into {len(segments)} segments "
+                         f"using {self.processes} processes in {time.perf_counter() - started:.1f} s")
+        return segments
+
+    def completed_segments(self):
+        done = set()
+        try:
+            with open(self.output_path) as f:
+                for line in f:
+                    try:
+                        done.add(json.loads(line)['segment'])
+                    except (ValueError, KeyError):
+                        pass  # A line cut short by the interruption is simply redone
+        except OSError:
+            pass
+        return done
+
+    def resample(self, samples):
+        audio_segment = AudioSegment(data=samples.tobytes(), sample_width=2, frame_rate=self.rate, channels=1)
+        return audio_segment.set_frame_rate(self.api_rate).raw_data
+
+    async def request_response(self, client, pcm):
+        # Segments are answered independently: the response is kept out of the conversation and the
+        # committed audio is deleted afterwards, so a pooled connection does not accumulate segments.
+        # The metadata tells this segment's response.created apart from a stale one of an earlier lease.
+        request_id = os.urandom(4).hex()
+        commit_id = await client.send_audio(pcm, create_response=True,
+                                            response={"conversation": "none", "metadata": {"request": request_id}})
+        if commit_id is None:
+            raise RuntimeError("Audio could not be sent")  # send_audio logs the cause
+        sent_event_ids = set(client.last_send_event_ids)
+        response_id = None
+        parts = []
+        while True:
+            event = await client.receive_response()
+            if not isinstance(event, dict):
+                continue  # Unparsed pass-through events, e.g. response.audio.delta
+            event_type = event.get('type')
+            if event_type == 'response.created' and response_id is None:
+                if (event['response'].get('metadata') or {}).get('request') == request_id:
+                    response_id = event['response']['id']
+            elif event_type in ('response.audio_transcript.delta', 'response.text.delta'):
+                if event.get('response_id') == response_id:
+                    parts.append(event.get('delta', ''))
+            elif event_type == 'response.done' and event['response']['id'] == response_id:
+                await client.delete_commit(commit_id)
+                return "".join(parts), event['response'].get('status')
+            elif event_type == 'error':
+                error = event.get('error', {})
+                if error.get('event_id') in sent_event_ids:
+                    raise RuntimeError(error.get('message', 'Unknown error'))
+                # E.g. the cancel of a response that had already finished
+                self.logger.debug(f"Ignored error not caused by this segment: {error}")
+
+    async def dispatch(self, segments):
+        done = self.completed_segments()
+        queue = asyncio.Queue()
+        for index, segment in enumerate(segments):
+            if index not in done:
+                queue.put_nowait((index, segment))
+        self.logger.info(f"{len(done)} segments already done, {queue.qsize()} to dispatch "
+                         f"over {self.connections} connections")
+        if queue.empty():
+            return
+
+        f = open(self.path, 'rb')
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        data_offset, data_size, channels, _ = find_pcm_data(mm)
+        samples = mono_view(mm, data_offset, data_size, channels)
+        output = open(self.output_path, 'a')
+
+        # No server VAD on these sessions, each segment is committed and answered on request
+        pool = ConnectionPool(self.config, size=min(self.connections, queue.qsize()),
+                              client_factory=functools.partial(OpenAIClient, manual_turns=True))
+        pool.register_event_consumer('response.created', 'response.audio_transcript.delta', 'response.text.delta')
+
+        async def segment_worker():
+            while not queue.empty():
+                index, (start, end) = queue.get_nowait()
+                pcm = self.resample(samples[start:end])
+                try:
+                    # A failed lease reconnects its client, so the next lease never sees a response still running
+                    async with pool.lease() as client:
+                        text, status = await asyncio.wait_for(self.request_response(client, pcm),
+                                                              self.response_timeout)
+                except (asyncio.TimeoutError, RuntimeError, OSError, websockets.exceptions.ConnectionClosed) as e:
+                    # One dropped connection must not abort the other workers' segments
+                    self.logger.error(f"Segment {index} failed: {e!r}")
+                    continue  # Left out of the output, so the next run retries it
+                output.write(json.dumps({
+                    'segment': index,
+                    'start': round(start / self.rate, 3),
+                    'end': round(end / self.rate, 3),
+                    'status': status,
+                    'response': text,
+                }) + "\n")
+                output.flush()
+                self.logger.info(f"Segment {index} ({start / self.rate:.1f}-{end / self.rate:.1f} s) done")
+
+        try:
+            await pool.start()
+            await asyncio.gather(*(segment_worker() for _ in range(pool.size)))
+            self.logger.info(f"Connection pool: {pool.stats()}")
+        finally:
+            await pool.close()
+            output.close()
+            del samples
+            mm.close()
+            f.close()
+
+    def sort_output(self):
+        # Rewrite the results in time order once every segment is in
+        with open(self.output_path) as f:
+            results = [json.loads(line) for line in f if line.strip()]
+        results.sort(key=lambda result: result['start'])
+        temp_path = self.output_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            for result in results:
+                f.write(json.dumps(result) + "\n")
+        os.replace(temp_path, self.output_path)
+
+    async def run(self):
+        started = time.perf_counter()
+        segments = self.segment()
+        await self.dispatch(segments)
+        if len(self.completed_segments()) == len(segments):
+            self.sort_output()
+            self.logger.info(f"All {len(segments)} segments processed in {time.perf_counter() - started:.1f} s, "
+                             f"results in {self.output_path}")
+        else:
+            self.logger.warning("Some segments failed; run again to resume")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Process a long meeting recording offline")
+    parser.add_argument('recording', help="16-bit PCM WAV file at 8, 16, 32 or 48 kHz")
+    parser.add_argument('--output', help="JSONL file for time-aligned responses (default: <recording>.responses.jsonl)")
+    parser.add_argument('--connections', type=int, default=4, help="Concurrent OpenAI connections")
+    parser.add_argument('--processes', type=int, default=None, help="VAD worker processes (default: CPU count)")
+    parser.add_argument('--block-seconds', type=int, default=300, help="Audio per VAD work item")
+    parser.add_argument('--max-segment-seconds', type=int, default=30, help="Longest audio sent per request")
+    args = parser.parse_args()
+
+    processor = OfflineProcessor(Config(), args.recording, args.output or args.recording + '.responses.jsonl',
+                                 connections=args.connections, processes=args.processes,
+                                 block_seconds=args.block_seconds, max_segment_seconds=args.max_segment_seconds)
+    asyncio.run(processor.run())
@@ -1,12 +1,19 @@
 import os
 import json
+import asyncio
 import websockets
 import base64
 import time
+from collections import deque
 from common_logging import setup_logging
+from event_decoder import EventDecoder, RawEvent
+from conversation_context import ConversationContext
+from outbound_queue import OutboundQueue, CONTROL, priority_for
+from g711 import INPUT_FORMATS
+import metrics
 
 class OpenAIClient:
-    def __init__(self, config, debug_to_console=False):
+    def __init__(self, config, debug_to_console=False, manual_turns=None):
         self.config = config
         self.api_key = self.config.api_key
         self.api_url = self.config.api_url
@@ -14,8 +21,45 @@ class OpenAIClient:
         self.logger = setup_logging('openai_client', filter_response_done=True)
         self.last_reset_time = time.time()
         self.reset_pending = False
+        # Only event types with a registered consumer are fully parsed on receipt
+        self.event_decoder = EventDecoder(consumers=['error', 'response.done', 'conversation.item.created',
+                                                     'conversation.item.deleted', 'input_audio_buffer.committed'])
+        self.raw_consumers = set()  # Event types returned unparsed even when pass-through is off
+        # Commits are acknowledged in order; input_audio_buffer.committed carries no client event_id,
+        # so each one is matched to the oldest commit still pending
+        self.pending_commits = deque()
+        self.last_commit = (None, None)  # (commit event_id, item_id) of the latest acknowledged commit
+        self.deferred_deletes = set()  # Commit event_ids whose item is deleted once it is known
+        # With manual turns the server VAD is off, and every commit is followed by response.create
+        self.manual_turns = config.speculative_mode if manual_turns is None else manual_turns
+        self.last_send_event_ids = set()  # Client event_ids of the latest send_audio, to match errors against
+        self.last_response_event_id = None  # Its response.create, if it requested one
+        self.responses_completed = 0  # On this session; the voice can't change in place once audio was produced
+        self.forward_unparsed_events = config.forward_unparsed_events
+        # Every outbound event goes through a single writer task (created on connect, inside the loop)
+        self.outbound_queue = None
+        self.writer_task = None
+        self.audio_append_chunk_bytes = config.audio_append_chunk_bytes
+        if config.input_audio_format not in INPUT_FORMATS:
+            raise ValueError(f"Unsupported input_audio_format '{config.input_audio_format}', "
+                             f"use one of {', '.join(INPUT_FORMATS)}")
+        # Audio passed to send_audio must be 16-bit mono at input_rate; G.711 formats are encoded here
+        self.input_audio_format = config.input_audio_format
+        self.input_rate, self.input_encoder = INPUT_FORMATS[self.input_audio_format]
+        self.control_wait_warning_ms = config.control_wait_warning_ms
+        # Tracks conversation items and prunes old ones to keep the context within budget
+        self.context = ConversationContext(config, self.send_event)
+
+    def register_event_consumer(self, *event_types):
+        self.event_decoder.register(*event_types)
+
+    def register_raw_consumer(self, *event_types):
+        # For consumers that decode the frame themselves, e.g. audio playback on its own thread
+        self.raw_consumers.update(event_types)
 
     async def connect(self):
+        if self.websocket is not None:
+            metrics.RECONNECTS.inc()
         if self.websocket and not self.websocket.closed:
             await self.websocket.close()
         
@@ -25,7 +69,16 @@ class OpenAIClient:
             "Content-Type": "application/json"
         }
         self.websocket = await websockets.connect(self.api_url, extra_headers=headers)
+        self.start_writer()
+        dropped = await self.outbound_queue.clear()
+        if dropped:
+            self.logger.warning(f"Dropped {dropped} queued audio events from the previous connection")
+        self.responses_completed = 0
+        self.pending_commits.clear()
+        self.last_commit = (None, None)
+        self.deferred_deletes.clear()
         await self.initialize_session()
+        await self.context.reseed()
         self.last_reset_time = time.time()
         self.reset_pending = False
         self.logger.info("Connected to OpenAI API")
@@ -38,30 +91,95 @@ class OpenAIClient:
                 "modalities": ["text", "audio"],
                 "instructions": self.config.instructions,
                 "voice": self.config.voice,
-                "input_audio_format": "pcm16",
+                "input_audio_format": self.input_audio_format,
                 "output_audio_format": "pcm16",
-                "turn_detection": {
-                    "type": "server_vad",
-                    "threshold": 0.5,
-                    "prefix_padding_ms": 300,
-                    "silence_duration_ms": 200
-                },
+                "turn_detection": self.turn_detection(),
                 "temperature": self.config.temperature
             }
         }
-        await self.websocket.send(json.dumps(session_update))
-        self.logger.debug(f"Session update sent: {json.dumps(session_update)}")
+        await self.send_event(session_update)
+        self.logger.debug(f"Session update queued: {session_update}")
         response = await self.websocket.recv()
         self.logger.debug(f"Session initialization response: {response}")
 
+    def turn_detection(self):
+        if self.manual_turns:
+            return None  # Commits and responses are all requested by the client
+        return {
+            "type": "server_vad",
+            "threshold": self.config.turn_detection_threshold,
+            "prefix_padding_ms": self.config.turn_detection_prefix_padding_ms,
+            "silence_duration_ms": self.config.turn_detection_silence_duration_ms
+        }
+
+    async def update_session(self, names):
+        # Sends changed session settings (already set on config) to the live session. Returns True
+        # if a reconnect was scheduled instead, which only a voice change after audio output needs.
+        if not self.is_connected():
+            return False  # The next connect sends the whole session from config
+        session = {}
+        reconnect = False
+        for name in names:
+            if name == 'voice' and self.responses_completed:
+                reconnect = True
+            elif name.startswith('turn_detection_'):
+                session["turn_detection"] = self.turn_detection()
+            else:
+                session[name] = getattr(self.config, name)
+        if session:
+            await self.send_event({
+                "event_id": self.generate_event_id(),
+                "type": "session.update",
+                "session": session
+            })
+            self.logger.info(f"Session updated in place: {', '.join(sorted(session))}")
+        if reconnect:
+            self.reset_pending = True  # Done by the assistant when idle, or before the next send
+            self.logger.info("Voice change needs a new session, reconnect scheduled")
+        return reconnect
+
     async def reset_session(self):
         self.logger.info("Resetting OpenAI session")
         await self.connect()
 
+    def start_writer(self):
+        if self.outbound_queue is None:
+            self.outbound_queue = OutboundQueue(max_depth=self.config.outbound_queue_max_depth,
+                                                max_bytes=self.config.outbound_queue_max_bytes)
+        if self.writer_task is None or self.writer_task.done():
+            self.writer_task = asyncio.create_task(self.write_outbound_events())
+
+    async def send_event(self, event):
+        # Queue an event for the writer task; bulk events wait here when the queue is full
+        if self.outbound_queue is None:
+            raise RuntimeError("OpenAI client is not connected")
+        await self.outbound_queue.put(json.dumps(event), priority_for(event['type']), event.get('event_id'))
+
+    async def write_outbound_events(self):
+        self.logger.info("Started outbound writer")
+        try:
+            while True:
+                message, priority, wait_ms = await self.outbound_queue.get()
+                metrics.STAGE_LATENCY.labels('outbound_wait').observe(wait_ms / 1000)
+                if priority == CONTROL and wait_ms > self.control_wait_warning_ms:
+                    self.logger.warning(f"Control event waited {wait_ms:.1f} ms in the outbound queue")
+                try:
+                    await self.websocket.send(message)
+                except websockets.exceptions.ConnectionClosed as e:
+                    self.logger.error(f"Dropped outbound event, connection closed: {e}")
+                except Exception as e:
+                    self.logger.error(f"Error writing outbound event: {str(e)}")
+        except asyncio.CancelledError:
+            self.logger.info("Outbound writer cancelled")
+
+    def outbound_stats(self):
+        return self.outbound_queue.stats() if self.outbound_queue else None
+
     def should_reset(self):
         return time.time() - self.last_reset_time > 600  # 10 minutes
 
-    async def send_audio(self, audio_buffer):
+    async def send_audio(self, audio_buffer, create_response=False, response=None):
+        # response holds settings for response.create, e.g. {"conversation": "none"}
         if self.should_reset():
             self.reset_pending = True
 
@@ -73,32 +191,135 @@ class OpenAIClient:
             return
 
         try:
-            encoded_audio = self.encode_audio(audio_buffer)
-            message = {
-                "event_id": self.generate_event_id(),
-                "type": "input_audio_buffer.append",
-                "audio": encoded_audio
-            }
-            await self.websocket.send(json.dumps(message))
-            self.logger.debug(f"Audio data sent to API")
+            started = time.perf_counter()
+            payload = self.input_encoder(audio_buffer) if self.input_encoder else audio_buffer
+            # Append in chunks so control events can be written between them
+            chunk_size = self.audio_append_chunk_bytes
+            self.last_send_event_ids = set()
+            self.last_response_event_id = None
+            for offset in range(0, len(payload), chunk_size):
+                encoded_audio = self.encode_audio(payload[offset:offset + chunk_size])
+                message = {
+                    "event_id": self.generate_event_id(),
+                    "type": "input_audio_buffer.append",
+                    "audio": encoded_audio
+                }
+                await self.send_event(message)
+                self.last_send_event_ids.add(message["event_id"])
+            self.context.note_audio_sent(len(audio_buffer), bytes_per_second=self.input_rate * 2)
+            metrics.UTTERANCES_SENT.inc()
+            metrics.AUDIO_BYTES_SENT.inc(len(payload))
+            self.logger.debug(f"Audio data queued for API")
 
-            # Send commit message immediately after appending audio
+            # Queue commit message immediately after appending audio
             commit_message = {
                 "event_id": self.generate_event_id(),
                 "type": "input_audio_buffer.commit"
             }
-            await self.websocket.send(json.dumps(commit_message))
-            self.logger.debug("Sent commit message")
+            await self.send_event(commit_message)
+            self.last_send_event_ids.add(commit_message["event_id"])
+            if self.manual_turns:
+                self.pending_commits.append(commit_message["event_id"])  # Server VAD commits would be interleaved
+            self.logger.debug(f"Queued commit message. Outbound queue: {self.outbound_queue.stats()}")
+
+            if create_response or self.manual_turns:
+                response_message = {
+                    "event_id": self.generate_event_id(),
+                    "type": "response.create"
+                }
+                if response:
+                    response_message["response"] = response
+                await self.send_event(response_message)
+                self.last_send_event_ids.add(response_message["event_id"])
+                self.last_response_event_id = response_message["event_id"]
+                self.logger.debug("Queued response.create")
+            metrics.STAGE_LATENCY.labels('send').observe(time.perf_counter() - started)
+            return commit_message["event_id"]
 
         except Exception as e:
             self.logger.error(f"Error in send_audio: {str(e)}")
 
+    async def cancel_response(self):
+        await self.send_event({
+            "event_id": self.generate_event_id(),
+            "type": "response.cancel"
+        })
+        self.logger.debug("Queued response.cancel")
+
+    async def withdraw_send(self, event_ids, commit_event_id, response_event_id=None):
+        # Takes back a send_audio request. response.cancel travels as a control event and would overtake
+        # the request's queued appends, commit and response.create, so whatever is still queued is removed
+        # first, and the response is only cancelled if its response.create was already written.
+        removed = await self.outbound_queue.remove(event_ids)
+        if commit_event_id in removed:
+            if commit_event_id in self.pending_commits:
+                self.pending_commits.remove(commit_event_id)
+            appends = event_ids - {commit_event_id, response_event_id}
+            if appends - removed:
+                # Part of the audio is already in the server's input buffer, uncommitted
+                await self.send_event({
+                    "event_id": self.generate_event_id(),
+                    "type": "input_audio_buffer.clear"
+                })
+        if response_event_id is not None and response_event_id not in removed:
+            await self.cancel_response()
+        self.logger.debug(f"Withdrew send of {len(event_ids)} events, {len(removed)} were still queued")
+        return removed
+
+    async def delete_item(self, item_id):
+        await self.send_event({
+            "event_id": self.generate_event_id(),
+            "type": "conversation.item.delete",
+            "item_id": item_id
+        })
+        self.logger.debug(f"Queued conversation.item.delete for {item_id}")
+
+    async def delete_commit(self, commit_event_id):
+        # Deletes the conversation item created by one of our commits, once the server has reported it
+        if self.last_commit[0] == commit_event_id:
+            await self.delete_item(self.last_commit[1])
+            self.last_commit = (None, None)
+        elif commit_event_id in self.pending_commits:
+            self.deferred_deletes.add(commit_event_id)
+            self.logger.debug(f"Delete of commit {commit_event_id} deferred until it is acknowledged")
+        else:
+            self.logger.debug(f"Commit {commit_event_id} has no known item, nothing to delete")
+
+    async def observe_commit(self, event):
+        if event.get('type') == 'error':
+            # A rejected commit is never acknowledged
+            commit_event_id = event.get('error', {}).get('event_id')
+            if commit_event_id in self.pending_commits:
+                self.pending_commits.remove(commit_event_id)
+                self.deferred_deletes.discard(commit_event_id)
+            return
+        commit_event_id = self.pending_commits.popleft() if self.pending_commits else None
+        if commit_event_id in self.deferred_deletes:
+            self.deferred_deletes.discard(commit_event_id)
+            await self.delete_item(event.get('item_id'))
+        else:
+            self.last_commit = (commit_event_id, event.get('item_id'))
+
     async def receive_response(self):
         try:
-            response = await self.websocket.recv()
-            parsed_response = json.loads(response)
+            while True:
+                response = await self.websocket.recv()
+                parsed_response = self.event_decoder.decode(response)
+                if not isinstance(parsed_response, RawEvent):
+                    metrics.INBOUND_EVENTS.labels(parsed_response.get('type', 'unknown')).inc()
+                    break
+                metrics.INBOUND_EVENTS.labels(parsed_response.type).inc()
+                if self.forward_unparsed_events or parsed_response.type in self.raw_consumers:
+                    return parsed_response
+                # Nobody consumes this event type and pass-through is off, so drop it unparsed
+
             self.logger.debug(f"Received response: {parsed_response}")
-            
+            await self.context.observe(parsed_response)
+            if parsed_response.get('type') in ('input_audio_buffer.committed', 'error'):
+                await self.observe_commit(parsed_response)
+            elif parsed_response.get('type') == 'response.done':
+                self.responses_completed += 1
+
             if parsed_response.get('type') == 'error' and parsed_response.get('error', {}).get('code') == 'session_expired':
                 self.logger.warning("Session expired. Attempting to reconnect.")
                 await self.reset_session()
@@ -126,6 +347,9 @@ class OpenAIClient:
         return self.websocket and not self.websocket.closed
 
     async def close_connection(self):
+        if self.writer_task:
+            self.writer_task.cancel()
+            self.writer_task = None
         if self.websocket and not self.websocket.closed:
             await self.websocket.close()
             self.logger.info("Closed connection to OpenAI API")
@@ -0,0 +1,106 @@
+import asyncio
+import time
+from collections import deque
+
+# Priority classes, lowest value is written first
+CONTROL = 0
+BULK = 1
+
+# Only events that are safe to reorder ahead of queued audio. Commits and response.create
+# must stay behind the appends they refer to, so they travel in the bulk class.
+CONTROL_EVENT_TYPES = {'response.cancel', 'session.update'}
+
+
+def priority_for(event_type):
+    return CONTROL if event_type in CONTROL_EVENT_TYPES else BULK
+
+
+class OutboundQueue:
+    def __init__(self, max_depth=512, max_bytes=8 * 1024 * 1024):
+        self.max_depth = max_depth
+        self.max_bytes = max_bytes
+        self._queues = {CONTROL: deque(), BULK: deque()}
+        self._bytes = 0
+        self._changed = asyncio.Condition()
+        self.wait_stats = {priority: {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0}
+                           for priority in self._queues}
+
+    @property
+    def depth(self):
+        return sum(len(queue) for queue in self._queues.values())
+
+    @property
+    def queued_bytes(self):
+        return self._bytes
+
+    def _has_room(self, size):
+        if self.depth == 0:
+            return True  # Always admit one message, however large, into an empty queue
+        return self.depth < self.max_depth and self._bytes + size <= self.max_bytes
+
+    async def put(self, message, priority=BULK, event_id=None):
+        size = len(message)
+        async with self._changed:
+            # Control messages are never held back by bulk backpressure
+            if priority != CONTROL:
+                await self._changed.wait_for(lambda: self._has_room(size))
+            self._queues[priority].append((time.monotonic(), message, event_id))
+            self._bytes += size
+            self._changed.notify_all()
+
+    async def get(self):
+        async with self._changed:
+            await self._changed.wait_for(lambda: self.depth > 0)
+            for priority in sorted(self._queues):
+                if self._queues[priority]:
+                    enqueued_at, message, _ = self._queues[priority].popleft()
+                    break
+            self._bytes -= len(message)
+            self._changed.notify_all()
+
+        wait_ms = (time.monotonic() - enqueued_at) * 1000
+        stats = self.wait_stats[priority]
+        stats['count'] += 1
+        stats['total_ms'] += wait_ms
+        stats['max_ms'] = max(stats['max_ms'], wait_ms)
+        return message, priority, wait_ms
+
+    async def clear(self, priority=BULK):
+        async with self._changed:
+            dropped = self._queues[priority]
+            self._bytes -= sum(len(message) for _, message, _ in dropped)
+            count = len(dropped)
+            dropped.clear()
+            self._changed.notify_all()
+        return count
+
+    async def remove(self, event_ids):
+        # Withdraws queued events by event_id; returns the ids that were still queued, i.e. never written
+        removed = set()
+        async with self._changed:
+            for queue in self._queues.values():
+                kept = deque()
+                for entry in queue:
+                    if entry[2] is not None and entry[2] in event_ids:
+                        removed.add(entry[2])
+                        self._bytes -= len(entry[1])
+                    else:
+                        kept.append(entry)
+                queue.clear()
+                queue.extend(kept)
+            self._changed.notify_all()
+        return removed
+
+    def stats(self):
+        return {
+            'depth': self.depth,
+            'bytes': self._bytes,
+            'wait_ms': {
+                'control' if priority == CONTROL else 'bulk': {
+                    'count': stats['count'],
+                    'avg': stats['total_ms'] / stats['count'] if stats['count'] else 0.0,
+                    'max': stats['max_ms'],
+                }
+                for priority, stats in self.wait_stats.items()
+            },
+        }
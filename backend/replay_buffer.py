@@ -0,0 +1,63 @@
+from collections import deque
+
+
+class ReplayEntry:
+    __slots__ = ('seq', 'size', '_encode_json', '_encode_binary', '_json', '_binary')
+
+    def __init__(self, seq, encode_json, encode_binary, size):
+        self.seq = seq
+        self.size = size
+        self._encode_json = encode_json
+        self._encode_binary = encode_binary  # Called with the sequence number; None if there is no binary form
+        self._json = None
+        self._binary = None
+
+    def json_message(self):
+        # Encoded on first use and kept, so live broadcast and later replays share the work
+        if self._json is None:
+            self._json = '{"seq": %d, ' % self.seq + self._encode_json()[1:]
+        return self._json
+
+    def binary_message(self):
+        if self._encode_binary is None:
+            return self.json_message()
+        if self._binary is None:
+            self._binary = self._encode_binary(self.seq)
+        return self._binary
+
+
+class ReplayBuffer:
+    def __init__(self, max_events, max_bytes):
+        self.max_events = max_events
+        self.max_bytes = max_bytes
+        self.entries = deque()
+        self.bytes = 0
+        self.latest_seq = 0
+
+    def append(self, encode_json, encode_binary, size):
+        self.latest_seq += 1
+        entry = ReplayEntry(self.latest_seq, encode_json, encode_binary, size)
+        self.entries.append(entry)
+        self.bytes += size
+        while len(self.entries) > self.max_events or (self.bytes > self.max_bytes and len(self.entries) > 1):
+            self.bytes -= self.entries.popleft().size
+        return entry
+
+    def since(self, last_seq):
+        # Entries after last_seq, or None when some of them were already evicted (or the
+        # sequence came from before a restart) and the client needs a snapshot instead
+        if last_seq > self.latest_seq:
+            return None
+        if not self.entries:
+            return [] if last_seq == self.latest_seq else None
+        if last_seq < self.entries[0].seq - 1:
+            return None
+        return [entry for entry in self.entries if entry.seq > last_seq]
+
+    def stats(self):
+        return {
+            'events': len(self.entries),
+            'bytes': self.bytes,
+            'oldest_seq': self.entries[0].seq if self.entries else None,
+            'latest_seq': self.latest_seq,
+        }
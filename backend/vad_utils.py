@@ -0,0 +1,14 @@
+# VAD decisions shared by live capture (AudioCapture.is_speech) and offline segmentation
+
+
+def contains_speech(vad, audio, rate, frame_length):
+    # A chunk counts as speech if any complete frame in it is speech
+    for i in range(0, len(audio) - frame_length + 1, frame_length):
+        if vad.is_speech(audio[i:i + frame_length], rate):
+            return True
+    return False
+
+
+def update_speech_count(count, is_speech_frame):
+    # Speech raises the count by one per chunk, silence lowers it by one, never below zero
+    return count + 1 if is_speech_frame else max(0, count - 1)
@@ -1,17 +1,29 @@
+import argparse
 import asyncio
+import os
 import time
+from collections import deque
 import websockets
 import pyaudio
+from pydub import AudioSegment
 from audio_capture import AudioCapture
+from audio_playback import AudioPlayback
+from capture_process import ProcessCapture
+from multi_source_capture import MultiSourceCapture
 from openai_client import OpenAIClient
 from websocket_manager import WebSocketManager
 from response_processor import ResponseProcessor
-from config import Config
+from config import Config, LIVE_SETTINGS, validate_live_settings
 from common_logging import setup_logging
+from event_decoder import RawEvent
+from dispatch_scheduler import DispatchScheduler
+import metrics
+from metrics import MetricsServer
 
 class VoiceAssistant:
     def __init__(self, config: Config, audio_capture: AudioCapture, openai_client: OpenAIClient,
-                 websocket_manager: WebSocketManager, response_processor: ResponseProcessor):
+                 websocket_manager: WebSocketManager, response_processor: ResponseProcessor,
+                 audio_playback: AudioPlayback = None):
         self.config = config
         self.max_api_calls = config.max_api_calls
         self.api_calls_made = 0
@@ -21,15 +33,43 @@ class VoiceAssistant:
         self.silence_threshold = config.silence_threshold
         self.cooldown_active = False
         self.cooldown_duration = config.cooldown_duration
-        self.min_buffer_size = config.min_buffer_size
+        self.min_buffer_size = self.capture_bytes(config.min_buffer_size, audio_capture)
         self.max_buffer_wait_time = config.max_buffer_wait_time
         self.buffer_ready = asyncio.Event()
         self.last_audio_time = 0
+        self.dispatch_scheduler = DispatchScheduler(config)
+        self.pending_utterances = deque()
+        self.max_queued_utterances = config.max_queued_utterances
+        self.dispatch_task = None
+
+        # Speculative mode sends the utterance on a short pause and cancels if speech resumes
+        self.speculative_mode = config.speculative_mode
+        self.speculative_pause_ms = config.speculative_pause_ms
+        self.speculative_hangover_ms = config.speculative_hangover_ms
+        self.speculative_resume_frames = config.speculative_resume_frames
+        self.speculation = None
+        self.raw_silence_ms = 0
+        self.raw_speech_frames = 0
+        self.speculation_stats = {'attempts': 0, 'hits': 0, 'misses': 0, 'saved_ms': 0.0}
+        self.utterance_start = 0  # Recording offset (in frames) of the first chunk in audio_buffer
 
         self.audio_capture = audio_capture
         self.openai_client = openai_client
         self.websocket_manager = websocket_manager
         self.response_processor = response_processor
+        self.openai_client.register_event_consumer('response.audio_transcript.delta', 'response.complete',
+                                                   'response.done', 'rate_limits.updated')
+        self.audio_playback = audio_playback
+        self.playback_barge_in = config.playback_barge_in
+        if self.audio_playback is not None:
+            # Audio deltas are handed over undecoded; the playback thread parses them
+            self.openai_client.register_raw_consumer('response.audio.delta')
+            self.openai_client.register_event_consumer('response.created')
+
+        self.response_requested_at = None  # perf_counter() of the last send, until its first transcript delta
+        self.metrics_server = (MetricsServer(metrics.registry, config.metrics_host, config.metrics_port)
+                               if config.metrics_enabled else None)
+        self.register_metrics()
 
         self.logger = setup_logging('voice_assistant')
         self.logger.info("VoiceAssistant initialized")
@@ -43,8 +83,12 @@ class VoiceAssistant:
     async def pause(self):
         if self.is_paused:
             return  # Already paused
+        if self.speculation is not None:
+            # The utterance is already with the API; accept the speculative response
+            await self.confirm_speculation()
+            return
         self.is_paused = True  # Set the paused flag
-        self.audio_capture.stop_stream()  # Stop the audio stream
+        self.audio_capture.close_gate()  # Gate capture in software; the stream stays open
         self.logger.info("Assistant paused")
 
         # If there's audio in the buffer, send it to the API
@@ -62,14 +106,69 @@ class VoiceAssistant:
             return  # Already running
         self.is_paused = False  # Reset the paused flag
         self.audio_buffer = b''  # Clear the audio buffer
-        self.audio_capture.reset_vad()  # Reset VAD state
+        self.audio_capture.reset_vad()  # Reset VAD smoothing, the stream stays open
         self.last_audio_time = time.time()  # Reset the last audio time
         self.waiting_for_response = False  # Ensure not waiting for a response
         self.cooldown_active = False  # Reset cooldown if necessary
-        self.audio_capture.start_stream()  # Start the audio stream
+        self.audio_capture.start_stream()  # No-op unless the stream was stopped
+        self.audio_capture.open_gate()  # Takes effect on the next frame read
         await self.websocket_manager.broadcast_status("listening", True)  # Broadcast listening status
         self.logger.info("Assistant resumed")
 
+    def live_settings(self):
+        return {name: getattr(self.config, name) for name in LIVE_SETTINGS}
+
+    async def update_settings(self, changes):
+        # Session settings go to the live connection as session.update, local ones are applied in place
+        valid, errors = validate_live_settings(changes)
+        for name, value in valid.items():
+            setattr(self.config, name, value)
+
+        session_changes = [name for name in valid if LIVE_SETTINGS[name][0] == 'session']
+        reconnect_scheduled = False
+        if session_changes:
+            reconnect_scheduled = await self.openai_client.update_session(session_changes)
+        if 'vad_aggressiveness' in valid:
+            self.audio_capture.set_vad_aggressiveness(valid['vad_aggressiveness'])
+        if 'min_buffer_size' in valid:
+            self.min_buffer_size = self.capture_bytes(valid['min_buffer_size'], self.audio_capture)
+        if 'cooldown_duration' in valid:
+            self.cooldown_duration = valid['cooldown_duration']  # Used from the next cooldown on
+
+        if valid:
+            self.logger.info(f"Settings updated: {', '.join(sorted(valid))}")
+        if errors:
+            self.logger.warning(f"Rejected settings: {errors}")
+        return {
+            'applied': sorted(valid),
+            'errors': errors,
+            'reconnect_scheduled': reconnect_scheduled,
+            'settings': self.live_settings()
+        }
+
+    def register_metrics(self):
+        # Existing stats dicts are read on scrape only; nothing is added to the audio path for them
+        registry = metrics.registry
+        registry.register_collector('assistant', "VoiceAssistant state", lambda: {
+            'audio_buffer_bytes': len(self.audio_buffer),
+            'api_calls_made': self.api_calls_made,
+            'pending_utterances': len(self.pending_utterances),
+            'waiting_for_response': self.waiting_for_response,
+            'is_paused': self.is_paused,
+        })
+        registry.register_collector('capture', "Capture stats", lambda: self.audio_capture.stats())
+        registry.register_collector('outbound_queue', "Outbound queue stats", self.openai_client.outbound_stats)
+        registry.register_collector('event_decoder', "Inbound event decoding",
+                                    lambda: self.openai_client.event_decoder.stats)
+        registry.register_collector('dispatch', "Rate limit budget", self.dispatch_scheduler.state)
+        registry.register_collector('speculation', "Speculative response stats", lambda: self.speculation_stats)
+        if self.audio_playback is not None:
+            registry.register_collector('playback', "Response audio playback", self.audio_playback.stats)
+
+    def capture_bytes(self, size, audio_capture):
+        # Buffer sizes are configured in bytes at config.rate; the capture may deliver another rate
+        return size * audio_capture.rate // self.config.rate // 2 * 2
+
     @property
     def is_idle(self):
         return (not self._is_recording and 
@@ -77,13 +176,37 @@ class VoiceAssistant:
                 not self.waiting_for_response and 
                 not self.cooldown_active)
 
+    def prepare_audio(self):
+        self.audio_capture.select_audio_device()
+        self.audio_capture.start_stream()  # Ensure the audio stream starts
+        if self.audio_playback is not None:
+            self.audio_playback.start()
+
+    def warm_up(self):
+        # Pay the pydub/audioop first-use cost now rather than on the first utterance
+        self.resample_for_api(bytes(self.audio_capture.chunk * self.audio_capture.bytes_per_sample))
+
+    async def timed_startup_step(self, name, awaitable):
+        started = time.perf_counter()
+        result = await awaitable
+        self.logger.info(f"Startup step '{name}' took {(time.perf_counter() - started) * 1000:.0f} ms")
+        return result
+
     async def run(self):
         try:
-            await self.websocket_manager.start()
-            await self.openai_client.connect()
-
-            self.audio_capture.select_audio_device()
-            self.audio_capture.start_stream()  # Ensure the audio stream starts
+            startup_started = time.perf_counter()
+            loop = asyncio.get_event_loop()
+            # Independent init steps run concurrently; blocking PortAudio and pydub work goes to threads
+            steps = [
+                self.timed_startup_step("websocket server", self.websocket_manager.start()),
+                self.timed_startup_step("openai connect", self.openai_client.connect()),
+                self.timed_startup_step("audio device", loop.run_in_executor(None, self.prepare_audio)),
+                self.timed_startup_step("warm up", loop.run_in_executor(None, self.warm_up)),
+            ]
+            if self.metrics_server is not None:
+                steps.append(self.timed_startup_step("metrics server", self.metrics_server.start()))
+            await asyncio.gather(*steps)
+            self.logger.info(f"Startup complete in {(time.perf_counter() - startup_started) * 1000:.0f} ms")
             self.logger.info("Voice Assistant is ready.")
             await self.websocket_manager.broadcast_status("ready", False)
 
@@ -121,12 +244,23 @@ class VoiceAssistant:
                     audio_chunk = await self.audio_capture.read_audio()
                     self._is_recording = False
                     self._is_processing = True
+                    vad_started = time.perf_counter()
                     is_speech = await self.audio_capture.is_speech(audio_chunk)
+                    metrics.STAGE_LATENCY.labels('vad').observe(time.perf_counter() - vad_started)
+                    metrics.VAD_FRAMES.labels('speech' if self.audio_capture.last_frame_is_speech else 'silence').inc()
                     self._is_processing = False
 
+                    if is_speech and self.playback_barge_in and self.audio_playback is not None \
+                            and self.audio_playback.is_playing():
+                        if self.audio_playback.is_receiving():
+                            await self.openai_client.cancel_response()  # Stop generating audio that would be dropped
+                        self.audio_playback.flush("barge-in")
+
                     await self.websocket_manager.broadcast_status("listening" if is_speech else "idle", is_speech)
 
                     if is_speech:
+                        if not self.audio_buffer:
+                            self.utterance_start = self.recording_position(audio_chunk)
                         self.audio_buffer += audio_chunk
                         self.last_audio_time = time.time()
                         self.logger.debug(f"Speech detected. Buffer size: {len(self.audio_buffer)}")
@@ -134,6 +268,17 @@ class VoiceAssistant:
                         if len(self.audio_buffer) >= self.min_buffer_size:
                             self.buffer_ready.set()
 
+                    if self.speculative_mode:
+                        self.track_raw_vad()
+                        if self.speculation is not None:
+                            await self.update_speculation(is_speech)
+                            await asyncio.sleep(0.01)
+                            continue
+                        if self.should_speculate():
+                            await self.start_speculation()
+                            await asyncio.sleep(0.01)
+                            continue
+
                     if not is_speech and self.buffer_ready.is_set():
                         if not self.waiting_for_response and not self.cooldown_active:
                             if len(self.audio_buffer) >= self.min_buffer_size:
@@ -166,25 +311,13 @@ class VoiceAssistant:
             self.buffer_ready.clear()
             return
         
-        import io
-        from pydub import AudioSegment
-
         try:
             self.waiting_for_response = True  # Set before sending to prevent new API calls
             await self.websocket_manager.broadcast_new_response()
 
-            # Resample audio to 24000 Hz before sending to the API
-            audio_segment = AudioSegment(
-                data=self.audio_buffer,
-                sample_width=pyaudio.get_sample_size(self.audio_capture.format),
-                frame_rate=self.audio_capture.rate,
-                channels=self.audio_capture.channels
-            )
-            audio_segment = audio_segment.set_frame_rate(24000)
-            audio_segment = audio_segment.set_channels(1)
-            resampled_audio_buffer = audio_segment.raw_data
-
-            await self.send_audio_to_api(resampled_audio_buffer)
+            resampled_audio_buffer = self.resample_for_api(self.audio_buffer)
+
+            await self.send_audio_to_api(resampled_audio_buffer, self.recording_range())
             self.audio_buffer = b""
             self.buffer_ready.clear()
             self.cooldown_active = True
@@ -192,20 +325,146 @@ class VoiceAssistant:
         except Exception as e:
             self.logger.error(f"Error in send_buffer_to_api: {str(e)}", exc_info=True)
 
-    async def send_audio_to_api(self, buffer):
+    def resample_for_api(self, buffer):
+        # Resample audio to the rate of the session's input format (24 kHz for pcm16, 8 kHz for G.711)
+        started = time.perf_counter()
+        audio_segment = AudioSegment(
+            data=buffer,
+            sample_width=pyaudio.get_sample_size(self.audio_capture.format),
+            frame_rate=self.audio_capture.rate,
+            channels=self.audio_capture.channels
+        )
+        audio_segment = audio_segment.set_frame_rate(self.openai_client.input_rate)
+        audio_segment = audio_segment.set_channels(1)
+        metrics.STAGE_LATENCY.labels('resample').observe(time.perf_counter() - started)
+        return audio_segment.raw_data
+
+    def track_raw_vad(self):
+        if self.audio_capture.last_frame_is_speech:
+            self.raw_speech_frames += 1
+            self.raw_silence_ms = 0
+        else:
+            self.raw_speech_frames = 0
+            self.raw_silence_ms += self.audio_capture.frame_duration_ms
+
+    def should_speculate(self):
+        return (self.buffer_ready.is_set()
+                and len(self.audio_buffer) >= self.min_buffer_size
+                and self.raw_silence_ms >= self.speculative_pause_ms
+                and not self.waiting_for_response
+                and not self.cooldown_active
+                and (self.max_api_calls == -1 or self.api_calls_made < self.max_api_calls)
+                and self.dispatch_scheduler.delay_before_dispatch() == 0)
+
+    async def start_speculation(self):
+        try:
+            self.waiting_for_response = True
+            await self.websocket_manager.broadcast_new_response()
+            resampled_audio_buffer = self.resample_for_api(self.audio_buffer)
+            self.logger.info(f"Speculatively sending audio after {self.raw_silence_ms} ms pause "
+                             f"(size: {len(resampled_audio_buffer)} bytes)")
+            event_id = await self.openai_client.send_audio(resampled_audio_buffer, create_response=True)
+            self.response_requested_at = time.perf_counter()
+            self.index_recording(event_id, self.recording_range())
+            # Counted against the call limit and budget only once kept, see confirm_speculation
+            self.speculation = {'sent_at': time.time(), 'normal_at': None, 'event_id': event_id,
+                                'event_ids': set(self.openai_client.last_send_event_ids),
+                                'response_event_id': self.openai_client.last_response_event_id}
+            self.speculation_stats['attempts'] += 1
+        except Exception as e:
+            self.waiting_for_response = False
+            self.logger.error(f"Error in start_speculation: {str(e)}", exc_info=True)
+
+    async def update_speculation(self, is_speech):
+        now = time.time()
+        if self.raw_speech_frames >= self.speculative_resume_frames:
+            await self.cancel_speculation()
+            return
+        # Note when the regular trailing-silence path would have sent, to measure the time saved
+        normal_ready = ((not is_speech and self.buffer_ready.is_set())
+                        or now - self.last_audio_time > self.max_buffer_wait_time)
+        if self.speculation['normal_at'] is None and normal_ready:
+            self.speculation['normal_at'] = now
+        if (now - self.speculation['sent_at']) * 1000 >= self.speculative_hangover_ms:
+            await self.confirm_speculation()
+
+    async def confirm_speculation(self):
+        speculation, self.speculation = self.speculation, None
+        decided_at = speculation['normal_at'] or time.time()
+        saved_ms = (decided_at - speculation['sent_at']) * 1000
+        self.speculation_stats['hits'] += 1
+        self.speculation_stats['saved_ms'] += saved_ms
+        self.logger.info(f"Speculative response kept, saved {saved_ms:.0f} ms. {self.speculation_report()}")
+        self.api_calls_made += 1
+        self.dispatch_scheduler.record_request()
+        await self.websocket_manager.broadcast_api_call_count(self.api_calls_made)
+
+        self.audio_buffer = b""
+        self.buffer_ready.clear()
+        self.cooldown_active = True
+        asyncio.create_task(self.cooldown_timer())
+        await self.websocket_manager.broadcast_status("processing", False)
+        await self.pause()
+
+    async def cancel_speculation(self):
+        speculation, self.speculation = self.speculation, None
+        self.speculation_stats['misses'] += 1
+        self.logger.info(f"Speech resumed, cancelling speculative response. {self.speculation_report()}")
+        # Events still queued are withdrawn, the response is cancelled only if it was already requested
+        withdrawn = await self.openai_client.withdraw_send(speculation['event_ids'], speculation['event_id'],
+                                                           speculation['response_event_id'])
+        if self.audio_playback is not None:
+            self.audio_playback.flush("speculation cancelled")
+        # Drop the early commit; the buffer keeps the audio and is re-committed once extended
+        if speculation['event_id'] and speculation['event_id'] not in withdrawn:
+            await self.openai_client.delete_commit(speculation['event_id'])
+        self.waiting_for_response = False
+
+    def speculation_report(self):
+        stats = self.speculation_stats
+        decided = stats['hits'] + stats['misses']
+        hit_rate = stats['hits'] / decided if decided else 0.0
+        avg_saved = stats['saved_ms'] / stats['hits'] if stats['hits'] else 0.0
+        return (f"Speculation: {stats['attempts']} attempts, {stats['hits']} hits, {stats['misses']} misses, "
+                f"hit rate {hit_rate:.0%}, avg saved {avg_saved:.0f} ms")
+
+    def recording_position(self, audio_chunk=b""):
+        # Recording offset (in frames) where audio_chunk, the chunk just read, begins
+        recorder = self.audio_capture.recorder
+        if recorder is None:
+            return 0
+        return recorder.position - len(audio_chunk) // self.audio_capture.bytes_per_sample
+
+    def recording_range(self):
+        return (self.utterance_start, self.recording_position())
+
+    def index_recording(self, event_id, recording_range):
+        if self.audio_capture.recorder is not None and event_id and recording_range:
+            self.audio_capture.recorder.index_utterance(event_id, *recording_range)
+
+    async def send_audio_to_api(self, buffer, recording_range=None):
         if self.max_api_calls != -1 and self.api_calls_made >= self.max_api_calls:
             self.logger.info("Maximum number of API calls reached. Initiating graceful shutdown.")
             await self.websocket_manager.broadcast_status("max_calls_reached", False)
             return False
 
+        delay = self.dispatch_scheduler.delay_before_dispatch()
+        if delay > 0:
+            await self.queue_utterance(buffer, recording_range, delay)
+            return False
+
         self.logger.info(f"Sending audio buffer to API (size: {len(buffer)} bytes)")
         self.logger.debug(f"waiting_for_response: {self.waiting_for_response}, cooldown_active: {self.cooldown_active}")
 
         try:
-            await self.openai_client.send_audio(buffer)
+            event_id = await self.openai_client.send_audio(buffer)
+            self.response_requested_at = time.perf_counter()
+            self.index_recording(event_id, recording_range)
             self.api_calls_made += 1
+            self.dispatch_scheduler.record_request()
             self.logger.info(f"API call made. Total calls: {self.api_calls_made}")
             await self.websocket_manager.broadcast_api_call_count(self.api_calls_made)
+            await self.websocket_manager.broadcast_budget(self.dispatch_scheduler.state())
             await self.websocket_manager.broadcast_status("processing", False)
             await self.pause()  # Automatically pause the assistant
             return True
@@ -216,6 +475,32 @@ class VoiceAssistant:
         finally:
             self.logger.debug("Exiting send_audio_to_api")
 
+    async def queue_utterance(self, buffer, recording_range, delay):
+        if len(self.pending_utterances) >= self.max_queued_utterances:
+            self.pending_utterances.popleft()
+            self.logger.warning("Utterance queue full. Dropped the oldest queued utterance.")
+        self.pending_utterances.append((buffer, recording_range))
+        self.logger.info(f"Near rate limit. Utterance queued for about {delay:.1f} s "
+                         f"({len(self.pending_utterances)} queued)")
+        await self.websocket_manager.broadcast_status("rate_limited", False)
+        await self.websocket_manager.broadcast_budget(self.dispatch_scheduler.state())
+        if self.dispatch_task is None or self.dispatch_task.done():
+            self.dispatch_task = asyncio.create_task(self.dispatch_pending_utterances())
+
+    async def dispatch_pending_utterances(self):
+        try:
+            while self.pending_utterances:
+                delay = self.dispatch_scheduler.delay_before_dispatch()
+                if delay > 0:
+                    # Re-check at least every second, rate_limits.updated may lift the limit early
+                    await asyncio.sleep(min(delay, 1.0))
+                    continue
+                buffer, recording_range = self.pending_utterances.popleft()
+                self.logger.info("Dispatching queued utterance")
+                await self.send_audio_to_api(buffer, recording_range)
+        except asyncio.CancelledError:
+            self.logger.info("Queued utterance dispatch cancelled")
+
     async def cooldown_timer(self):
         self.logger.debug(f"Cooldown started for {self.cooldown_duration} seconds")
         await asyncio.sleep(self.cooldown_duration)
@@ -228,6 +513,15 @@ class VoiceAssistant:
             while True:
                 response = await self.openai_client.receive_response()
 
+                if isinstance(response, RawEvent):
+                    if response.type == 'response.audio.delta' and self.audio_playback is not None:
+                        self.audio_playback.feed(response.raw)
+                        if not self.openai_client.forward_unparsed_events:
+                            continue
+                    # No backend consumer for this type; forward the frame without decoding it
+                    await self.websocket_manager.broadcast_raw_response(response.raw_text())
+                    continue
+
                 if not isinstance(response, dict):
                     self.logger.error(f"Invalid API response type: {type(response)}")
                     continue
@@ -242,6 +536,10 @@ class VoiceAssistant:
                 await self.websocket_manager.broadcast_response(response)
 
                 if response['type'] == 'response.audio_transcript.delta':
+                    if self.response_requested_at is not None:
+                        metrics.STAGE_LATENCY.labels('first_response').observe(
+                            time.perf_counter() - self.response_requested_at)
+                        self.response_requested_at = None
                     delta = self.response_processor.process_transcript_delta(response.get('delta', ''))
                     await self.websocket_manager.broadcast_transcript(delta)
                     if self.response_processor.is_question(self.response_processor.get_full_transcript()):
@@ -252,6 +550,18 @@ class VoiceAssistant:
                     self.logger.debug("waiting_for_response set to False")
                     await self.websocket_manager.broadcast_status("idle", False)
                     self.response_processor.clear_transcript()
+                elif response['type'] == 'response.created':
+                    if self.audio_playback is not None:
+                        self.audio_playback.start_response(response.get('response', {}).get('id'))
+                elif response['type'] == 'response.done':
+                    usage = response.get('response', {}).get('usage') or {}
+                    self.dispatch_scheduler.record_usage(usage)
+                    if self.audio_playback is not None:
+                        self.audio_playback.end_response()
+                    await self.websocket_manager.broadcast_budget(self.dispatch_scheduler.state())
+                elif response['type'] == 'rate_limits.updated':
+                    self.dispatch_scheduler.update_rate_limits(response.get('rate_limits', []))
+                    await self.websocket_manager.broadcast_budget(self.dispatch_scheduler.state())
                 elif response['type'] == 'error':
                     error_message = response.get('error', {}).get('message', 'Unknown error')
                     error_code = response.get('error', {}).get('code', 'Unknown code')
@@ -308,6 +618,8 @@ class VoiceAssistant:
             self.logger.info("VoiceAssistant started listening")
             # Start the audio stream
             self.audio_capture.start_stream()
+            if not self.is_paused:
+                self.audio_capture.open_gate()  # Skip audio buffered since startup
             self.process_audio_task = asyncio.create_task(self.process_audio())
             # Broadcast status update
             await self.websocket_manager.broadcast_status("listening", True)
@@ -331,7 +643,14 @@ class VoiceAssistant:
 
     async def cleanup(self):
         # Add any cleanup operations here
-        pass
+        if self.audio_capture.recorder is not None:
+            self.audio_capture.recorder.close()
+        if isinstance(self.audio_capture, ProcessCapture):
+            self.audio_capture.close()
+        if self.metrics_server is not None:
+            await self.metrics_server.stop()
+        if self.audio_playback is not None:
+            self.audio_playback.close()
 
     def stop(self):
         self.is_running = False
@@ -340,25 +659,71 @@ class VoiceAssistant:
         if self.process_audio_task:
             self.process_audio_task.cancel()
             self.process_audio_task = None
+        if self.dispatch_task:
+            self.dispatch_task.cancel()
+            self.dispatch_task = None
 
 if __name__ == "__main__":
     config = Config()
     logger = setup_logging('voice_assistant')
 
-    # Prompt user for max number of API calls
-    max_api_calls_input = input("Enter maximum number of API calls (-1 for unlimited): ")
-    try:
-        config.max_api_calls = int(max_api_calls_input)
+    parser = argparse.ArgumentParser(description="Voice assistant backend")
+    parser.add_argument('--max-api-calls', type=int, default=None,
+                        help="Maximum number of API calls (-1 for unlimited, default: $MAX_API_CALLS); "
+                             "prompts when neither is given")
+    parser.add_argument('--device', default=None, help="Input device name (or part of it) to use without prompting")
+    parser.add_argument('--choose-device', action='store_true', help="Ignore the saved device and prompt again")
+    parser.add_argument('--capture-process', action='store_true',
+                        help="Capture audio in a separate process that shares frames through memory")
+    parser.add_argument('--play-audio', action='store_true', help="Play spoken responses on the output device")
+    parser.add_argument('--output-device', default=None, help="Output device name (or part of it) for --play-audio")
+    parser.add_argument('--loopback-device', default=None,
+                        help="Also capture this input (e.g. a PulseAudio monitor) to hear the other side of a call")
+    args = parser.parse_args()
+    if args.max_api_calls is None and os.getenv("MAX_API_CALLS"):
+        try:
+            args.max_api_calls = int(os.getenv("MAX_API_CALLS"))
+        except ValueError:
+            parser.error(f"MAX_API_CALLS must be an integer, got '{os.getenv('MAX_API_CALLS')}'")
+
+    if args.device:
+        config.input_device_name = args.device
+    if args.choose_device:
+        config.use_saved_device = False
+    if args.capture_process:
+        config.capture_process = True
+    if args.play_audio:
+        config.playback_enabled = True
+    if args.output_device:
+        config.playback_device_name = args.output_device
+    if args.loopback_device:
+        config.capture_sources = [{'name': 'mic'}, {'name': 'remote', 'device': args.loopback_device}]
+
+    if args.max_api_calls is not None:
+        config.max_api_calls = args.max_api_calls
         logger.info(f"Max API calls set to: {config.max_api_calls}")
-    except ValueError:
-        print("Invalid input. Using unlimited API calls.")
-        config.max_api_calls = -1
-        logger.info("Max API calls set to unlimited")
-
-    audio_capture = AudioCapture(config)
+    else:
+        # Prompt user for max number of API calls
+        max_api_calls_input = input("Enter maximum number of API calls (-1 for unlimited): ")
+        try:
+            config.max_api_calls = int(max_api_calls_input)
+            logger.info(f"Max API calls set to: {config.max_api_calls}")
+        except ValueError:
+            print("Invalid input. Using unlimited API calls.")
+            config.max_api_calls = -1
+            logger.info("Max API calls set to unlimited")
+
+    if config.capture_sources:
+        audio_capture = MultiSourceCapture(config)
+    elif config.capture_process:
+        audio_capture = ProcessCapture(config)
+    else:
+        audio_capture = AudioCapture(config)
     openai_client = OpenAIClient(config)
     response_processor = ResponseProcessor(config)
-    assistant = VoiceAssistant(config, audio_capture, openai_client, None, response_processor)
-    websocket_manager = WebSocketManager(assistant)
+    audio_playback = AudioPlayback(config) if config.playback_enabled else None
+    assistant = VoiceAssistant(config, audio_capture, openai_client, None, response_processor, audio_playback)
+    websocket_manager = WebSocketManager(assistant, replay_max_events=config.replay_buffer_max_events,
+                                         replay_max_bytes=config.replay_buffer_max_bytes)
     assistant.websocket_manager = websocket_manager
     asyncio.run(assistant.run())
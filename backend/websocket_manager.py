@@ -1,29 +1,65 @@
 import websockets
 import json
+import time
+from urllib.parse import parse_qs, urlparse
 from common_logging import setup_logging
+from diagnostics import LoopLagMonitor, SamplingProfiler
+import frame_codec
+from frame_codec import BINARY_SUBPROTOCOL, JSON_SUBPROTOCOL
+from replay_buffer import ReplayBuffer
+import metrics
 
 class WebSocketManager:
-    def __init__(self, assistant):
+    def __init__(self, assistant, replay_max_events=1000, replay_max_bytes=2 * 1024 * 1024):
         self.assistant = assistant
         self.clients = set()
+        self.binary_clients = set()  # Clients that negotiated BINARY_SUBPROTOCOL
+        # Sequenced copies of recent messages, for clients reconnecting with ?last_seq=N
+        self.replay_buffer = ReplayBuffer(replay_max_events, replay_max_bytes)
+        self.replay_backlogs = {}  # Live messages held back from a client while its replay is sent
+        # State of the current answer, sent as a snapshot when the replay buffer can't cover a gap
+        self.answer_displayed = ''
+        self.answer_current = ''
+        self.api_call_count = None
+        self.budget = None
         self.server = None
         self.logger = setup_logging('websocket_manager')
         self.is_paused = False
+        self.loop_monitor = LoopLagMonitor()
+        self.profiler = SamplingProfiler()
+        metrics.registry.register_collector('frontend', "Frontend clients and unsent data", self.client_stats)
+        metrics.registry.register_collector('replay_buffer', "Replay buffer", self.replay_buffer.stats)
+        metrics.registry.register_collector('loop_lag', "Event loop lag", lambda: self.loop_monitor.stats())
 
-    async def start(self):
-        self.server = await websockets.serve(self.handler, 'localhost', 8000)
-        self.logger.info("WebSocket server started on ws://localhost:8000")
+    async def start(self, host='localhost', port=8000):
+        self.server = await websockets.serve(self.handler, host, port,
+                                         subprotocols=[BINARY_SUBPROTOCOL, JSON_SUBPROTOCOL])
+        self.loop_monitor.start()
+        self.logger.info(f"WebSocket server started on ws://{host}:{port}")
 
     async def handler(self, websocket):
+        last_seq = self.requested_replay(websocket.path)
         self.clients.add(websocket)
-        self.logger.info(f"Client connected: {websocket.remote_address}")
-        # Send initial status message
-        await websocket.send(json.dumps({
-            'type': 'status',
-            'status': 'ready',
-            'is_listening': self.assistant.is_running  # This should be False at startup
-        }))
+        if websocket.subprotocol == BINARY_SUBPROTOCOL:
+            self.binary_clients.add(websocket)
+        self.logger.info(f"Client connected: {websocket.remote_address} ({websocket.subprotocol or 'json'})")
         try:
+            if last_seq is not None:
+                # Taken before the first await, so every later broadcast lands in the backlog instead
+                missed = self.missed_messages(websocket, last_seq)
+                self.replay_backlogs[websocket] = []
+            # Send initial status message
+            if websocket in self.binary_clients:
+                await websocket.send(frame_codec.encode_status('ready', self.assistant.is_running, self.assistant.is_paused))
+            else:
+                await websocket.send(json.dumps({
+                    'type': 'status',
+                    'status': 'ready',
+                    'is_listening': self.assistant.is_running  # This should be False at startup
+                }))
+            if last_seq is not None:
+                await self.replay(websocket, missed)
+
             async for message in websocket:
                 data = json.loads(message)
                 await self.process_message(data, websocket)
@@ -35,8 +71,45 @@ class WebSocketManager:
             # Check if websocket is still in the set before removing
             if websocket in self.clients:
                 self.clients.remove(websocket)
+            self.binary_clients.discard(websocket)
+            self.replay_backlogs.pop(websocket, None)
             self.logger.info(f"Client removed: {websocket.remote_address}")
 
+    def requested_replay(self, path):
+        values = parse_qs(urlparse(path or '').query).get('last_seq')
+        try:
+            return int(values[0]) if values else None
+        except ValueError:
+            return None
+
+    def missed_messages(self, websocket, last_seq):
+        entries = self.replay_buffer.since(last_seq)
+        if entries is None:
+            self.logger.info(f"Client {websocket.remote_address} is too far behind (seq {last_seq}), sending a snapshot")
+            return [self.snapshot_message()]
+        self.logger.info(f"Replaying {len(entries)} messages to {websocket.remote_address} after seq {last_seq}")
+        binary = websocket in self.binary_clients
+        return [entry.binary_message() if binary else entry.json_message() for entry in entries]
+
+    async def replay(self, websocket, missed):
+        backlog = self.replay_backlogs[websocket]
+        for message in missed:
+            await websocket.send(message)
+        # Then whatever was broadcast meanwhile, in order, before the client goes live
+        while backlog:
+            await websocket.send(backlog.pop(0))
+        del self.replay_backlogs[websocket]
+
+    def snapshot_message(self):
+        return json.dumps({
+            'type': 'snapshot',
+            'seq': self.replay_buffer.latest_seq,
+            'displayed_response': self.answer_displayed,
+            'current_response': self.answer_current,
+            'api_call_count': self.api_call_count,
+            'budget': self.budget
+        })
+
 
     async def process_message(self, data, websocket):
         if data['type'] == 'control':
@@ -50,44 +123,123 @@ class WebSocketManager:
             elif action in ['resume', 'resume_listening']:
                 await self.assistant.resume()  # Call the assistant's resume method
                 self.logger.info("Listening resumed")
+            elif action == 'profiler':
+                await self.process_profiler_command(data.get('command'), websocket)
+            elif action == 'capture_stats':
+                await websocket.send(json.dumps({
+                    'type': 'capture_stats',
+                    'stats': self.assistant.audio_capture.stats()
+                }))
+            elif action == 'playback_stats':
+                playback = self.assistant.audio_playback
+                await websocket.send(json.dumps({
+                    'type': 'playback_stats',
+                    'stats': playback.stats() if playback is not None else None
+                }))
+            elif action == 'update_config':
+                result = await self.assistant.update_settings(data.get('settings') or {})
+                await websocket.send(json.dumps({
+                    'type': 'config',
+                    **result
+                }))
+            elif action == 'get_config':
+                await websocket.send(json.dumps({
+                    'type': 'config',
+                    'settings': self.assistant.live_settings()
+                }))
             else:
                 self.logger.warning(f"Unknown action received: {action}")
 
+    async def process_profiler_command(self, command, websocket):
+        # {"type": "control", "action": "profiler", "command": "start" | "stop" | "loop_lag"}
+        if command == 'start':
+            started = self.profiler.start()
+            await websocket.send(json.dumps({
+                'type': 'profiler',
+                'status': 'started' if started else 'already_running'
+            }))
+        elif command == 'stop':
+            path, samples = self.profiler.stop()
+            await websocket.send(json.dumps({
+                'type': 'profiler',
+                'status': 'stopped' if path else 'not_running',
+                'path': path,
+                'samples': samples,
+                'loop_lag': self.loop_monitor.stats()
+            }))
+        elif command == 'loop_lag':
+            await websocket.send(json.dumps({
+                'type': 'loop_lag',
+                'stats': self.loop_monitor.stats()
+            }))
+        else:
+            self.logger.warning(f"Unknown profiler command received: {command}")
+
     async def broadcast_new_response(self):
-        message = json.dumps({
+        self.answer_displayed = self.answer_current = ''
+        await self.broadcast_sequenced(lambda: json.dumps({
             'type': 'new_response'
-        })
-        await self.broadcast(message)
+        }), size=32)
 
     async def broadcast_status(self, status, is_listening):
-        message = json.dumps({
-            'type': 'status',
-            'status': status,
-            'is_listening': is_listening,
-            'is_paused': self.assistant.is_paused
-        })
-        await self.broadcast(message)
+        is_paused = self.assistant.is_paused
+        await self.broadcast_encoded(
+            lambda: json.dumps({
+                'type': 'status',
+                'status': status,
+                'is_listening': is_listening,
+                'is_paused': is_paused
+            }),
+            lambda: frame_codec.encode_status(status, is_listening, is_paused))
 
     async def broadcast_transcript(self, transcript_delta):
-        message = json.dumps({
-            'type': 'transcript',
-            'delta': transcript_delta
-        })
-        await self.broadcast(message)
+        await self.broadcast_sequenced(
+            lambda: json.dumps({
+                'type': 'transcript',
+                'delta': transcript_delta
+            }),
+            lambda seq: frame_codec.encode_transcript(transcript_delta, seq),
+            size=len(transcript_delta) + 32)
 
     async def broadcast_response(self, response):
-        message = json.dumps({
-            'type': 'response',
-            'data': response
-        })
-        await self.broadcast(message)
+        self.track_answer(response)
+        event_text = json.dumps(response)
+        await self.broadcast_sequenced(
+            lambda: '{"type": "response", "data": ' + event_text + '}',
+            lambda seq: frame_codec.encode_response(event_text, seq),
+            size=len(event_text) + 32)
+
+    async def broadcast_raw_response(self, raw_response):
+        # raw_response is an already-serialized API event; splice it in instead of re-encoding
+        await self.broadcast_sequenced(
+            lambda: '{"type": "response", "data": ' + raw_response + '}',
+            lambda seq: frame_codec.encode_response(raw_response, seq),
+            size=len(raw_response) + 32)
+
+    def track_answer(self, response):
+        # Mirrors how the frontend assembles the answer from response events
+        if response.get('type') == 'response.audio_transcript.delta':
+            if not self.answer_current and self.answer_displayed:
+                self.answer_displayed = ''
+            self.answer_current += response.get('delta', '')
+        elif response.get('type') == 'response.complete':
+            self.answer_displayed += self.answer_current
+            self.answer_current = ''
 
     async def broadcast_api_call_count(self, count):
-        message = json.dumps({
+        self.api_call_count = count
+        await self.broadcast_sequenced(lambda: json.dumps({
             'type': 'api_call_count',
             'count': count
+        }), size=48)
+
+    async def broadcast_budget(self, budget):
+        self.budget = budget
+        message = json.dumps({
+            'type': 'budget',
+            'budget': budget
         })
-        await self.broadcast(message)
+        await self.broadcast_sequenced(lambda: message, size=len(message))
 
     async def broadcast_error(self, error_message, error_code=None):
         message = json.dumps({
@@ -97,20 +249,61 @@ class WebSocketManager:
                 'code': error_code or 'unknown_error'
             }
         })
-        await self.broadcast(message)
+        await self.broadcast_sequenced(lambda: message, size=len(message))
 
     async def broadcast(self, message):
+        await self.broadcast_encoded(lambda: message)
+
+    async def broadcast_sequenced(self, encode_json, encode_binary=None, size=0):
+        # Numbered and kept in the replay buffer; status updates are not, a reconnecting client gets a fresh one
+        entry = self.replay_buffer.append(encode_json, encode_binary, size)
+        await self.broadcast_encoded(entry.json_message, entry.binary_message)
+
+    def client_stats(self):
+        # Bytes a client's socket has not taken yet are its share of the broadcast queue
+        send_buffers = [client.transport.get_write_buffer_size() for client in self.clients
+                        if getattr(client, 'transport', None) is not None]
+        return {
+            'clients': len(self.clients),
+            'binary_clients': len(self.binary_clients),
+            'replaying_clients': len(self.replay_backlogs),
+            'replay_backlog_messages': sum(len(backlog) for backlog in self.replay_backlogs.values()),
+            'send_buffer_bytes': sum(send_buffers),
+            'send_buffer_max_bytes': max(send_buffers, default=0),
+        }
+
+    async def broadcast_encoded(self, encode_json, encode_binary=None):
+        # Each encoding is produced at most once, and only if a connected client uses it
+        started = time.perf_counter()
+        json_message = binary_message = None
         disconnected_clients = []
         for client in self.clients:
+            if encode_binary is not None and client in self.binary_clients:
+                if binary_message is None:
+                    binary_message = encode_binary()
+                message = binary_message
+            else:
+                if json_message is None:
+                    json_message = encode_json()
+                message = json_message
+            backlog = self.replay_backlogs.get(client)
+            if backlog is not None:
+                backlog.append(message)
+                continue
             try:
                 await client.send(message)
             except websockets.exceptions.ConnectionClosed:
                 disconnected_clients.append(client)
         for client in disconnected_clients:
             self.clients.remove(client)
+            self.binary_clients.discard(client)
             self.logger.info(f"Removed disconnected client: {client.remote_address}")
+        metrics.STAGE_LATENCY.labels('broadcast').observe(time.perf_counter() - started)
 
     async def stop(self):
+        self.loop_monitor.stop()
+        if self.profiler.is_running:
+            self.profiler.stop()
         if self.server:
             self.server.close()
             await self.server.wait_closed()
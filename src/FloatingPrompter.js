@@ -7,6 +7,13 @@ const WEBSOCKET_URL = 'ws://localhost:8000';
 const RECONNECT_DELAY_MS = 5000; // 5 seconds
 const MAX_RECONNECT_ATTEMPTS = 5;
 const INITIAL_OPACITY = 0.6;
+// Negotiated at connect time; without it the backend sends JSON text frames
+const BINARY_SUBPROTOCOL = 'teleprompter.binary.v1';
+const FRAME_TRANSCRIPT = 0x01;
+const FRAME_RESPONSE = 0x02;
+const FRAME_STATUS = 0x03;
+const FRAME_HEADER_SIZE = 5;
+const textDecoder = new TextDecoder();
 
 // --- Helper Function ---
 const getBackgroundColorWithOpacity = (baseColor, opacity) => {
@@ -15,6 +22,28 @@ const getBackgroundColorWithOpacity = (baseColor, opacity) => {
   return `${baseColor} ${opacity})`;
 };
 
+// Binary frames are a type byte, a 4-byte sequence number and the payload (see backend/frame_codec.py);
+// decoded to the JSON message shape
+const decodeBinaryFrame = (buffer) => {
+  const bytes = new Uint8Array(buffer);
+  const seq = new DataView(buffer).getUint32(1) || undefined;
+  switch (bytes[0]) {
+    case FRAME_TRANSCRIPT:
+      return { type: 'transcript', seq, delta: textDecoder.decode(bytes.subarray(FRAME_HEADER_SIZE)) };
+    case FRAME_RESPONSE:
+      return { type: 'response', seq, data: JSON.parse(textDecoder.decode(bytes.subarray(FRAME_HEADER_SIZE))) };
+    case FRAME_STATUS:
+      return {
+        type: 'status',
+        status: textDecoder.decode(bytes.subarray(FRAME_HEADER_SIZE + 1)),
+        is_listening: (bytes[FRAME_HEADER_SIZE] & 0x01) !== 0,
+        is_paused: (bytes[FRAME_HEADER_SIZE] & 0x02) !== 0,
+      };
+    default:
+      throw new Error(`Unknown frame type ${bytes[0]}`);
+  }
+};
+
 // --- Sub-components ---
 
 const PrompterHeader = React.memo(({ opacity, isMinimized, isPaused, onMinimize, onPauseResume, onClose }) => (
@@ -98,11 +127,16 @@ const ResponseDisplay = React.memo(({ displayedResponse, currentResponse, opacit
   </div>
 ));
 
-const StatusBar = React.memo(({ apiCallCount }) => (
-  <div className="status-bar">
-    <p>API Calls Made: {apiCallCount}</p>
-  </div>
-));
+const StatusBar = React.memo(({ apiCallCount, budget }) => {
+  const tokens = budget?.server_limits?.tokens;
+  return (
+    <div className="status-bar">
+      <p>API Calls Made: {apiCallCount}</p>
+      {tokens && <p>Tokens Remaining: {tokens.remaining} / {tokens.limit}</p>}
+      {budget?.dispatch_delay > 0 && <p>Rate limited, next request in {budget.dispatch_delay}s</p>}
+    </div>
+  );
+});
 
 const OpacitySlider = React.memo(({ opacity, onChange }) => (
   <div className="opacity-control">
@@ -141,6 +175,7 @@ export default function FloatingPrompter() {
   const [isConnecting, setIsConnecting] = useState(false);
   const [reconnectAttempts, setReconnectAttempts] = useState(0);
   const [apiCallCount, setApiCallCount] = useState(0);
+  const [budget, setBudget] = useState(null); // Rate-limit budget published by the backend
   const [isPaused, setIsPaused] = useState(false);
   const [isListening, setIsListening] = useState(false);
   const [currentResponse, setCurrentResponse] = useState(''); // Streaming response part
@@ -152,6 +187,7 @@ export default function FloatingPrompter() {
   const [backendReady, setBackendReady] = useState(false); // Tracks if initial connection succeeded
 
   const ws = useRef(null);
+  const lastSeq = useRef(0); // Last numbered message seen, so a reconnect only replays what was missed
   const reconnectTimeout = useRef(null);
   const containerRef = useRef(null); // Ref for the main draggable container
 
@@ -194,7 +230,11 @@ export default function FloatingPrompter() {
   // --- WebSocket Message Receiving ---
   const handleWebSocketMessage = useCallback((event) => {
     try {
-      const data = JSON.parse(event.data);
+      const data = typeof event.data === 'string' ? JSON.parse(event.data) : decodeBinaryFrame(event.data);
+      if (data?.seq && data.type !== 'snapshot') {
+        if (data.seq <= lastSeq.current) return; // Already seen before the reconnect
+        lastSeq.current = data.seq;
+      }
       switch (data?.type) {
         case 'status':
           setIsListening(data.is_listening);
@@ -215,9 +255,20 @@ export default function FloatingPrompter() {
         case 'response': // This wraps the assistant's response chunks
           handleAssistantResponse(data.data);
           break;
+        case 'snapshot':
+          // Sent instead of a replay when we were disconnected for too long
+          lastSeq.current = data.seq;
+          setDisplayedResponse(data.displayed_response || '');
+          setCurrentResponse(data.current_response || '');
+          if (data.api_call_count !== null) setApiCallCount(data.api_call_count);
+          if (data.budget !== null) setBudget(data.budget);
+          break;
         case 'api_call_count':
           setApiCallCount(data.count);
           break;
+        case 'budget':
+          setBudget(data.budget);
+          break;
         case 'error':
           const errorMsg = data.error?.message || 'An unknown backend error occurred.';
           setError(errorMsg);
@@ -251,7 +302,9 @@ export default function FloatingPrompter() {
     setShowAlert(false);
 
     console.log(`Attempting to connect WebSocket (Attempt ${reconnectAttempts + 1})...`);
-    ws.current = new WebSocket(WEBSOCKET_URL);
+    const replayQuery = lastSeq.current ? `?last_seq=${lastSeq.current}` : '';
+    ws.current = new WebSocket(WEBSOCKET_URL + replayQuery, [BINARY_SUBPROTOCOL]);
+    ws.current.binaryType = 'arraybuffer';
 
     ws.current.onopen = () => {
       console.log('WebSocket Connected');
@@ -398,7 +451,7 @@ export default function FloatingPrompter() {
               currentResponse={currentResponse}
               opacity={opacity}
             />
-            <StatusBar apiCallCount={apiCallCount} />
+            <StatusBar apiCallCount={apiCallCount} budget={budget} />
             <OpacitySlider opacity={opacity} onChange={handleOpacityChange} />
           </div>
         )}
@@ -0,0 +1,71 @@
+"""Per-frame capture path (read_audio, is_speech) and the per-utterance resample."""
+import functools
+
+from bench_common import Case, SyntheticStream, recorded_pcm, run_cases, synthetic_pcm
+
+
+def make_capture(pcm):
+    from audio_capture import AudioCapture
+    from config import Config
+
+    config = Config()
+    capture = AudioCapture(config)  # Initializes PortAudio but never opens a device
+    capture.stream = SyntheticStream(capture, pcm)
+    return config, capture
+
+
+def make_multi_source_capture(pcms):
+    from config import Config
+    from multi_source_capture import MultiSourceCapture
+
+    config = Config()
+    config.capture_sources = [{'name': f"source{i}"} for i in range(len(pcms))]
+    capture = MultiSourceCapture(config)
+    streams = []
+    for source, pcm in zip(capture.sources, pcms):
+        source.stream = SyntheticStream(source, pcm)
+        streams.append(source.stream)
+
+    async def deliver_read_and_detect():
+        # One callback per source, then the aligned mix and per-source VAD the assistant loop runs
+        for stream in streams:
+            stream.capture._on_audio(stream.next_buffer(), stream.frames_per_buffer,
+                                     {'input_buffer_adc_time': stream.stream_time}, 0)
+            stream.stream_time += stream.frames_per_buffer / stream.capture.rate
+        await capture.is_speech(await capture.read_audio())
+
+    return deliver_read_and_detect
+
+
+def cases():
+    from openai_client import OpenAIClient
+    from response_processor import ResponseProcessor
+    from voice_assistant import VoiceAssistant
+
+    sources = {'synthetic': synthetic_pcm(5.0), 'recorded': recorded_pcm()}
+    for source, pcm in sources.items():
+        config, capture = make_capture(pcm)
+        chunk = pcm[:capture.chunk * capture.bytes_per_sample]
+        params = {'source': source, 'frame_ms': capture.frame_duration_ms}
+        yield Case(f"audio_capture.callback+read_audio[{source}]", capture.stream.deliver_and_read,
+                   number=300, params=params)
+        yield Case(f"audio_capture.is_speech[{source}]", functools.partial(capture.is_speech, chunk),
+                   number=300, params=params)
+
+    silence = bytes(len(sources['recorded']))
+    for label, pcms in (('speech+silence', [sources['recorded'], silence]),
+                        ('speech+speech', [sources['recorded'], sources['synthetic']])):
+        yield Case(f"multi_source_capture.read_audio+is_speech[{label}]", make_multi_source_capture(pcms),
+                   number=300, params={'sources': len(pcms)})
+
+    config, capture = make_capture(sources['recorded'])
+    assistant = VoiceAssistant(config, capture, OpenAIClient(config), None, ResponseProcessor(config))
+    for seconds in (1, 5):
+        utterance = sources['recorded'][:int(seconds * capture.rate) * capture.bytes_per_sample]
+        yield Case(f"voice_assistant.resample_for_api[{seconds}s]",
+                   functools.partial(assistant.resample_for_api, utterance),
+                   number=20, params={'seconds': seconds})
+
+
+if __name__ == "__main__":
+    run_cases(cases())
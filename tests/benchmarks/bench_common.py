@@ -0,0 +1,132 @@
+"""Shared helpers for the hardware-free benchmark suite in tests/benchmarks."""
+import asyncio
+import inspect
+import math
+import os
+import statistics
+import sys
+import time
+import wave
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.join(BENCH_DIR, '..', '..', 'backend')
+RECORDING_PATH = os.path.join(BENCH_DIR, '..', 'test5.wav')
+
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+
+class Case:
+    """One benchmark: `fn` is called `number` times per round, for `rounds` rounds."""
+
+    def __init__(self, name, fn, number=100, rounds=7, params=None):
+        self.name = name
+        self.fn = fn
+        self.number = number
+        self.rounds = rounds
+        self.params = params or {}
+
+
+def measure(case):
+    loop = asyncio.new_event_loop()
+    try:
+        if inspect.iscoroutinefunction(case.fn):
+            async def batch():
+                for _ in range(case.number):
+                    await case.fn()
+
+            run_batch = lambda: loop.run_until_complete(batch())  # noqa: E731
+        else:
+            def run_batch():
+                for _ in range(case.number):
+                    case.fn()
+
+        run_batch()  # Warm-up round, not recorded
+        per_call_us = []
+        for _ in range(case.rounds):
+            started = time.perf_counter()
+            run_batch()
+            per_call_us.append((time.perf_counter() - started) / case.number * 1e6)
+    finally:
+        loop.close()
+
+    return {
+        'name': case.name,
+        'params': case.params,
+        'number': case.number,
+        'rounds': case.rounds,
+        'median_us': statistics.median(per_call_us),
+        'min_us': min(per_call_us),
+        'stdev_us': statistics.stdev(per_call_us) if len(per_call_us) > 1 else 0.0,
+    }
+
+
+def format_result(result):
+    return f"{result['name']:<55} median {result['median_us']:>11.2f} us   min {result['min_us']:>11.2f} us"
+
+
+def run_cases(cases):
+    results = []
+    for case in cases:
+        result = measure(case)
+        print(format_result(result))
+        results.append(result)
+    return results
+
+
+def synthetic_pcm(seconds, rate=48000, frequency=220.0, amplitude=8000):
+    """Mono 16-bit PCM: a voiced tone with a slow envelope, so VAD sees speech-like energy."""
+    samples = int(seconds * rate)
+    data = bytearray(samples * 2)
+    for i in range(samples):
+        envelope = 0.5 + 0.5 * math.sin(2 * math.pi * 3 * i / rate)
+        value = int(amplitude * envelope * math.sin(2 * math.pi * frequency * i / rate))
+        data[2 * i:2 * i + 2] = value.to_bytes(2, 'little', signed=True)
+    return bytes(data)
+
+
+def recorded_pcm(rate=48000):
+    """tests/test5.wav (44.1 kHz stereo) converted to mono 16-bit PCM at `rate`."""
+    import numpy as np
+
+    with wave.open(RECORDING_PATH) as recording:
+        channels = recording.getnchannels()
+        source_rate = recording.getframerate()
+        samples = np.frombuffer(recording.readframes(recording.getnframes()), dtype=np.int16)
+    mono = samples.reshape(-1, channels)[:, 0].astype(np.float64)
+    target_times = np.arange(int(len(mono) * rate / source_rate)) / rate
+    resampled = np.interp(target_times, np.arange(len(mono)) / source_rate, mono)
+    return resampled.astype(np.int16).tobytes()
+
+
+class SyntheticStream:
+    """Stands in for a PyAudio callback stream attached to an AudioCapture, looping over a PCM buffer."""
+
+    def __init__(self, capture, pcm, sample_width=2, channels=1):
+        self.capture = capture
+        self.pcm = pcm
+        self.frames_per_buffer = capture.frames_per_buffer
+        self.frame_bytes = sample_width * channels
+        self.position = 0
+        self.stream_time = 0.0
+
+    def next_buffer(self):
+        size = self.frames_per_buffer * self.frame_bytes
+        if self.position + size > len(self.pcm):
+            self.position = 0
+        chunk = self.pcm[self.position:self.position + size]
+        self.position += size
+        return chunk
+
+    async def deliver_and_read(self):
+        # One PortAudio callback followed by the assistant loop reading the frame back
+        self.capture._on_audio(self.next_buffer(), self.frames_per_buffer,
+                               {'input_buffer_adc_time': self.stream_time}, 0)
+        self.stream_time += self.frames_per_buffer / self.capture.rate
+        return await self.capture.read_audio()
+
+    def stop_stream(self):
+        pass
+
+    def close(self):
+        pass
@@ -0,0 +1,75 @@
+"""Compare JSON decode CPU per response: full json.loads vs type-first EventDecoder.
+
+Run from the repository root:
+    python tests/benchmarks/bench_event_decoder.py
+"""
+import base64
+import json
+import os
+import time
+
+from bench_common import Case
+
+CONSUMED_TYPES = ['error', 'response.done', 'response.audio_transcript.delta', 'response.complete']
+
+
+def synthetic_response(audio_seconds=5.0, delta_ms=100, transcript_words=60):
+    """Build the frames of one spoken response the way the Realtime API streams them."""
+    frames = [json.dumps({'type': 'response.created', 'event_id': 'event_0',
+                          'response': {'id': 'resp_0', 'status': 'in_progress', 'output': []}})]
+    samples_per_delta = int(24000 * delta_ms / 1000)
+    pcm = os.urandom(samples_per_delta * 2)
+    for i in range(int(audio_seconds * 1000 / delta_ms)):
+        frames.append(json.dumps({'type': 'response.audio.delta', 'event_id': f'event_a{i}',
+                                  'response_id': 'resp_0', 'item_id': 'item_0', 'output_index': 0,
+                                  'content_index': 0, 'delta': base64.b64encode(pcm).decode('ascii')}))
+    for i in range(transcript_words):
+        frames.append(json.dumps({'type': 'response.audio_transcript.delta', 'event_id': f'event_t{i}',
+                                  'response_id': 'resp_0', 'item_id': 'item_0', 'output_index': 0,
+                                  'content_index': 0, 'delta': 'word '}))
+    frames.append(json.dumps({'type': 'response.done', 'event_id': 'event_done',
+                              'response': {'id': 'resp_0', 'status': 'completed',
+                                           'usage': {'total_tokens': 900, 'input_tokens': 300,
+                                                     'output_tokens': 600}}}))
+    return frames
+
+
+def cases():
+    from event_decoder import EventDecoder
+
+    frames = synthetic_response()
+    decoder = EventDecoder(consumers=CONSUMED_TYPES)
+
+    def decode_all(decode):
+        for frame in frames:
+            decode(frame)
+
+    params = {'frames': len(frames), 'bytes': sum(len(f) for f in frames)}
+    yield Case("event_decoder.json_loads[per response]", lambda: decode_all(json.loads), number=20, params=params)
+    yield Case("event_decoder.decode[per response]", lambda: decode_all(decoder.decode), number=20, params=params)
+
+
+def time_per_response(decode, frames, repeat):
+    start = time.process_time()
+    for _ in range(repeat):
+        for frame in frames:
+            decode(frame)
+    return (time.process_time() - start) / repeat
+
+
+def main(repeat=50):
+    from event_decoder import EventDecoder
+
+    frames = synthetic_response()
+    decoder = EventDecoder(consumers=CONSUMED_TYPES)
+    full = time_per_response(json.loads, frames, repeat)
+    lazy = time_per_response(decoder.decode, frames, repeat)
+    total_bytes = sum(len(f) for f in frames)
+    print(f"frames per response: {len(frames)} ({total_bytes / 1024:.0f} KiB)")
+    print(f"json.loads every frame: {full * 1000:.3f} ms CPU per response")
+    print(f"type-first decoder:     {lazy * 1000:.3f} ms CPU per response")
+    print(f"saved: {(full - lazy) * 1000:.3f} ms per response ({(1 - lazy / full) * 100:.1f}%)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Compare encode CPU and bytes on the wire for frontend messages: JSON text vs binary frames.
+
+Run from the repository root:
+    python tests/benchmarks/bench_frame_codec.py
+"""
+import json
+import time
+
+from bench_common import Case
+
+TRANSCRIPT_DELTA = 'interview '
+RESPONSE_EVENT = json.dumps({'type': 'response.audio_transcript.delta', 'event_id': 'event_t0',
+                             'response_id': 'resp_0', 'item_id': 'item_0', 'output_index': 0,
+                             'content_index': 0, 'delta': TRANSCRIPT_DELTA})
+
+
+def encoders():
+    """(name, JSON encoder, binary encoder) per message type, built the way WebSocketManager builds them."""
+    import frame_codec
+
+    return [
+        ('status',
+         lambda: json.dumps({'type': 'status', 'status': 'listening', 'is_listening': True, 'is_paused': False}),
+         lambda: frame_codec.encode_status('listening', True, False)),
+        ('transcript',
+         lambda: json.dumps({'type': 'transcript', 'delta': TRANSCRIPT_DELTA}),
+         lambda: frame_codec.encode_transcript(TRANSCRIPT_DELTA)),
+        ('response',
+         lambda: '{"type": "response", "data": ' + RESPONSE_EVENT + '}',
+         lambda: frame_codec.encode_response(RESPONSE_EVENT)),
+    ]
+
+
+def wire_bytes(message):
+    # Text frames go out UTF-8 encoded
+    return len(message.encode('utf-8')) if isinstance(message, str) else len(message)
+
+
+def cases():
+    for name, encode_json, encode_binary in encoders():
+        yield Case(f"frame_codec.json[{name}]", encode_json, number=5000,
+                   params={'bytes': wire_bytes(encode_json())})
+        yield Case(f"frame_codec.binary[{name}]", encode_binary, number=5000,
+                   params={'bytes': wire_bytes(encode_binary())})
+
+
+def time_per_message(encode, repeat):
+    start = time.process_time()
+    for _ in range(repeat):
+        encode()
+    return (time.process_time() - start) / repeat
+
+
+def main(repeat=200000):
+    print(f"{'message':<12} {'json us':>9} {'binary us':>10} {'json B':>8} {'binary B':>9}")
+    for name, encode_json, encode_binary in encoders():
+        json_us = time_per_message(encode_json, repeat) * 1e6
+        binary_us = time_per_message(encode_binary, repeat) * 1e6
+        print(f"{name:<12} {json_us:>9.3f} {binary_us:>10.3f} "
+              f"{wire_bytes(encode_json()):>8} {wire_bytes(encode_binary()):>9}")
+
+
+if __name__ == "__main__":
+    main()
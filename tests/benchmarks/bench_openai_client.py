@@ -0,0 +1,75 @@
+"""Outbound framing: base64 encoding of an utterance plus the input_audio_buffer.append JSON,
+and the whole send path (resample, G.711 encode, frame) per input_audio_format."""
+import asyncio
+import json
+
+from bench_common import Case, run_cases, synthetic_pcm
+
+UPLINK_BITS_PER_SECOND = 1_000_000  # A constrained conference-room uplink, for the upload time estimate
+
+
+def make_client(input_audio_format):
+    from config import Config
+    from openai_client import OpenAIClient
+    from outbound_queue import OutboundQueue
+
+    config = Config()
+    config.input_audio_format = input_audio_format
+    client = OpenAIClient(config)
+    client.outbound_queue = OutboundQueue()  # Filled by send_audio and emptied again, never written out
+    return config, client
+
+
+def make_send_path(input_audio_format, pcm):
+    # Same steps as VoiceAssistant.send_buffer_to_api: resample to the format's rate, then send_audio
+    from outbound_queue import BULK, CONTROL
+    from pydub import AudioSegment
+
+    config, client = make_client(input_audio_format)
+
+    async def send():
+        segment = AudioSegment(data=pcm, sample_width=2, frame_rate=config.rate, channels=1)
+        await client.send_audio(segment.set_frame_rate(client.input_rate).raw_data)
+        wire_bytes = client.outbound_queue.queued_bytes
+        await client.outbound_queue.clear(BULK)
+        await client.outbound_queue.clear(CONTROL)
+        return wire_bytes
+
+    return send
+
+
+def cases():
+    import g711
+    from config import Config
+    from openai_client import OpenAIClient
+
+    client = OpenAIClient(Config())
+    for seconds in (1, 5):
+        pcm = synthetic_pcm(seconds, rate=24000)
+
+        def frame_append(pcm=pcm):
+            return json.dumps({
+                "event_id": client.generate_event_id(),
+                "type": "input_audio_buffer.append",
+                "audio": client.encode_audio(pcm)
+            })
+
+        yield Case(f"openai_client.encode_audio+json[{seconds}s]", frame_append, number=50,
+                   params={'seconds': seconds, 'bytes': len(pcm)})
+
+    pcm = synthetic_pcm(5, rate=g711.G711_RATE)
+    for name, encode in (('ulaw', g711.encode_ulaw), ('alaw', g711.encode_alaw)):
+        yield Case(f"g711.encode_{name}[5s]", lambda encode=encode: encode(pcm), number=200,
+                   params={'seconds': 5, 'bytes': len(pcm)})
+
+    utterance = synthetic_pcm(5, rate=48000)
+    for input_audio_format in g711.INPUT_FORMATS:
+        # Bytes on the wire come from a separate run, outside the timed loop
+        wire_bytes = asyncio.run(make_send_path(input_audio_format, utterance)())
+        yield Case(f"openai_client.send_path[{input_audio_format},5s]", make_send_path(input_audio_format, utterance),
+                   number=20, params={'format': input_audio_format, 'seconds': 5, 'wire_bytes': wire_bytes,
+                                      'upload_ms': round(wire_bytes * 8 / UPLINK_BITS_PER_SECOND * 1000)})
+
+
+if __name__ == "__main__":
+    run_cases(cases())
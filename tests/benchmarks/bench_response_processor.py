@@ -0,0 +1,22 @@
+"""ResponseProcessor over long transcripts, called per delta the way handle_api_responses does."""
+from bench_common import Case, run_cases
+
+
+def cases():
+    from config import Config
+    from response_processor import ResponseProcessor
+
+    processor = ResponseProcessor(Config())
+    for deltas in (200, 2000):
+        def stream_transcript(deltas=deltas):
+            processor.clear_transcript()
+            for i in range(deltas):
+                processor.process_transcript_delta(" word")
+                processor.is_question(processor.get_full_transcript())
+
+        yield Case(f"response_processor.transcript[{deltas} deltas]", stream_transcript, number=3,
+                   rounds=5, params={'deltas': deltas})
+
+
+if __name__ == "__main__":
+    run_cases(cases())
@@ -0,0 +1,43 @@
+"""WebSocketManager.broadcast fan-out to in-process clients."""
+import functools
+import json
+
+from bench_common import Case, run_cases
+
+
+class NullClient:
+    def __init__(self, index):
+        self.remote_address = ('127.0.0.1', 50000 + index)
+
+    async def send(self, message):
+        pass
+
+
+class IdleAssistant:
+    is_running = True
+    is_paused = False
+
+
+def cases():
+    from websocket_manager import WebSocketManager
+
+    message = json.dumps({'type': 'status', 'status': 'listening', 'is_listening': True, 'is_paused': False})
+    for count in (1, 10, 100):
+        manager = WebSocketManager(IdleAssistant())
+        manager.clients = {NullClient(i) for i in range(count)}
+        yield Case(f"websocket_manager.broadcast[{count} clients]", functools.partial(manager.broadcast, message),
+                   number=500, params={'clients': count})
+        yield Case(f"websocket_manager.broadcast_status[{count} clients]",
+                   functools.partial(manager.broadcast_status, "listening", True),
+                   number=500, params={'clients': count})
+
+    manager = WebSocketManager(IdleAssistant())
+    manager.clients = {NullClient(i) for i in range(10)}
+    manager.binary_clients = set(manager.clients)
+    yield Case("websocket_manager.broadcast_status[10 binary clients]",
+               functools.partial(manager.broadcast_status, "listening", True),
+               number=500, params={'clients': 10, 'encoding': 'binary'})
+
+
+if __name__ == "__main__":
+    run_cases(cases())
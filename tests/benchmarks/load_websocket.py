@@ -0,0 +1,257 @@
+"""Load-test WebSocketManager fan-out with many simulated frontend clients.
+
+Run from the repository root:
+    python tests/benchmarks/load_websocket.py --clients 100 --duration 10
+    python tests/benchmarks/load_websocket.py --clients 100 --slow-clients 5 --slow-read-ms 200 --output load.json
+
+A real WebSocketManager serves on a local port and broadcasts a synthetic event stream:
+statuses at the capture frame rate, transcript deltas and raw API response events. The
+clients run in separate processes so they don't share the server's event loop; each reads
+at full speed, or sleeps --slow-read-ms after every message. Every message carries its
+send time (CLOCK_MONOTONIC, shared by all processes), so clients measure delivery latency.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import time
+import tracemalloc
+
+from bench_common import BACKEND_DIR  # noqa: F401  Puts the backend on sys.path, also in spawned clients
+
+DONE_STATUS = 'bench:done'
+PERCENTILES = (50, 90, 99)
+
+
+class LoadAssistant:
+    is_running = True
+    is_paused = False
+
+
+def percentiles(values):
+    if not values:
+        return None
+    values = sorted(values)
+    result = {f"p{p}": round(values[min(len(values) - 1, len(values) * p // 100)], 2) for p in PERCENTILES}
+    result['max'] = round(values[-1], 2)
+    return result
+
+
+def rss_bytes():
+    # Linux only; None elsewhere
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return None
+
+
+def sent_ns(message):
+    # Returns (kind, send time) of a harness message, or (None, None) for anything else
+    import frame_codec
+
+    data = frame_codec.decode_frame(message) if isinstance(message, bytes) else json.loads(message)
+    kind = data.get('type')
+    if kind == 'status':
+        status = data.get('status', '')
+        if status == DONE_STATUS:
+            return 'done', None
+        if status.startswith('bench:'):
+            return kind, int(status[6:])
+    elif kind == 'transcript':
+        return kind, int(data['delta'].split(' ', 1)[0])
+    elif kind == 'response':
+        return kind, data['data'].get('sent_ns')
+    return None, None
+
+
+async def run_client(url, binary, read_delay, latencies, connecting):
+    import websockets
+    from frame_codec import BINARY_SUBPROTOCOL, JSON_SUBPROTOCOL
+
+    group = 'slow' if read_delay else 'fast'
+    async with connecting:  # Avoid a handshake storm on the server
+        ws = await websockets.connect(url, subprotocols=[BINARY_SUBPROTOCOL if binary else JSON_SUBPROTOCOL])
+    try:
+        async for message in ws:
+            received = time.monotonic_ns()
+            kind, sent = sent_ns(message)
+            if kind == 'done':
+                return
+            if sent is not None:
+                latencies[group].setdefault(kind, []).append((received - sent) / 1e6)
+            if read_delay:
+                await asyncio.sleep(read_delay)
+    finally:
+        await ws.close()
+
+
+async def run_clients(url, specs, timeout):
+    latencies = {'fast': {}, 'slow': {}}
+    connecting = asyncio.Semaphore(50)
+    tasks = [asyncio.create_task(run_client(url, binary, read_delay, latencies, connecting))
+             for binary, read_delay in specs]
+    done, pending = await asyncio.wait(tasks, timeout=timeout)
+    for task in pending:
+        task.cancel()
+    errors = [repr(task.exception()) for task in done if task.exception()]
+    return {'latencies': latencies, 'timed_out': len(pending), 'errors': errors}
+
+
+def client_process(url, specs, timeout, results):
+    results.put(asyncio.run(run_clients(url, specs, timeout)))
+
+
+async def stream(interval, send, stop_at, timings):
+    # Fixed-rate schedule; a slow broadcast delays the next send but the rate catches up
+    next_send = time.monotonic()
+    while next_send < stop_at:
+        started = time.monotonic()
+        await send(time.monotonic_ns())
+        timings.append((time.monotonic() - started) * 1000)
+        next_send += interval
+        await asyncio.sleep(max(0.0, next_send - time.monotonic()))
+
+
+async def produce(manager, args):
+    filler = 'x' * max(0, args.response_bytes - 80)
+    timings = {'status': [], 'transcript': [], 'response': []}
+
+    async def status(ns):
+        await manager.broadcast_status(f"bench:{ns}", True)
+
+    async def transcript(ns):
+        await manager.broadcast_transcript(f"{ns} lorem ipsum ")
+
+    async def response(ns):
+        await manager.broadcast_raw_response(
+            f'{{"type": "response.text.delta", "sent_ns": {ns}, "delta": "{filler}"}}')
+
+    stop_at = time.monotonic() + args.duration
+    await asyncio.gather(
+        stream(args.frame_ms / 1000, status, stop_at, timings['status']),
+        stream(args.transcript_interval_ms / 1000, transcript, stop_at, timings['transcript']),
+        stream(args.response_interval_ms / 1000, response, stop_at, timings['response']),
+    )
+    return timings
+
+
+async def run(args):
+    from diagnostics import LoopLagMonitor
+    from websocket_manager import WebSocketManager
+
+    manager = WebSocketManager(LoadAssistant())
+    await manager.start(port=args.port)
+    url = f"ws://localhost:{args.port}"
+
+    # (binary, read delay) per client: slow clients first, then binary clients among the rest
+    specs = [(i >= args.slow_clients and i < args.slow_clients + args.binary_clients,
+              args.slow_read_ms / 1000 if i < args.slow_clients else 0.0) for i in range(args.clients)]
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    timeout = args.duration + args.drain_timeout + 30
+    processes = [context.Process(target=client_process, args=(url, specs[i::args.client_processes], timeout, results))
+                 for i in range(args.client_processes)]
+
+    tracemalloc.start()
+    memory_before = tracemalloc.get_traced_memory()[0]
+    for process in processes:
+        process.start()
+    connect_deadline = time.monotonic() + 30
+    while len(manager.clients) < args.clients:
+        if time.monotonic() > connect_deadline:
+            raise RuntimeError(f"Only {len(manager.clients)} of {args.clients} clients connected")
+        await asyncio.sleep(0.05)
+    memory_per_client = (tracemalloc.get_traced_memory()[0] - memory_before) / args.clients
+    tracemalloc.stop()
+    print(f"{args.clients} clients connected, {memory_per_client / 1024:.1f} KiB of Python heap each")
+
+    # Measure loop lag over the traffic phase only
+    manager.loop_monitor.stop()
+    manager.loop_monitor = LoopLagMonitor()
+    manager.loop_monitor.start()
+    rss_before = rss_bytes()
+    started = time.monotonic()
+    timings = await produce(manager, args)
+    produced_for = time.monotonic() - started
+    await manager.broadcast_status(DONE_STATUS, False)
+
+    loop = asyncio.get_running_loop()
+    client_results = []
+    for _ in processes:
+        client_results.append(await loop.run_in_executor(None, results.get, True, timeout))
+    drained_after = time.monotonic() - started - produced_for
+    rss_after = rss_bytes()
+    for process in processes:
+        process.join()
+    await manager.stop()
+
+    latencies = {'fast': {}, 'slow': {}}
+    for result in client_results:
+        for group, kinds in result['latencies'].items():
+            for kind, values in kinds.items():
+                latencies[group].setdefault(kind, []).extend(values)
+    delivered = sum(len(values) for kinds in latencies.values() for values in kinds.values())
+    sent = {kind: len(values) for kind, values in timings.items()}
+    return {
+        'params': vars(args),
+        'sent': sent,
+        'sent_per_second': round(sum(sent.values()) / produced_for, 1),
+        'delivered': delivered,
+        'delivered_per_second': round(delivered / (produced_for + drained_after), 1),
+        'drain_seconds': round(drained_after, 2),
+        'latency_ms': {group: {kind: percentiles(values) for kind, values in kinds.items()}
+                       for group, kinds in latencies.items() if kinds},
+        'broadcast_ms': {kind: percentiles(values) for kind, values in timings.items()},
+        'memory_per_client_bytes': round(memory_per_client),
+        'rss_growth_bytes': rss_after - rss_before if rss_before is not None else None,
+        'loop_lag': manager.loop_monitor.stats(),
+        'replay_buffer': manager.replay_buffer.stats(),
+        'timed_out_clients': sum(result['timed_out'] for result in client_results),
+        'client_errors': [error for result in client_results for error in result['errors']],
+    }
+
+
+def print_report(report):
+    print(f"Sent {report['sent_per_second']} msg/s for {report['params']['duration']} s, "
+          f"delivered {report['delivered_per_second']} msg/s, drained {report['drain_seconds']} s after the last send")
+    for group, kinds in report['latency_ms'].items():
+        for kind, stats in kinds.items():
+            print(f"  delivery latency {group:<4} {kind:<10} {stats}")
+    for kind, stats in report['broadcast_ms'].items():
+        print(f"  broadcast call   {kind:<15} {stats}")
+    print(f"  loop lag max {report['loop_lag']['max_ms']} ms, histogram {report['loop_lag']['histogram']}")
+    print(f"  memory per client {report['memory_per_client_bytes']} B, RSS growth {report['rss_growth_bytes']} B")
+    if report['timed_out_clients'] or report['client_errors']:
+        print(f"  {report['timed_out_clients']} clients timed out, errors: {report['client_errors']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=20)
+    parser.add_argument('--slow-clients', type=int, default=0, help="How many of the clients read slowly")
+    parser.add_argument('--slow-read-ms', type=float, default=100, help="Pause of a slow client after each message")
+    parser.add_argument('--binary-clients', type=int, default=0, help="How many fast clients negotiate binary frames")
+    parser.add_argument('--duration', type=float, default=10, help="Seconds of synthetic traffic")
+    parser.add_argument('--frame-ms', type=float, default=30, help="Status interval, one per captured frame")
+    parser.add_argument('--transcript-interval-ms', type=float, default=50)
+    parser.add_argument('--response-interval-ms', type=float, default=100)
+    parser.add_argument('--response-bytes', type=int, default=400, help="Approximate size of each raw response event")
+    parser.add_argument('--client-processes', type=int, default=1)
+    parser.add_argument('--drain-timeout', type=float, default=30,
+                        help="Seconds slow clients get to catch up after the traffic stops")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--output', help="Write the report to this JSON file")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote report to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
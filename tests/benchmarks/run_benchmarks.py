@@ -0,0 +1,107 @@
+"""Run the hardware-free benchmark suite and optionally compare against an earlier run.
+
+Run from the repository root:
+    python tests/benchmarks/run_benchmarks.py --output bench_output.json
+    python tests/benchmarks/run_benchmarks.py --compare bench_output.json --threshold 0.15
+
+Results are JSON (per-call median/min/stdev in microseconds), so runs from two commits
+can be diffed. With --compare the exit status is 1 when any case got slower than the
+threshold allows.
+"""
+import argparse
+import importlib
+import json
+import platform
+import subprocess
+import sys
+import time
+
+from bench_common import BENCH_DIR, format_result, measure
+
+MODULES = [
+    'bench_audio',
+    'bench_openai_client',
+    'bench_event_decoder',
+    'bench_websocket',
+    'bench_frame_codec',
+    'bench_response_processor',
+]
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=BENCH_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def collect(modules, name_filter=None):
+    results, skipped = [], []
+    for module_name in modules:
+        try:
+            cases = list(importlib.import_module(module_name).cases())
+        except ImportError as e:
+            # The backend's audio and network dependencies may be missing on a bare machine
+            print(f"{module_name}: skipped ({e})")
+            skipped.append({'module': module_name, 'reason': str(e)})
+            continue
+        for case in cases:
+            if name_filter and name_filter not in case.name:
+                continue
+            result = measure(case)
+            print(format_result(result))
+            results.append(result)
+    return results, skipped
+
+
+def compare(results, baseline_path, threshold):
+    with open(baseline_path) as f:
+        baseline = {result['name']: result for result in json.load(f)['results']}
+    regressions = []
+    print(f"\nComparison against {baseline_path} (threshold {threshold:.0%}):")
+    for result in results:
+        previous = baseline.get(result['name'])
+        if previous is None:
+            print(f"{result['name']:<55} new")
+            continue
+        ratio = result['median_us'] / previous['median_us']
+        marker = "REGRESSION" if ratio > 1 + threshold else ""
+        print(f"{result['name']:<55} {previous['median_us']:>11.2f} -> {result['median_us']:>11.2f} us "
+              f"({ratio - 1:+.1%}) {marker}")
+        if marker:
+            regressions.append(result['name'])
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--output', help="Write machine-readable results to this JSON file")
+    parser.add_argument('--compare', help="Baseline JSON file from an earlier run")
+    parser.add_argument('--threshold', type=float, default=0.15,
+                        help="Allowed slowdown of the median before a case counts as a regression")
+    parser.add_argument('--filter', help="Only run cases whose name contains this string")
+    args = parser.parse_args()
+
+    results, skipped = collect(MODULES, args.filter)
+    report = {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results,
+        'skipped': skipped,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nWrote {len(results)} results to {args.output}")
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,8 @@
+"""Hardware-free unit tests of the backend modules. Run with `python -m pytest tests/unit`."""
+import os
+import sys
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'backend')
+
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
@@ -0,0 +1,95 @@
+import asyncio
+from types import SimpleNamespace
+
+from conversation_context import SUMMARY_PREFIX, ConversationContext
+
+
+def make_context(token_budget=1000, prune_mode='delete', keep_recent_items=2, summary_max_chars=2000):
+    config = SimpleNamespace(context_token_budget=token_budget, context_prune_mode=prune_mode,
+                             context_keep_recent_items=keep_recent_items,
+                             context_summary_max_chars=summary_max_chars, audio_tokens_per_second=10)
+    sent = []
+
+    async def send_event(event):
+        sent.append(event)
+
+    return ConversationContext(config, send_event), sent
+
+
+def item_created(item_id, role, text=None):
+    content = [{'type': 'text', 'text': text}] if text else []
+    return {'type': 'conversation.item.created',
+            'item': {'id': item_id, 'type': 'message', 'role': role, 'content': content}}
+
+
+def response_done(input_tokens, output_tokens, output_ids=()):
+    return {'type': 'response.done', 'response': {
+        'usage': {'input_tokens': input_tokens, 'output_tokens': output_tokens},
+        'output': [{'id': item_id, 'content': []} for item_id in output_ids],
+    }}
+
+
+def observe_all(context, events):
+    async def run():
+        for event in events:
+            await context.observe(event)
+
+    asyncio.run(run())
+
+
+def test_user_audio_items_are_sized_by_the_audio_sent():
+    context, _ = make_context()
+    context.note_audio_sent(48000 * 3, bytes_per_second=48000)
+    observe_all(context, [item_created('user_1', 'user'), item_created('asst_1', 'assistant', 'x' * 40)])
+    assert context.items['user_1']['tokens'] == 30
+    assert context.items['asst_1']['tokens'] == 10
+
+
+def test_within_budget_nothing_is_pruned():
+    context, sent = make_context(token_budget=1000)
+    observe_all(context, [item_created('a', 'assistant', 'x' * 400), response_done(500, 100, ['a'])])
+    assert sent == []
+    assert context.context_tokens == 600
+
+
+def test_prune_deletes_the_oldest_items_but_keeps_the_recent_ones():
+    context, sent = make_context(token_budget=100, keep_recent_items=2)
+    events = [item_created(f'item_{n}', 'assistant', 'x' * 400) for n in range(5)]
+    observe_all(context, events + [response_done(250, 0)])
+
+    deleted = [event['item_id'] for event in sent if event['type'] == 'conversation.item.delete']
+    assert deleted == ['item_0', 'item_1']  # 100 tokens each, until the 150 excess is freed
+    assert list(context.items) == ['item_2', 'item_3', 'item_4']
+    assert context.context_tokens == 50
+    assert not any(event['type'] == 'conversation.item.create' for event in sent)
+
+
+def test_summarize_mode_replaces_pruned_items_with_a_summary():
+    context, sent = make_context(token_budget=100, prune_mode='summarize', keep_recent_items=1)
+    events = [item_created('q', 'user', 'What is the plan?'), item_created('a', 'assistant', 'x' * 800)]
+    observe_all(context, events + [response_done(300, 0)])
+
+    created = [event for event in sent if event['type'] == 'conversation.item.create']
+    assert len(created) == 1
+    text = created[0]['item']['content'][0]['text']
+    assert text.startswith(SUMMARY_PREFIX)
+    assert 'User: What is the plan?' in text
+    assert created[0]['previous_item_id'] == 'root'
+    assert context.summary_item_id == created[0]['item']['id']
+
+
+def test_reseed_carries_a_summary_into_the_new_session():
+    context, sent = make_context(token_budget=None)
+    observe_all(context, [item_created('q', 'user', 'Hello there'), item_created('a', 'assistant', 'Hi')])
+    asyncio.run(context.reseed())
+
+    assert context.items == {} and context.context_tokens == 0
+    created = [event for event in sent if event['type'] == 'conversation.item.create']
+    assert len(created) == 1
+    assert created[0]['item']['content'][0]['text'] == f"{SUMMARY_PREFIX}\nUser: Hello there\nAssistant: Hi"
+
+
+def test_reseed_of_an_empty_conversation_sends_nothing():
+    context, sent = make_context()
+    asyncio.run(context.reseed())
+    assert sent == []
@@ -0,0 +1,76 @@
+from types import SimpleNamespace
+
+import pytest
+
+from dispatch_scheduler import DispatchScheduler
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_scheduler(token_budget=None, request_budget=None, window=60, default_tokens=1000):
+    config = SimpleNamespace(budget_window_seconds=window, token_budget_per_window=token_budget,
+                             request_budget_per_window=request_budget, default_response_tokens=default_tokens)
+    clock = FakeClock()
+    return DispatchScheduler(config, clock=clock), clock
+
+
+def test_no_budgets_never_delays():
+    scheduler, _ = make_scheduler()
+    for _ in range(100):
+        scheduler.record_request()
+    assert scheduler.delay_before_dispatch() == 0
+
+
+def test_request_budget_waits_for_the_oldest_request_to_leave_the_window():
+    scheduler, clock = make_scheduler(request_budget=2, window=60)
+    scheduler.record_request()
+    clock.now += 10
+    scheduler.record_request()
+    clock.now += 5
+    assert scheduler.delay_before_dispatch() == pytest.approx(45)
+
+    clock.now += 45  # The first request is exactly one window old
+    assert scheduler.delay_before_dispatch() == 0
+    assert scheduler.state()['requests_in_window'] == 1
+
+
+def test_token_budget_uses_the_average_of_recent_responses():
+    scheduler, clock = make_scheduler(token_budget=1000, window=60, default_tokens=100)
+    assert scheduler.estimated_tokens() == 100
+    scheduler.record_usage({'total_tokens': 600})
+    clock.now += 20
+    scheduler.record_usage({'total_tokens': 200})
+    assert scheduler.estimated_tokens() == 400
+    # 800 used + 400 estimated > 1000: wait until the 600 expires, 40 s from now
+    assert scheduler.delay_before_dispatch() == pytest.approx(40)
+
+    clock.now += 40
+    assert scheduler.delay_before_dispatch() == 0
+
+
+def test_usage_without_tokens_is_ignored():
+    scheduler, _ = make_scheduler(default_tokens=123)
+    scheduler.record_usage({})
+    assert scheduler.estimated_tokens() == 123
+    assert scheduler.state()['tokens_in_window'] == 0
+
+
+def test_server_limits_delay_until_reset():
+    scheduler, clock = make_scheduler(default_tokens=500)
+    scheduler.update_rate_limits([
+        {'name': 'requests', 'limit': 100, 'remaining': 0, 'reset_seconds': 3},
+        {'name': 'tokens', 'limit': 10000, 'remaining': 400, 'reset_seconds': 7},
+    ])
+    assert scheduler.delay_before_dispatch() == pytest.approx(7)
+    clock.now += 7
+    assert scheduler.delay_before_dispatch() == 0
+
+    scheduler.update_rate_limits([{'name': 'tokens', 'limit': 10000, 'remaining': 9000, 'reset_seconds': 30}])
+    assert scheduler.delay_before_dispatch() == 0
+    assert scheduler.state()['server_limits']['tokens']['reset_seconds'] == 30
@@ -0,0 +1,58 @@
+import json
+
+import pytest
+
+from event_decoder import EventDecoder, RawEvent
+
+DELTA = '{"type": "response.audio.delta", "response_id": "resp_1", "delta": "AAAA"}'
+
+
+@pytest.mark.parametrize('frame', [DELTA, DELTA.encode('utf-8'), '  {\n  "type" :"response.audio.delta", "x": 1}'])
+def test_peek_type_reads_the_leading_type(frame):
+    assert EventDecoder().peek_type(frame) == 'response.audio.delta'
+
+
+@pytest.mark.parametrize('frame', [
+    '{"event_id": "event_1", "type": "response.done"}',  # type is not the first key
+    '{"type": 5}',
+    'not json',
+    '{' + ' ' * 200 + '"type": "response.done"}',  # Beyond the scan limit
+])
+def test_peek_type_gives_up_on_other_layouts(frame):
+    assert EventDecoder().peek_type(frame) is None
+
+
+def test_registered_types_are_parsed_and_others_deferred():
+    decoder = EventDecoder(consumers=['response.done'])
+    done = decoder.decode('{"type": "response.done", "response": {"id": "resp_1"}}')
+    assert done == {'type': 'response.done', 'response': {'id': 'resp_1'}}
+
+    delta = decoder.decode(DELTA)
+    assert isinstance(delta, RawEvent)
+    assert delta.type == 'response.audio.delta'
+    assert delta.raw_text() == DELTA
+    assert decoder.stats == {'parsed': 1, 'deferred': 1, 'fallback': 0}
+
+
+def test_unexpected_layout_falls_back_to_a_full_parse():
+    decoder = EventDecoder()
+    event = decoder.decode('{"event_id": "event_1", "type": "response.audio.delta"}')
+    assert event == {'event_id': 'event_1', 'type': 'response.audio.delta'}
+    assert decoder.stats['fallback'] == 1
+
+
+def test_register_and_unregister():
+    decoder = EventDecoder()
+    decoder.register('response.audio.delta')
+    assert isinstance(decoder.decode(DELTA), dict)
+    decoder.unregister('response.audio.delta')
+    assert isinstance(decoder.decode(DELTA), RawEvent)
+
+
+def test_raw_event_parses_lazily_and_once():
+    event = RawEvent('response.audio.delta', DELTA.encode('utf-8'))
+    assert len(event) == len(DELTA)
+    assert event.raw_text() == DELTA
+    parsed = event.parse()
+    assert parsed == json.loads(DELTA)
+    assert event.parse() is parsed
@@ -0,0 +1,35 @@
+import json
+
+import pytest
+
+import frame_codec
+
+
+@pytest.mark.parametrize('delta', ['', 'hello', 'café — 日本'])
+def test_transcript_round_trip(delta):
+    assert frame_codec.decode_frame(frame_codec.encode_transcript(delta)) == {'type': 'transcript', 'delta': delta}
+
+
+def test_response_round_trip_matches_the_json_message():
+    event = {'type': 'response.done', 'response': {'id': 'resp_1', 'status': 'completed'}}
+    frame = frame_codec.encode_response(json.dumps(event))
+    assert frame_codec.decode_frame(frame) == {'type': 'response', 'data': event}
+
+
+@pytest.mark.parametrize('is_listening', [False, True])
+@pytest.mark.parametrize('is_paused', [False, True])
+def test_status_round_trip(is_listening, is_paused):
+    frame = frame_codec.encode_status('listening', is_listening, is_paused)
+    assert frame_codec.decode_frame(frame) == {
+        'type': 'status', 'status': 'listening', 'is_listening': is_listening, 'is_paused': is_paused,
+    }
+
+
+def test_sequence_number_is_kept_only_when_set():
+    assert frame_codec.decode_frame(frame_codec.encode_transcript('a', seq=70000))['seq'] == 70000
+    assert 'seq' not in frame_codec.decode_frame(frame_codec.encode_transcript('a'))
+
+
+def test_unknown_frame_type_is_rejected():
+    with pytest.raises(ValueError):
+        frame_codec.decode_frame(frame_codec.HEADER.pack(0x7F, 0) + b'x')
@@ -0,0 +1,31 @@
+import warnings
+
+import numpy as np
+import pytest
+
+import g711
+
+with warnings.catch_warnings():
+    warnings.simplefilter('ignore', DeprecationWarning)
+    audioop = pytest.importorskip('audioop')  # Removed in Python 3.13
+
+ALL_SAMPLES = np.arange(-32768, 32768, dtype='<i2').tobytes()
+
+
+def test_ulaw_matches_audioop_for_every_sample():
+    assert g711.encode_ulaw(ALL_SAMPLES) == audioop.lin2ulaw(ALL_SAMPLES, 2)
+
+
+def test_alaw_matches_audioop_for_every_sample():
+    assert g711.encode_alaw(ALL_SAMPLES) == audioop.lin2alaw(ALL_SAMPLES, 2)
+
+
+def test_one_byte_per_sample():
+    assert len(g711.encode_ulaw(b'\x00\x00' * 160)) == 160
+    assert g711.encode_alaw(b'') == b''
+
+
+def test_input_formats():
+    assert g711.INPUT_FORMATS['pcm16'] == (24000, None)
+    assert g711.INPUT_FORMATS['g711_ulaw'] == (8000, g711.encode_ulaw)
+    assert g711.INPUT_FORMATS['g711_alaw'] == (8000, g711.encode_alaw)
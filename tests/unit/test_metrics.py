@@ -0,0 +1,120 @@
+import asyncio
+
+import pytest
+
+from metrics import MetricsRegistry, MetricsServer
+
+
+def lines(registry):
+    return registry.render().splitlines()
+
+
+def test_counter_and_gauge_render_in_text_format():
+    registry = MetricsRegistry()
+    frames = registry.counter('frames_total', "Frames read")
+    depth = registry.gauge('queue_depth', "Queue depth")
+    frames.inc()
+    frames.inc(2)
+    depth.set(1.5)
+    assert lines(registry) == [
+        '# HELP teleprompter_frames_total Frames read',
+        '# TYPE teleprompter_frames_total counter',
+        'teleprompter_frames_total 3',
+        '# HELP teleprompter_queue_depth Queue depth',
+        '# TYPE teleprompter_queue_depth gauge',
+        'teleprompter_queue_depth 1.5',
+    ]
+
+
+def test_labelled_children_are_sorted_and_escaped():
+    registry = MetricsRegistry()
+    events = registry.counter('events_total', "Events", labels=['type'])
+    events.labels('b').inc()
+    events.labels('a"\\\n').inc(4)
+    assert lines(registry)[2:] == [
+        'teleprompter_events_total{type="a\\"\\\\\\n"} 4',
+        'teleprompter_events_total{type="b"} 1',
+    ]
+
+
+def test_wrong_label_count_and_duplicate_names_are_rejected():
+    registry = MetricsRegistry()
+    events = registry.counter('events_total', "Events", labels=['type'])
+    with pytest.raises(ValueError):
+        events.labels('a', 'b')
+    with pytest.raises(ValueError):
+        registry.gauge('events_total', "Again")
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = MetricsRegistry()
+    latency = registry.histogram('latency_seconds', "Latency", labels=['stage'], buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        latency.labels('send').observe(value)
+    assert lines(registry)[2:] == [
+        'teleprompter_latency_seconds_bucket{stage="send",le="0.1"} 2',
+        'teleprompter_latency_seconds_bucket{stage="send",le="1"} 3',
+        'teleprompter_latency_seconds_bucket{stage="send",le="+Inf"} 4',
+        'teleprompter_latency_seconds_sum{stage="send"} 3.65',
+        'teleprompter_latency_seconds_count{stage="send"} 4',
+    ]
+
+
+def test_collectors_flatten_stats_at_render_time():
+    registry = MetricsRegistry()
+    stats = {'depth': 2, 'open': True, 'name': 'ignored', 'missing': None, 'wait_ms': {'max': 1.25}}
+    registry.register_collector('queue', "Queue stats", lambda: stats)
+    registry.register_collector('empty', "Nothing yet", lambda: None)
+    registry.register_collector('broken', "Fails", lambda: 1 / 0)
+    stats['depth'] = 3
+    assert lines(registry) == [
+        '# HELP teleprompter_queue Queue stats',
+        '# TYPE teleprompter_queue gauge',
+        'teleprompter_queue{stat="depth"} 3',
+        'teleprompter_queue{stat="open"} 1',
+        'teleprompter_queue{stat="wait_ms_max"} 1.25',
+    ]
+
+
+async def fetch(port, path):
+    reader, writer = await asyncio.open_connection('localhost', port)
+    writer.write(f"GET {path} HTTP/1.0\r\nHost: localhost\r\n\r\n".encode('latin-1'))
+    response = await reader.read()
+    writer.close()
+    return response
+
+
+def test_server_serves_metrics_and_404s_other_paths():
+    registry = MetricsRegistry()
+    registry.counter('frames_total', "Frames read").inc()
+
+    async def run():
+        server = MetricsServer(registry, port=0)
+        await server.start()
+        port = server.server.sockets[0].getsockname()[1]
+        try:
+            return await fetch(port, '/metrics'), await fetch(port, '/other')
+        finally:
+            await server.stop()
+
+    metrics_response, other_response = asyncio.run(run())
+    assert metrics_response.startswith(b'HTTP/1.0 200 OK\r\n')
+    assert b'text/plain; version=0.0.4' in metrics_response
+    assert metrics_response.endswith(b'teleprompter_frames_total 1\n')
+    assert other_response.startswith(b'HTTP/1.0 404 Not Found\r\n')
+
+
+def test_busy_port_leaves_the_server_unset():
+    async def run():
+        blocker = await asyncio.start_server(lambda reader, writer: None, 'localhost', 0)
+        port = blocker.sockets[0].getsockname()[1]
+        server = MetricsServer(MetricsRegistry(), port=port)
+        try:
+            await server.start()
+            return server.server
+        finally:
+            await server.stop()
+            blocker.close()
+            await blocker.wait_closed()
+
+    assert asyncio.run(run()) is None
@@ -0,0 +1,71 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+pytest.importorskip('pyaudio')  # Imported through config
+
+import multi_source_capture  # noqa: E402
+from config import Config  # noqa: E402
+from multi_source_capture import MultiSourceCapture  # noqa: E402
+
+RATE = 16000
+CHUNK = 320
+
+
+class FakeSource:
+    # Yields chunks filled with the chunk number, stamped with start + chunk number * step seconds
+    def __init__(self, config, device_name=None, remember_device=False, record=False):
+        self.format, self.rate, self.bytes_per_sample = None, RATE, 2
+        self.frame_duration_ms, self.chunk = 20, CHUNK
+        self.start, self.step, self.count = device_name
+        self.read = 0
+
+    async def read_frame(self):
+        if self.read == self.count:
+            return None, b''
+        self.read += 1
+        frame_time = self.start + (self.read - 1) * self.step
+        return frame_time, np.full(CHUNK, self.read, dtype=np.int16).tobytes()
+
+
+def capture(monkeypatch, *clocks):
+    monkeypatch.setattr(multi_source_capture, 'AudioCapture', FakeSource)
+    config = Config()
+    config.capture_sources = [{'device': clock} for clock in clocks]
+    config.recording_enabled = False
+    return MultiSourceCapture(config)
+
+
+def read_all(capture, limit=20):
+    async def read():
+        frames = []
+        for _ in range(limit):
+            if not await capture.read_audio():
+                break
+            frames.append(capture.last_frames[:, 0].tolist())
+        return frames
+    return asyncio.run(read())
+
+
+def test_sources_on_a_shared_clock_are_aligned_by_timestamp(monkeypatch):
+    # The second source started one chunk later, so its first chunk lines up with the first one's second
+    frames = read_all(capture(monkeypatch, (100.0, 0.02, 5), (100.02, 0.02, 4)))
+    assert frames == [[2, 1], [3, 2], [4, 3], [5, 4]]
+
+
+def test_sources_on_separate_clocks_are_aligned_by_sample_count(monkeypatch):
+    frames = read_all(capture(monkeypatch, (5000.0, 0.02, 4), (3.0, 0.02, 4)))
+    assert frames == [[1, 1], [2, 2], [3, 3], [4, 4]]
+
+
+def test_a_source_whose_clock_goes_back_does_not_stall_the_others(monkeypatch):
+    # Every chunk of the second source is stamped with the same time
+    frames = read_all(capture(monkeypatch, (10.0, 0.02, 60), (10.0, 0.0, 60)), limit=40)
+    assert len(frames) == 40
+    assert [frame[0] for frame in frames] == list(range(1, 41))
+
+
+def test_a_clock_jump_ahead_is_not_padded(monkeypatch):
+    frames = read_all(capture(monkeypatch, (10.0, 0.02, 4), (10.0, 3600.0, 4)))
+    assert frames == [[1, 1], [2, 2], [3, 3], [4, 4]]
@@ -0,0 +1,138 @@
+import asyncio
+import io
+import json
+import struct
+import time
+import wave
+
+import pytest
+import websockets.exceptions
+
+pytest.importorskip('pyaudio')  # Imported through config
+
+import offline_processor  # noqa: E402
+from config import Config  # noqa: E402
+from offline_processor import OfflineProcessor, find_pcm_data, merge_segments, mono_view  # noqa: E402
+
+
+def wav_bytes(samples, channels=1, rate=16000):
+    out = io.BytesIO()
+    with wave.open(out, 'wb') as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(struct.pack(f'<{len(samples)}h', *samples))
+    return out.getvalue()
+
+
+def chunk(chunk_id, body):
+    return chunk_id + struct.pack('<I', len(body)) + body + (b'\x00' if len(body) & 1 else b'')
+
+
+def riff(*chunks):
+    body = b'WAVE' + b''.join(chunks)
+    return b'RIFF' + struct.pack('<I', len(body)) + body
+
+
+FMT_16K_MONO = struct.pack('<HHIIHH', 1, 1, 16000, 32000, 2, 16)
+
+
+def test_finds_the_data_chunk_of_a_plain_wav():
+    data = wav_bytes([1, 2, 3, 4], channels=2)
+    offset, size, channels, rate = find_pcm_data(data)
+    assert (size, channels, rate) == (8, 2, 16000)
+    assert list(mono_view(data, offset, size, channels)) == [1, 3]
+
+
+def test_skips_other_chunks_including_odd_sized_ones():
+    pcm = struct.pack('<3h', 7, 8, 9)
+    data = riff(chunk(b'fmt ', FMT_16K_MONO), chunk(b'LIST', b'abc'), chunk(b'data', pcm))
+    offset, size, channels, rate = find_pcm_data(data)
+    assert data[offset:offset + size] == pcm
+    assert (channels, rate) == (1, 16000)
+
+
+def test_zero_or_oversized_data_length_is_taken_from_the_file():
+    pcm = struct.pack('<4h', 1, 2, 3, 4)
+    for declared in (0, 1 << 30):
+        data = riff(chunk(b'fmt ', FMT_16K_MONO), b'data' + struct.pack('<I', declared) + pcm)
+        assert find_pcm_data(data)[1] == len(pcm)
+
+
+@pytest.mark.parametrize('data', [
+    b'RIFX' + b'\x00' * 40,
+    riff(chunk(b'fmt ', FMT_16K_MONO)),  # No data chunk
+    riff(chunk(b'data', b'\x00\x00'), chunk(b'fmt ', FMT_16K_MONO)),  # data before fmt
+    riff(chunk(b'fmt ', struct.pack('<HHIIHH', 3, 1, 16000, 64000, 4, 32)), chunk(b'data', b'\x00' * 4)),
+])
+def test_rejects_files_it_cannot_read(data):
+    with pytest.raises(ValueError):
+        find_pcm_data(data)
+
+
+def test_merge_joins_close_segments_across_block_boundaries():
+    assert merge_segments([(100, 200), (0, 50), (210, 300)], merge_gap=20, min_frames=0,
+                          max_frames=1000) == [(0, 50), (100, 300)]
+
+
+def test_merge_drops_short_segments_and_splits_long_ones():
+    assert merge_segments([(0, 5), (100, 350)], merge_gap=0, min_frames=10,
+                          max_frames=100) == [(100, 200), (200, 300), (300, 350)]
+
+
+class FakeClient:
+    # Segment n is (n + 1) * 100 ms long. Segment 1 loses its connection, segment 2 cannot be sent.
+    segment_bytes = None
+
+    def __init__(self, config, manual_turns=None):
+        self.last_reset_time = time.time()
+        self.last_send_event_ids = set()
+        self.events = asyncio.Queue()
+        self.websocket = self
+
+    async def ping(self):
+        pong = asyncio.get_running_loop().create_future()
+        pong.set_result(None)
+        return pong
+
+    def register_event_consumer(self, *event_types):
+        pass
+
+    def is_connected(self):
+        return True
+
+    async def connect(self):
+        pass
+
+    async def close_connection(self):
+        pass
+
+    async def send_audio(self, pcm, create_response=False, response=None):
+        segment = round(len(pcm) / self.segment_bytes) - 1
+        if segment == 1:
+            raise websockets.exceptions.ConnectionClosed(None, None)
+        if segment == 2:
+            return None
+        request = response['metadata']['request']
+        for event in ({'type': 'response.created', 'response': {'id': 'r', 'metadata': {'request': request}}},
+                      {'type': 'response.text.delta', 'response_id': 'r', 'delta': str(segment)},
+                      {'type': 'response.done', 'response': {'id': 'r', 'status': 'completed'}}):
+            self.events.put_nowait(event)
+        return 'commit'
+
+    async def receive_response(self):
+        return await self.events.get()
+
+    async def delete_commit(self, commit_event_id):
+        pass
+
+
+def test_failed_segments_do_not_abort_the_others(tmp_path, monkeypatch):
+    monkeypatch.setattr(offline_processor, 'OpenAIClient', FakeClient)
+    path = tmp_path / 'in.wav'
+    path.write_bytes(wav_bytes([0] * 16000 * 4))
+    processor = OfflineProcessor(Config(), str(path), str(tmp_path / 'out.jsonl'), connections=2, processes=1)
+    FakeClient.segment_bytes = processor.api_rate * 2 // 10
+    asyncio.run(processor.dispatch([(0, 1600 * n) for n in (1, 2, 3, 4)]))
+    lines = [json.loads(line) for line in (tmp_path / 'out.jsonl').read_text().splitlines()]
+    assert sorted((line['segment'], line['response']) for line in lines) == [(0, '0'), (3, '3')]
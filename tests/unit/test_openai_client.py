@@ -0,0 +1,100 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from openai_client import OpenAIClient
+from outbound_queue import OutboundQueue
+
+AUDIO = b'\x00\x00' * 24000 * 3  # 3 s at 24 kHz, sent as three appends
+
+
+def make_client():
+    config = SimpleNamespace(
+        api_key='test', api_url='wss://example.invalid', forward_unparsed_events=False,
+        audio_append_chunk_bytes=48000, input_audio_format='pcm16', control_wait_warning_ms=50,
+        speculative_mode=True, outbound_queue_max_depth=512, outbound_queue_max_bytes=8 * 1024 * 1024,
+        context_token_budget=None, context_prune_mode='delete', context_keep_recent_items=4,
+        context_summary_max_chars=2000, audio_tokens_per_second=10)
+    client = OpenAIClient(config)
+    client.outbound_queue = OutboundQueue()
+    return client
+
+
+async def take(client, count):
+    return [json.loads((await client.outbound_queue.get())[0])['type'] for _ in range(count)]
+
+
+async def drain(client):
+    return await take(client, client.outbound_queue.depth)
+
+
+async def speculate_and_withdraw(written):
+    # Sends a speculative request, lets the writer take `written` events, then withdraws the request
+    client = make_client()
+    commit_id = await client.send_audio(AUDIO, create_response=True)
+    sent = await take(client, written)
+    await client.withdraw_send(set(client.last_send_event_ids), commit_id, client.last_response_event_id)
+    return sent, await drain(client), client
+
+
+def test_nothing_written_withdraws_everything_without_a_cancel():
+    sent, rest, client = asyncio.run(speculate_and_withdraw(0))
+    assert (sent, rest) == ([], [])
+    assert not client.pending_commits
+
+
+def test_partly_written_audio_is_cleared_instead_of_cancelled():
+    sent, rest, _ = asyncio.run(speculate_and_withdraw(1))
+    assert sent == ['input_audio_buffer.append']
+    assert rest == ['input_audio_buffer.clear']
+
+
+def test_commit_written_but_no_response_requested_needs_no_cancel():
+    sent, rest, client = asyncio.run(speculate_and_withdraw(4))
+    assert sent[-1] == 'input_audio_buffer.commit'
+    assert rest == []
+    assert len(client.pending_commits) == 1  # Its item is deleted once the commit is acknowledged
+
+
+def test_response_already_requested_is_cancelled():
+    sent, rest, _ = asyncio.run(speculate_and_withdraw(5))
+    assert sent[-1] == 'response.create'
+    assert rest == ['response.cancel']
+
+
+class SlowSocket:
+    closed = False
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.types = []
+
+    async def send(self, message):
+        await asyncio.sleep(self.delay)
+        self.types.append(json.loads(message)['type'])
+
+
+@pytest.mark.parametrize('cancel_after', [0.0, 0.06, 0.3])
+def test_cancel_never_overtakes_its_request_on_a_slow_uplink(cancel_after):
+    async def run():
+        client = make_client()
+        client.outbound_queue = None
+        client.websocket = SlowSocket(delay=0.04)
+        client.start_writer()
+        commit_id = await client.send_audio(AUDIO, create_response=True)
+        await asyncio.sleep(cancel_after)
+        await client.withdraw_send(set(client.last_send_event_ids), commit_id, client.last_response_event_id)
+        while client.outbound_queue.depth:
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.1)
+        client.writer_task.cancel()
+        return client.websocket.types
+
+    types = asyncio.run(run())
+    if 'response.cancel' in types:
+        assert types.index('response.create') < types.index('response.cancel')
+    else:
+        assert 'response.create' not in types
+    assert types.count('input_audio_buffer.append') in (0, 3) or 'input_audio_buffer.clear' in types
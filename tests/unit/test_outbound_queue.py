@@ -0,0 +1,99 @@
+import asyncio
+
+import pytest
+
+from outbound_queue import BULK, CONTROL, OutboundQueue, priority_for
+
+
+def test_priority_for_event_types():
+    assert priority_for('response.cancel') == CONTROL
+    assert priority_for('session.update') == CONTROL
+    # Must stay behind the appends they refer to
+    assert priority_for('input_audio_buffer.commit') == BULK
+    assert priority_for('response.create') == BULK
+
+
+def test_control_is_written_before_queued_bulk():
+    async def run():
+        queue = OutboundQueue()
+        await queue.put('append-1', BULK)
+        await queue.put('append-2', BULK)
+        await queue.put('cancel', CONTROL)
+        return [(await queue.get())[:2] for _ in range(3)]
+
+    assert asyncio.run(run()) == [('cancel', CONTROL), ('append-1', BULK), ('append-2', BULK)]
+
+
+def test_bulk_put_waits_for_room_but_control_does_not():
+    async def run():
+        queue = OutboundQueue(max_depth=2)
+        await queue.put('a', BULK)
+        await queue.put('b', BULK)
+        blocked = asyncio.create_task(queue.put('c', BULK))
+        await asyncio.sleep(0.01)
+        assert not blocked.done()
+
+        await asyncio.wait_for(queue.put('cancel', CONTROL), timeout=1)
+        assert queue.depth == 3
+
+        assert (await queue.get())[0] == 'cancel'
+        assert (await queue.get())[0] == 'a'
+        await asyncio.wait_for(blocked, timeout=1)
+        assert [(await queue.get())[0] for _ in range(2)] == ['b', 'c']
+
+    asyncio.run(run())
+
+
+def test_byte_bound_admits_one_oversized_message_into_an_empty_queue():
+    async def run():
+        queue = OutboundQueue(max_bytes=10)
+        await asyncio.wait_for(queue.put('x' * 50, BULK), timeout=1)
+        assert queue.queued_bytes == 50
+        blocked = asyncio.create_task(queue.put('y', BULK))
+        await asyncio.sleep(0.01)
+        assert not blocked.done()
+        await queue.get()
+        await asyncio.wait_for(blocked, timeout=1)
+        assert queue.queued_bytes == 1
+
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize('priority', [BULK, CONTROL])
+def test_clear_drops_one_class_and_its_bytes(priority):
+    async def run():
+        queue = OutboundQueue()
+        await queue.put('bulk', BULK)
+        await queue.put('ctl', CONTROL)
+        dropped = await queue.clear(priority)
+        return dropped, queue.depth, queue.queued_bytes
+
+    kept = 'ctl' if priority == BULK else 'bulk'
+    assert asyncio.run(run()) == (1, 1, len(kept))
+
+
+def test_stats_report_waits_per_class():
+    async def run():
+        queue = OutboundQueue()
+        await queue.put('a', BULK)
+        await queue.get()
+        return queue.stats()
+
+    stats = asyncio.run(run())
+    assert stats['depth'] == 0 and stats['bytes'] == 0
+    assert stats['wait_ms']['bulk']['count'] == 1
+    assert stats['wait_ms']['control']['count'] == 0
+
+
+def test_remove_withdraws_queued_events_by_id():
+    async def run():
+        queue = OutboundQueue()
+        await queue.put('append', BULK, event_id='event_1')
+        await queue.put('commit', BULK, event_id='event_2')
+        await queue.put('other', BULK, event_id='event_3')
+        await queue.put('untracked', BULK)
+        await queue.get()  # event_1 has been written
+        removed = await queue.remove({'event_1', 'event_2'})
+        return removed, [(await queue.get())[0] for _ in range(queue.depth)], queue.queued_bytes
+
+    assert asyncio.run(run()) == ({'event_2'}, ['other', 'untracked'], 0)
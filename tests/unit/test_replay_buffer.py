@@ -0,0 +1,63 @@
+import json
+
+from replay_buffer import ReplayBuffer
+
+
+def append_message(buffer, text, size=10):
+    return buffer.append(lambda: json.dumps({'type': 'transcript', 'delta': text}),
+                         lambda seq: b'%d:%s' % (seq, text.encode()), size)
+
+
+def test_sequence_numbers_increase_and_are_embedded_in_json():
+    buffer = ReplayBuffer(max_events=10, max_bytes=1000)
+    first = append_message(buffer, 'a')
+    second = append_message(buffer, 'b')
+    assert (first.seq, second.seq) == (1, 2)
+    assert json.loads(second.json_message()) == {'seq': 2, 'type': 'transcript', 'delta': 'b'}
+    assert second.binary_message() == b'2:b'
+
+
+def test_entry_without_binary_form_falls_back_to_json():
+    buffer = ReplayBuffer(max_events=10, max_bytes=1000)
+    entry = buffer.append(lambda: '{"type": "status"}', None, 5)
+    assert entry.binary_message() == entry.json_message() == '{"seq": 1, "type": "status"}'
+
+
+def test_evicts_oldest_beyond_max_events():
+    buffer = ReplayBuffer(max_events=3, max_bytes=1000)
+    for text in 'abcde':
+        append_message(buffer, text)
+    assert [entry.seq for entry in buffer.entries] == [3, 4, 5]
+    assert buffer.stats() == {'events': 3, 'bytes': 30, 'oldest_seq': 3, 'latest_seq': 5}
+
+
+def test_evicts_oldest_beyond_max_bytes_but_keeps_the_newest():
+    buffer = ReplayBuffer(max_events=100, max_bytes=25)
+    for text in 'abc':
+        append_message(buffer, text)
+    assert [entry.seq for entry in buffer.entries] == [2, 3]
+    append_message(buffer, 'huge', size=500)
+    assert [entry.seq for entry in buffer.entries] == [4]
+
+
+def test_since_replays_the_missed_entries():
+    buffer = ReplayBuffer(max_events=10, max_bytes=1000)
+    for text in 'abcd':
+        append_message(buffer, text)
+    assert [entry.seq for entry in buffer.since(2)] == [3, 4]
+    assert buffer.since(4) == []
+
+
+def test_since_needs_a_snapshot_after_eviction_or_restart():
+    buffer = ReplayBuffer(max_events=2, max_bytes=1000)
+    for text in 'abcd':
+        append_message(buffer, text)
+    assert [entry.seq for entry in buffer.since(2)] == [3, 4]  # Nothing missing yet
+    assert buffer.since(1) is None  # Entry 2 was evicted
+    assert buffer.since(9) is None  # From before a restart
+
+
+def test_since_on_an_empty_buffer():
+    buffer = ReplayBuffer(max_events=2, max_bytes=1000)
+    assert buffer.since(0) == []
+    assert buffer.since(3) is None
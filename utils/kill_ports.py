@@ -25,8 +25,9 @@ def kill_process_on_port(port):
         print(f"Error occurred while killing the process on port {port}: {e}")
 
 async def main():
-    # Kill any process running on port 8000 and 3000 before starting the server
+    # Kill any process running on port 8000 (WebSocket), 8001 (metrics) and 3000 before starting the server
     kill_process_on_port(8000)
+    kill_process_on_port(8001)
     kill_process_on_port(3000)
 
     # Uncomment the following lines to start the WebSocket server